@@ -0,0 +1,130 @@
+import os
+from typing import List
+
+import numpy as np
+import pyarrow as pa
+
+from canary_tester.interner import HOST_CODES
+from canary_tester.tester.group_store import GroupStore
+
+# The raw samples of both groups, the group and the host are dictionary encoded.
+GROUP_SCHEMA = pa.schema(
+    [
+        ("group", pa.dictionary(pa.int8(), pa.string())),
+        ("ts", pa.int64()),
+        ("host", pa.dictionary(pa.int32(), pa.string())),
+        ("value", pa.float64()),
+    ]
+)
+
+# One row per analyzed peek, the columns of the results csv and whether the
+# statistics of an earlier peek were reused.
+PEEK_SCHEMA = pa.schema(
+    [
+        ("peek", pa.int32()),
+        ("timestamp", pa.float64()),
+        ("total_seconds_passed", pa.float64()),
+        ("control_sample_size", pa.int64()),
+        ("treatment_sample_size", pa.int64()),
+        ("mean_a", pa.float64()),
+        ("mean_b", pa.float64()),
+        ("effect_size_ci_low", pa.float64()),
+        ("effect_size_ci_high", pa.float64()),
+        ("effect_size_threshold", pa.float64()),
+        ("p_value_h0", pa.float64()),
+        ("p_value_h1", pa.float64()),
+        ("alpha", pa.float64()),
+        ("reason", pa.string()),
+        ("skipped", pa.bool_()),
+    ]
+)
+
+# The final decision of a test, empty while the test is running.
+DECISION_SCHEMA = pa.schema(
+    [
+        ("name", pa.string()),
+        ("type", pa.string()),
+        ("reason", pa.string()),
+        ("peek", pa.int32()),
+    ]
+)
+
+_GROUPS = pa.array(["treatment", "control"])
+
+
+class ArrowExport:
+    """
+    Exposes the data of a tester as Arrow record batches and writes them as Arrow
+    IPC files, one directory per test:
+    - `groups.arrow`: the samples of the groups, see GROUP_SCHEMA
+    - `peeks.arrow`: the statistics of every analyzed peek, see PEEK_SCHEMA
+    - `decision.arrow`: the decision of the test, see DECISION_SCHEMA
+
+    The files are replaced atomically, so a notebook can map the files of a running
+    experiment with `ArrowExport.read` at any time. The values of an archived group
+    are handed to Arrow without a copy.
+    """
+
+    def group_batches(stores: List[GroupStore]) -> List[pa.RecordBatch]:
+        """
+        Returns the samples of the stores, the treatment group first and the control
+        group second. Stores that only keep a sketch have no batch.
+        """
+        # The host codes of the stores are known after the columns are built, the
+        # batches of a file then share the dictionary of all host names.
+        columns = [(group, store.columns()) for group, store in enumerate(stores)]
+        hosts = pa.array(
+            [HOST_CODES.value(c) for c in range(len(HOST_CODES))], type=pa.string()
+        )
+
+        batches = []
+        for group, group_columns in columns:
+            if group_columns is None:
+                continue
+            ts, host_codes, values = group_columns
+            batches.append(
+                pa.record_batch(
+                    [
+                        pa.DictionaryArray.from_arrays(
+                            pa.array(np.full(len(ts), group, dtype=np.int8)), _GROUPS
+                        ),
+                        pa.array(ts, type=pa.int64()),
+                        pa.DictionaryArray.from_arrays(
+                            pa.array(host_codes, type=pa.int32()), hosts
+                        ),
+                        pa.array(values, type=pa.float64()),
+                    ],
+                    schema=GROUP_SCHEMA,
+                )
+            )
+        return batches
+
+    def peek_batch(peeks: List[dict]) -> pa.RecordBatch:
+        return pa.RecordBatch.from_pylist(peeks, schema=PEEK_SCHEMA)
+
+    def decision_batch(decisions: List[dict]) -> pa.RecordBatch:
+        return pa.RecordBatch.from_pylist(decisions, schema=DECISION_SCHEMA)
+
+    def write(path: str, schema: pa.Schema, batches: List[pa.RecordBatch]) -> None:
+        """Writes the batches as Arrow IPC file and replaces `path` atomically."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+        os.replace(tmp, path)
+
+    def read(directory: str, name: str, table: str) -> pa.Table:
+        """
+        Maps a table of an exported test into memory without copying it.
+
+        Parameters:
+        directory: str
+            The directory of the export, ARROW_EXPORT_PATH.
+        name: str
+            The name of the test.
+        table: str
+            "groups", "peeks" or "decision".
+        """
+        source = pa.memory_map(os.path.join(directory, name, f"{table}.arrow"))
+        return pa.ipc.open_file(source).read_all()
@@ -0,0 +1,142 @@
+import gzip
+import logging
+import os
+import pickle
+from typing import Any, Dict, List, Optional
+
+from canary_tester.enricher_snapshot_store import StoredHistory
+
+logger = logging.getLogger("root")
+
+_FORMAT_VERSION = 3
+_CHECKPOINT = "checkpoint.pkl.gz"
+
+
+class ExperimentCheckpoint:
+    """
+    The state of a running experiment after a tick: how it was started, until when
+    its ticks ran, the state of every tester, the history of the enricher and the
+    state of the random number generator (used to balance the alert groups). The
+    tables of the interners are part of it, since the groups and the archives keep
+    version and host codes.
+
+    Parameters:
+    previous_timestamp: float
+        The end of the window of the last processed tick, the resumed experiment
+        continues from here.
+    finished_tests: List[str]
+        The names of the tests that already made their decision.
+    tester_states: Dict[str, dict]
+        The `Tester.checkpoint_state()` of every test by name.
+    version_codes: List[str]
+        The `VERSION_CODES.values()` of the experiment.
+    host_codes: List[str]
+        The `HOST_CODES.values()` of the experiment.
+    experiment_id: Optional[int]
+        The id of the experiment in the experiment store, if there is one.
+    """
+
+    version_under_test: str
+    max_time_s: int
+    fetch_interval_s: int
+    start_time: Optional[int]
+    control_group_versions: List[str]
+    simulation_speedup_factor: int
+    catch_up: bool
+    initial_timestamp: float
+    previous_timestamp: float
+    finished_tests: List[str]
+    tester_states: Dict[str, dict]
+    enricher_history: StoredHistory
+    random_state: Any
+    version_codes: List[str]
+    host_codes: List[str]
+    experiment_id: Optional[int]
+
+    def __init__(
+        self,
+        version_under_test: str,
+        max_time_s: int,
+        fetch_interval_s: int,
+        start_time: Optional[int],
+        control_group_versions: List[str],
+        simulation_speedup_factor: int,
+        catch_up: bool,
+        initial_timestamp: float,
+        previous_timestamp: float,
+        finished_tests: List[str],
+        tester_states: Dict[str, dict],
+        enricher_history: StoredHistory,
+        random_state: Any,
+        version_codes: List[str],
+        host_codes: List[str],
+        experiment_id: Optional[int] = None,
+    ):
+        self.version_under_test = version_under_test
+        self.max_time_s = max_time_s
+        self.fetch_interval_s = fetch_interval_s
+        self.start_time = start_time
+        self.control_group_versions = control_group_versions
+        self.simulation_speedup_factor = simulation_speedup_factor
+        self.catch_up = catch_up
+        self.initial_timestamp = initial_timestamp
+        self.previous_timestamp = previous_timestamp
+        self.finished_tests = finished_tests
+        self.tester_states = tester_states
+        self.enricher_history = enricher_history
+        self.random_state = random_state
+        self.version_codes = version_codes
+        self.host_codes = host_codes
+        self.experiment_id = experiment_id
+
+
+class CheckpointStore:
+    """
+    Keeps the latest checkpoint of the experiment as a gzipped pickle. It is
+    written to a temporary file first and renamed afterwards, a crash while saving
+    leaves the previous checkpoint intact. Checkpoints of another format version
+    are ignored.
+
+    Parameters:
+    path: str
+        The directory of the checkpoint.
+    """
+
+    _path: str
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def save(self, checkpoint: ExperimentCheckpoint) -> None:
+        os.makedirs(self._path, exist_ok=True)
+        tmp = os.path.join(self._path, f"{_CHECKPOINT}.{os.getpid()}.tmp")
+        # The checkpoint is written every tick, the fastest level compresses the
+        # repeated metric objects well enough.
+        with gzip.open(tmp, "wb", compresslevel=1) as f:
+            pickle.dump(
+                (_FORMAT_VERSION, checkpoint), f, protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(tmp, os.path.join(self._path, _CHECKPOINT))
+
+    def load(self) -> Optional[ExperimentCheckpoint]:
+        """
+        Returns the latest checkpoint, None if there is none or it can't be read.
+        """
+        try:
+            with gzip.open(os.path.join(self._path, _CHECKPOINT), "rb") as f:
+                format_version, checkpoint = pickle.load(f)
+        except (
+            OSError,
+            EOFError,
+            ValueError,
+            AttributeError,
+            ImportError,
+            pickle.UnpicklingError,
+        ) as e:
+            logger.info(f"No checkpoint loaded: {e}")
+            return None
+
+        if format_version != _FORMAT_VERSION:
+            logger.info(f"Ignore checkpoint with format {format_version}")
+            return None
+        return checkpoint
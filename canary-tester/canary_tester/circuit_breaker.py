@@ -0,0 +1,134 @@
+import threading
+import time
+from enum import Enum
+from typing import Optional
+
+import requests
+
+from canary_tester.types import GlobalConfig
+
+_shared: Optional["CircuitBreaker"] = None
+_shared_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of sending a query while the querier is considered down.
+    """
+
+
+class CircuitState(Enum):
+    """
+    - Closed: queries are sent.
+    - Open: queries fail fast, until the reset time passed.
+    - HalfOpen: a single trial query is sent, its outcome closes or opens the circuit.
+    """
+
+    Closed = "Closed"
+    Open = "Open"
+    HalfOpen = "HalfOpen"
+
+
+class CircuitBreaker:
+    """
+    Fails the thanos queries of the process fast during a querier outage, instead of
+    letting every test wait for its timeout on every tick.
+
+    Parameters:
+    failure_threshold: int
+        Number of consecutive failed queries after which the circuit opens,
+        0 disables the circuit breaker.
+    reset_s: float
+        How long the circuit stays open before a trial query is sent.
+    """
+
+    _failure_threshold: int
+    _reset_s: float
+    _state: CircuitState
+    _failures: int
+    _opened_at: float
+    _lock: threading.Lock
+
+    def __init__(self, failure_threshold: int, reset_s: float):
+        self._failure_threshold = failure_threshold
+        self._reset_s = reset_s
+        self._state = CircuitState.Closed
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def shared(global_config: GlobalConfig) -> "CircuitBreaker":
+        """
+        Returns the circuit breaker of the process, it is created with the
+        thresholds of the first global config it is asked for.
+        """
+        global _shared
+        with _shared_lock:
+            if _shared is None:
+                _shared = CircuitBreaker(
+                    global_config.THANOS_BREAKER_FAILURES,
+                    global_config.THANOS_BREAKER_RESET_S,
+                )
+            return _shared
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def before_request(self) -> None:
+        """
+        Raises a CircuitOpenError if the query must not be sent.
+        """
+        if self._failure_threshold <= 0:
+            return
+
+        with self._lock:
+            if self._state == CircuitState.Closed:
+                return
+
+            if (
+                self._state == CircuitState.Open
+                and time.monotonic() - self._opened_at >= self._reset_s
+            ):
+                # This query is the trial, all others keep failing until it's done.
+                self._state = CircuitState.HalfOpen
+                return
+
+            raise CircuitOpenError(
+                f"thanos querier circuit is {self._state.value.lower()}, failing fast"
+            )
+
+    def record(self, success: bool) -> None:
+        """
+        Records the outcome of a sent query.
+        """
+        if self._failure_threshold <= 0:
+            return
+
+        with self._lock:
+            if success:
+                self._failures = 0
+                self._state = CircuitState.Closed
+                return
+
+            self._failures += 1
+            if (
+                self._state == CircuitState.HalfOpen
+                or self._failures >= self._failure_threshold
+            ):
+                self._state = CircuitState.Open
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """
+        Ends a sent query whose outcome wasn't recorded, i.e. it hit the deadline of
+        the tick or failed with an unexpected error. A trial query returns the
+        circuit to open, such that the next trial is sent after the reset time.
+        """
+        if self._failure_threshold <= 0:
+            return
+
+        with self._lock:
+            if self._state == CircuitState.HalfOpen:
+                self._state = CircuitState.Open
+                self._opened_at = time.monotonic()
@@ -1,19 +1,55 @@
-from typing import TypedDict
-from pydantic import BaseModel, Field
-from canary_tester.types import ComparisonDirection, TestArrivalType
+from typing import Literal, Optional, TypedDict
+from pydantic import BaseModel, field_validator
+from canary_tester.promql_template import QueryTemplate
+from canary_tester.types import (
+    AlphaSpending,
+    ComparisonDirection,
+    GroupStoreType,
+    PredictableFetchMode,
+    QueryAccuracy,
+    RetentionWindow,
+    TestArrivalType,
+    TestStatistictType,
+)
 
 
 class SingleTestConfig(BaseModel):
     """A class that represents the configuration of a single FrequencyTTestOneSided test"""
 
     name: str
-    query: str = Field(
-        pattern=r"(\w+) \((\w+(?:_\w+)*)\) by\((\w+(?:, \w+)*)\)|(\w+(?:_\w+)*)"
-    )
+    query: str
     significance_level: float
     minimal_effect_size_of_interest: float
     type_arrival: TestArrivalType
     direction: ComparisonDirection
+    fetch_mode: Optional[PredictableFetchMode] = None
+    window_aggregation: Optional[
+        Literal["avg", "min", "max", "sum", "count", "last", "stddev"]
+    ] = None
+    query_accuracy: Optional[QueryAccuracy] = None
+    host_sharding: Optional[bool] = None
+    alpha_spending: Optional[AlphaSpending] = None
+    alpha_spending_rho: Optional[float] = None
+    alpha_spending_max_samples: Optional[int] = None
+    statistic_test: Optional[TestStatistictType] = None
+    msprt_tau: Optional[float] = None
+    group_store: Optional[GroupStoreType] = None
+    histogram_bins: Optional[int] = None
+    histogram_min: Optional[float] = None
+    histogram_max: Optional[float] = None
+    histogram_edges: Optional[list[float]] = None
+    kll_k: Optional[int] = None
+    retention: Optional[RetentionWindow] = None
+    retention_seconds: Optional[float] = None
+    retention_samples: Optional[int] = None
+
+    @field_validator("query")
+    @classmethod
+    def query_must_be_supported(cls, query: str) -> str:
+        # The same parser is used to rewrite the query, so a query that passes
+        # the validation can always be rendered by the testers.
+        QueryTemplate.compile(query)
+        return query
 
 
 SingleTestConfigType = TypedDict(
@@ -25,6 +61,24 @@ SingleTestConfigType = TypedDict(
         "minimal_effect_size_of_interest": float,
         "type_arrival": TestArrivalType,
         "direction": ComparisonDirection,
+        "fetch_mode": PredictableFetchMode,
+        "window_aggregation": str,
+        "query_accuracy": QueryAccuracy,
+        "host_sharding": bool,
+        "alpha_spending": AlphaSpending,
+        "alpha_spending_rho": float,
+        "alpha_spending_max_samples": int,
+        "statistic_test": TestStatistictType,
+        "msprt_tau": float,
+        "group_store": GroupStoreType,
+        "histogram_bins": int,
+        "histogram_min": float,
+        "histogram_max": float,
+        "histogram_edges": list[float],
+        "kll_k": int,
+        "retention": RetentionWindow,
+        "retention_seconds": float,
+        "retention_samples": int,
     },
 )
 
@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger("root")
+
+_FORMAT_VERSION = 1
+_CURRENT = "CURRENT"
+
+
+class StoredHistory:
+    """
+    The host to version history as it was saved at `timestamp`, the entries of
+    every host are given as (ts, version) tuples in ascending order.
+    """
+
+    timestamp: float
+    host_to_versions: Dict[str, list[tuple[float, str]]]
+    last_seen: Dict[str, float]
+
+    def __init__(
+        self,
+        timestamp: float,
+        host_to_versions: Dict[str, list[tuple[float, str]]],
+        last_seen: Dict[str, float],
+    ):
+        self.timestamp = timestamp
+        self.host_to_versions = host_to_versions
+        self.last_seen = last_seen
+
+
+class EnricherSnapshotStore:
+    """
+    Saves the version history of the enricher to disk and loads it again, such that
+    a restarted process doesn't start with an empty history.
+
+    A snapshot is a directory with the host and version names in `meta.json` and the
+    entries as numpy arrays in CSR layout, which are loaded memory-mapped:
+    - `offsets.npy`: the entries of host i are [offsets[i], offsets[i + 1])
+    - `ts.npy`: the timestamp of every entry
+    - `versions.npy`: the index of the version name of every entry
+    - `last_seen.npy`: when every host was seen the last time
+
+    The snapshot is written into a new directory and `CURRENT` is replaced
+    atomically afterwards, a crash while saving leaves the previous snapshot intact.
+
+    Parameters:
+    path: str
+        The directory of the snapshots.
+    """
+
+    _path: str
+
+    def __init__(self, path: str):
+        self._path = path
+
+    def save(self, history: StoredHistory) -> None:
+        hosts = list(history.host_to_versions.keys())
+        versions = sorted(
+            {
+                version
+                for entries in history.host_to_versions.values()
+                for _, version in entries
+            }
+        )
+        version_codes = {version: code for code, version in enumerate(versions)}
+
+        offsets = np.zeros(len(hosts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(history.host_to_versions[h]) for h in hosts])
+        ts = np.fromiter(
+            (t for h in hosts for t, _ in history.host_to_versions[h]),
+            dtype=np.float64,
+            count=offsets[-1],
+        )
+        codes = np.fromiter(
+            (version_codes[v] for h in hosts for _, v in history.host_to_versions[h]),
+            dtype=np.int32,
+            count=offsets[-1],
+        )
+        last_seen = np.array(
+            [history.last_seen.get(h, history.timestamp) for h in hosts],
+            dtype=np.float64,
+        )
+
+        name = f"snapshot-{int(history.timestamp)}-{os.getpid()}"
+        directory = os.path.join(self._path, name)
+        os.makedirs(directory, exist_ok=True)
+
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "format_version": _FORMAT_VERSION,
+                    "timestamp": history.timestamp,
+                    "hosts": hosts,
+                    "versions": versions,
+                },
+                f,
+            )
+        np.save(os.path.join(directory, "offsets.npy"), offsets)
+        np.save(os.path.join(directory, "ts.npy"), ts)
+        np.save(os.path.join(directory, "versions.npy"), codes)
+        np.save(os.path.join(directory, "last_seen.npy"), last_seen)
+
+        tmp = os.path.join(self._path, f"{_CURRENT}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            f.write(name)
+        os.replace(tmp, os.path.join(self._path, _CURRENT))
+
+        self._remove_old_snapshots(name)
+
+    def load(self) -> Optional[StoredHistory]:
+        """
+        Returns the latest saved history, None if there is none or it can't be read.
+        """
+        try:
+            with open(os.path.join(self._path, _CURRENT)) as f:
+                directory = os.path.join(self._path, f.read().strip())
+
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+            if meta["format_version"] != _FORMAT_VERSION:
+                logger.info(
+                    f"Ignore enricher snapshot with format {meta['format_version']}"
+                )
+                return None
+
+            offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+            ts = np.load(os.path.join(directory, "ts.npy"), mmap_mode="r")
+            codes = np.load(os.path.join(directory, "versions.npy"), mmap_mode="r")
+            last_seen = np.load(os.path.join(directory, "last_seen.npy"), mmap_mode="r")
+        except (OSError, ValueError, KeyError) as e:
+            logger.info(f"No enricher snapshot loaded: {e}")
+            return None
+
+        versions = meta["versions"]
+        host_to_versions = {}
+        for i, host in enumerate(meta["hosts"]):
+            start, end = int(offsets[i]), int(offsets[i + 1])
+            host_to_versions[host] = [
+                (float(t), versions[c])
+                for t, c in zip(ts[start:end].tolist(), codes[start:end].tolist())
+            ]
+
+        return StoredHistory(
+            meta["timestamp"],
+            host_to_versions,
+            dict(zip(meta["hosts"], last_seen.tolist())),
+        )
+
+    def _remove_old_snapshots(self, current: str) -> None:
+        for name in os.listdir(self._path):
+            if name.startswith("snapshot-") and name != current:
+                shutil.rmtree(os.path.join(self._path, name), ignore_errors=True)
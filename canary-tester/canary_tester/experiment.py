@@ -1,9 +1,16 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextvars
 import datetime as dt
-from time import sleep
-from typing import List, Optional
+import pickle
+import queue
+import random
+import sqlite3
+import threading
+from time import monotonic, sleep
+from typing import Callable, List, Optional
 from dotenv import load_dotenv
 import logging
-from requests.exceptions import JSONDecodeError
+from requests.exceptions import JSONDecodeError, RequestException
 
 from canary_tester.types import (
     GlobalConfig,
@@ -12,11 +19,21 @@ from canary_tester.types import (
     TesterReturnReason,
     TesterReturnType,
 )
-from canary_tester.version_enricher import VersionEnricher
+from canary_tester.checkpoint_store import CheckpointStore, ExperimentCheckpoint
+from canary_tester.enricher_snapshot_store import EnricherSnapshotStore
+from canary_tester.experiment_store import ExperimentStore
+from canary_tester.interner import HOST_CODES, VERSION_CODES
+from canary_tester.metrics import (
+    TICK_ERRORS_TOTAL,
+    TICK_LAG_SECONDS,
+    TICK_STAGE_DURATION,
+)
+from canary_tester.version_enricher import VersionEnricher, VersionSnapshot
 from canary_tester.config_loader.config_loader import ConfigLoader
 from canary_tester.config_loader.schema import SingleTestConfigType
 from canary_tester.tester.test_builder import TestBuilder
 from canary_tester.tester.tester import Tester
+from canary_tester import tracing
 
 from canary_tester.helper import load_environment_variable
 
@@ -27,6 +44,37 @@ load_dotenv()
 logger = logging.getLogger("root")
 
 
+class FetchedTick:
+    """
+    The data the tests fetched for one tick, together with the enricher snapshot it
+    was fetched with and whether the tick is traced. The fetches might still be
+    running.
+    """
+
+    previous_timestamp: float
+    current_timestamp: float
+    total_seconds_passed: float
+    snapshot: VersionSnapshot
+    fetches: dict[Tester, Future]
+    sampled: bool
+
+    def __init__(
+        self,
+        previous_timestamp: float,
+        current_timestamp: float,
+        total_seconds_passed: float,
+        snapshot: VersionSnapshot,
+        fetches: dict[Tester, Future],
+        sampled: bool = False,
+    ):
+        self.previous_timestamp = previous_timestamp
+        self.current_timestamp = current_timestamp
+        self.total_seconds_passed = total_seconds_passed
+        self.snapshot = snapshot
+        self.fetches = fetches
+        self.sampled = sampled
+
+
 def run_tests_until_complete(
     enricher: VersionEnricher,
     tests: List[Tester],
@@ -36,29 +84,111 @@ def run_tests_until_complete(
     initial_timestamp: int,
     control_group_versions: List[str],
     simulation_speedup_factor: int,
+    catch_up: bool = False,
+    pipeline_depth: int = 0,
+    resume_timestamp: Optional[float] = None,
+    finished_tests: Optional[list[Tester]] = None,
+    on_tick: Optional[Callable[[float, list[Tester]], None]] = None,
 ):
     """
     Takes all tests and runs them until all tests are completed.
-    But before we run the test we update the enricher with the current timestamp.
-    such that we can map the correct version to the metric.
+    After every tick the enricher is asked to update to the timestamp of the next
+    tick, such that we can map the correct version to the metric. The update runs
+    in the background while the loop sleeps, the tests use the latest snapshot of
+    the enricher and don't wait for it.
+
+    With `catch_up` the experiment started in the past and should continue live.
+    The data from the initial timestamp until now is prefetched in bulk and the
+    ticks in this window run without waiting, afterwards the tests run live.
+
+    With a `pipeline_depth` bigger than 0 the tests fetch the data of a tick
+    concurrently and the processing of a test starts as soon as its data is there.
+    While catching up, the data of up to `pipeline_depth` ticks is fetched ahead
+    while the current tick is processed.
+
+    A resumed experiment continues after `resume_timestamp` with the
+    `finished_tests` of the checkpoint, with `catch_up` only the windows since then
+    are fetched. `on_tick` is called with the end of the window and the finished
+    tests after every processed tick, i.e. to save a checkpoint.
     """
 
-    previous_timestamp = initial_timestamp
-    start_time = dt.datetime.now()
+    previous_timestamp = (
+        resume_timestamp if resume_timestamp is not None else initial_timestamp
+    )
     experiment_start_time = dt.datetime.fromtimestamp(initial_timestamp)
-    test_run_delta = dt.timedelta(seconds=0)
 
-    finished_tests: list[str] = []
+    if finished_tests is None:
+        finished_tests = []
+
+    executor = (
+        ThreadPoolExecutor(
+            max_workers=max(len(tests), 1) * pipeline_depth,
+            thread_name_prefix="fetch",
+        )
+        if pipeline_depth > 0
+        else None
+    )
+
+    try:
+        if catch_up:
+            previous_timestamp = _catch_up(
+                enricher,
+                tests,
+                finished_tests,
+                fetch_interval_s,
+                thread,
+                initial_timestamp,
+                executor,
+                pipeline_depth,
+                from_timestamp=previous_timestamp,
+                on_tick=on_tick,
+            )
+            if previous_timestamp is None:
+                return
+            simulation_speedup_factor = 1
+
+        # From here on the enricher updates in the background, the tests use the
+        # latest published snapshot.
+        enricher.start_refresher()
+        try:
+            _run_live(
+                enricher,
+                tests,
+                finished_tests,
+                fetch_interval_s,
+                thread,
+                previous_timestamp,
+                experiment_start_time,
+                simulation_speedup_factor,
+                executor,
+                on_tick,
+            )
+        finally:
+            enricher.stop_refresher()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_live(
+    enricher: VersionEnricher,
+    tests: List[Tester],
+    finished_tests: list[Tester],
+    fetch_interval_s: int,
+    thread: RunningThread,
+    previous_timestamp: float,
+    experiment_start_time: dt.datetime,
+    simulation_speedup_factor: int,
+    executor: Optional[ThreadPoolExecutor],
+    on_tick: Optional[Callable[[float, list[Tester]], None]] = None,
+):
+    start_time = dt.datetime.now()
+    test_run_delta = dt.timedelta(seconds=0)
 
     while True:
 
-        with thread.lock:
-            if thread.should_stop:
-                thread.finished = False
-                thread.started = False
-                thread.should_stop = False
-                logger.info("stopping the experiment!")
-                break
+        if _should_stop(thread):
+            break
 
         time_now = dt.datetime.now()
 
@@ -91,19 +221,256 @@ def run_tests_until_complete(
         })
 
         test_start_time = dt.datetime.now()
+        tick_start = monotonic()
+
+        tick_budget_s = fetch_interval_s / simulation_speedup_factor
+        with tracing.tick(tracing.sample()):
+            fetched_tick = _fetch_tick(
+                tests,
+                finished_tests,
+                previous_timestamp,
+                current_timestamp,
+                (current_time - experiment_start_time).total_seconds(),
+                enricher.snapshot,
+                tick_budget_s,
+                executor,
+            )
+        _process_tick(tests, finished_tests, fetched_tick)
 
-        # ------- Test execution -------
-        enricher.update(current_timestamp)
+        # The refresher runs ahead: it fetches the versions of the next tick while
+        # we sleep, such that the tick never waits for the fleet version query.
+        # Versions after now don't exist yet.
+        enricher.request_update(
+            min(current_timestamp + fetch_interval_s, dt.datetime.now().timestamp())
+        )
 
-        for test in tests:
+        previous_timestamp = current_timestamp
+        if on_tick is not None:
+            on_tick(previous_timestamp, finished_tests)
+
+        _observe_tick(monotonic() - tick_start, tick_budget_s)
+
+        # set time needed for test execution
+        test_run_delta = dt.datetime.now() - test_start_time
+
+        sleep(fetch_interval_s / simulation_speedup_factor)
+
+
+def _catch_up(
+    enricher: VersionEnricher,
+    tests: List[Tester],
+    finished_tests: list[Tester],
+    fetch_interval_s: int,
+    thread: RunningThread,
+    initial_timestamp: int,
+    executor: Optional[ThreadPoolExecutor],
+    pipeline_depth: int,
+    from_timestamp: Optional[float] = None,
+    on_tick: Optional[Callable[[float, list[Tester]], None]] = None,
+) -> Optional[float]:
+    """
+    Prefetches the data from the initial timestamp, or `from_timestamp` if the
+    experiment got resumed, until now and runs the ticks in this window back to
+    back. Returns the timestamp where the live ticks continue or None if the
+    experiment got stopped.
+
+    The enricher updates and the fetches run in a producer thread up to
+    `pipeline_depth` ticks ahead of the processing, such that the wall time of the
+    catch up approaches max(fetch time, processing time).
+    """
+    if from_timestamp is None:
+        from_timestamp = initial_timestamp
+    ticks = int((dt.datetime.now().timestamp() - from_timestamp) // fetch_interval_s)
+    catch_up_timestamp = from_timestamp + ticks * fetch_interval_s
+
+    logger.info({
+        "catch_up_from": dt.datetime.fromtimestamp(from_timestamp).isoformat(),
+        "catch_up_to": dt.datetime.fromtimestamp(catch_up_timestamp).isoformat(),
+        "ticks": ticks,
+        "pipeline_depth": pipeline_depth,
+    })
+
+    for test in tests:
+        try:
+            test.prefetch(from_timestamp, catch_up_timestamp, fetch_interval_s)
+        except Exception as e:
+            # The ticks will fetch the data on their own
+            logger.error(f"Prefetch of {test.name} failed: {e}")
+
+    def fetch(tick: int) -> FetchedTick:
+        previous_timestamp = from_timestamp + (tick - 1) * fetch_interval_s
+        current_timestamp = from_timestamp + tick * fetch_interval_s
+        with tracing.tick(tracing.sample()):
+            # The enricher is updated tick by tick, every tick keeps its own snapshot.
+            enricher.update(current_timestamp)
+            return _fetch_tick(
+                tests,
+                finished_tests,
+                previous_timestamp,
+                current_timestamp,
+                current_timestamp - initial_timestamp,
+                enricher.snapshot,
+                fetch_interval_s,
+                executor,
+            )
+
+    fetched_ticks: queue.Queue = queue.Queue(maxsize=max(pipeline_depth, 1))
+    stop = threading.Event()
+
+    def produce():
+        for tick in range(1, ticks + 1):
+            try:
+                item = fetch(tick)
+            except Exception as e:
+                item = e
+            if not _put_until_stopped(fetched_ticks, item, stop) or isinstance(
+                item, Exception
+            ):
+                return
+
+    if pipeline_depth > 0:
+        producer = threading.Thread(target=produce, daemon=True, name="catch-up")
+        producer.start()
+        next_tick = fetched_ticks.get
+    else:
+        producer = None
+        ticks_to_fetch = iter(range(1, ticks + 1))
+
+        def next_tick():
+            return fetch(next(ticks_to_fetch))
+
+    previous_timestamp = from_timestamp
+    try:
+        for _ in range(ticks):
+            if _should_stop(thread):
+                return None
+
+            tick_start = monotonic()
+            fetched_tick = next_tick()
+            if isinstance(fetched_tick, Exception):
+                raise fetched_tick
+
+            _process_tick(tests, finished_tests, fetched_tick)
+            previous_timestamp = fetched_tick.current_timestamp
+            if on_tick is not None:
+                on_tick(previous_timestamp, finished_tests)
+
+            _observe_tick(monotonic() - tick_start, fetch_interval_s)
+    finally:
+        stop.set()
+        if producer is not None:
+            producer.join()
+
+    logger.info("caught up, continue live")
+
+    return previous_timestamp
+
+
+def _put_until_stopped(items: queue.Queue, item, stop: threading.Event) -> bool:
+    """
+    Puts the item into the bounded queue, returns False if stopped before.
+    """
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fetch_tick(
+    tests: List[Tester],
+    finished_tests: list[Tester],
+    previous_timestamp: float,
+    current_timestamp: float,
+    total_seconds_passed: float,
+    snapshot: VersionSnapshot,
+    tick_budget_s: float,
+    executor: Optional[ThreadPoolExecutor],
+) -> FetchedTick:
+    """
+    Starts the fetches of all tests that are not finished yet for the window
+    (previous_timestamp, current_timestamp]. The queries of the tests have to be
+    answered within the tick budget, such that a slow querier can't stall the loop.
+    Without an executor the fetches run one after the other. The fetches belong to
+    the tick that is traced in the current context, if any.
+    """
+    deadline = monotonic() + tick_budget_s
+
+    def fetch(test: Tester):
+        with (
+            TICK_STAGE_DURATION.labels(test.name, "fetch").time(),
+            tracing.span(
+                "fetch",
+                test=test.name,
+                previous_timestamp=previous_timestamp,
+                current_timestamp=current_timestamp,
+            ),
+        ):
+            return test.fetch(previous_timestamp, current_timestamp, snapshot, deadline)
+
+    fetches: dict[Tester, Future] = {}
+    for test in tests:
+        if test in finished_tests:
+            continue
+        if executor is not None:
+            fetches[test] = executor.submit(
+                contextvars.copy_context().run, fetch, test
+            )
+        else:
+            fetches[test] = Future()
+            try:
+                fetches[test].set_result(fetch(test))
+            except Exception as e:
+                fetches[test].set_exception(e)
+
+    return FetchedTick(
+        previous_timestamp,
+        current_timestamp,
+        total_seconds_passed,
+        snapshot,
+        fetches,
+        tracing.is_sampled(),
+    )
+
+
+def _process_tick(
+    tests: List[Tester],
+    finished_tests: list[Tester],
+    fetched_tick: FetchedTick,
+):
+    """
+    Processes the fetched data of every test in order, a test is processed as soon
+    as its fetch is done. The tick is traced if it was sampled when it was fetched.
+    """
+    with (
+        tracing.tick(fetched_tick.sampled),
+        tracing.span(
+            "tick",
+            previous_timestamp=fetched_tick.previous_timestamp,
+            current_timestamp=fetched_tick.current_timestamp,
+            tests=len(fetched_tick.fetches),
+        ),
+    ):
+        for test, fetch in fetched_tick.fetches.items():
             if test in finished_tests:
                 continue
             try:
-                test_return = test.run(
-                    previous_timestamp,
-                    current_timestamp,
-                    (current_time - experiment_start_time).total_seconds(),
-                )
+                try:
+                    data = fetch.result()
+                except RequestException as e:
+                    test_return = test.fetch_failed(e)
+                else:
+                    with tracing.span("process", test=test.name) as span:
+                        test_return = test.process(
+                            data,
+                            fetched_tick.previous_timestamp,
+                            fetched_tick.current_timestamp,
+                            fetched_tick.total_seconds_passed,
+                            fetched_tick.snapshot,
+                        )
+                        span["reason"] = test_return.reason.value
 
             except JSONDecodeError as e:
                 logger.error(f"JSONDecodeError: {e}")
@@ -112,6 +479,13 @@ def run_tests_until_complete(
                     type=TesterReturnType.CONTINUE,
                     reason=TesterReturnReason.HTTP_ERROR,
                 )
+            except RequestException as e:
+                logger.error(f"RequestException: {e}")
+                test_return = TesterReturn(
+                    name=test.name,
+                    type=TesterReturnType.CONTINUE,
+                    reason=TesterReturnReason.HTTP_ERROR,
+                )
             except Exception as e:
                 logger.error(f"Exception: {e}")
                 test_return = TesterReturn(
@@ -120,7 +494,14 @@ def run_tests_until_complete(
                     reason=TesterReturnReason.UNKNOWN_ERROR,
                 )
 
+            if test_return.reason in (
+                TesterReturnReason.HTTP_ERROR,
+                TesterReturnReason.UNKNOWN_ERROR,
+            ):
+                TICK_ERRORS_TOTAL.labels(test.name, test_return.reason.value).inc()
+
             if test_return.type == TesterReturnType.TERMINATION:
+                test.decision = test_return
                 finished_tests.append(test)
                 test_return.log(logger)
             else:
@@ -128,14 +509,26 @@ def run_tests_until_complete(
 
         if len(tests) == len(finished_tests):
             raise Exception("All tests are completed")
-        # ------- Test execution -------
 
-        # set time needed for test execution
-        test_run_delta = dt.datetime.now() - test_start_time
 
-        previous_timestamp = current_timestamp
+def _observe_tick(duration_s: float, budget_s: float) -> None:
+    """
+    Exports the wall time of a tick and how far it ran over the time it had. While
+    catching up the ticks run back to back, a negative lag is the headroom left.
+    """
+    TICK_STAGE_DURATION.labels("experiment", "tick").observe(duration_s)
+    TICK_LAG_SECONDS.set(duration_s - budget_s)
 
-        sleep(fetch_interval_s / simulation_speedup_factor)
+
+def _should_stop(thread: RunningThread) -> bool:
+    with thread.lock:
+        if thread.should_stop:
+            thread.finished = False
+            thread.started = False
+            thread.should_stop = False
+            logger.info("stopping the experiment!")
+            return True
+    return False
 
 
 def create_tester(
@@ -174,53 +567,291 @@ def run(
     control_group_versions: List[str],
     simulation_speedup_factor: int,
     thread: RunningThread,
+    catch_up: bool = False,
+    checkpoint: Optional[ExperimentCheckpoint] = None,
 ):
-    logger.info("start experiment!")
+    """
+    Runs the experiment. With a `checkpoint` the experiment continues from it, see
+    `resume`.
+    """
+    logger.info("start experiment!" if checkpoint is None else "resume experiment!")
+
+    if checkpoint is not None:
+        # The restored groups and archives keep the codes of the checkpoint
+        VERSION_CODES.restore(checkpoint.version_codes)
+        HOST_CODES.restore(checkpoint.host_codes)
 
     global_config = load_environment_variable()
 
     config = ConfigLoader.load_config(global_config.CONFIG_FILE_PATH)
 
-    enricher = VersionEnricher(global_config)
+    enricher = VersionEnricher(
+        global_config,
+        retention_s=max_time_s
+        + global_config.PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME
+        + global_config.PREDICTABLE_ARRIVAL_TESTER_MONITORING_TIME,
+        snapshot_store=(
+            EnricherSnapshotStore(global_config.ENRICHER_SNAPSHOT_PATH)
+            if global_config.ENRICHER_SNAPSHOT_PATH
+            else None
+        ),
+    )
+    checkpoint_store = (
+        CheckpointStore(global_config.CHECKPOINT_PATH)
+        if global_config.CHECKPOINT_PATH
+        else None
+    )
+    experiment_store = (
+        ExperimentStore(global_config.EXPERIMENT_STORE_PATH)
+        if global_config.EXPERIMENT_STORE_PATH
+        else None
+    )
+    experiment_id: Optional[int] = None
+    if global_config.TRACE_PATH:
+        tracing.start(global_config.TRACE_PATH, global_config.TRACE_SAMPLE_RATE)
 
-    if start_time is not None:
+    if checkpoint is not None:
+        initial_timestamp = checkpoint.initial_timestamp
+    elif start_time is not None:
         initial_timestamp = start_time
     else:
         initial_timestamp = dt.datetime.now().timestamp()
 
-    # initial fetch of device to version mapping
-    enricher.update(initial_timestamp)
+    last_timestamp = (
+        checkpoint.previous_timestamp if checkpoint is not None else initial_timestamp
+    )
+    tests: List[Tester] = []
+    # The peeks and decisions of the tests that are already in the experiment store
+    recorded_peeks: dict[str, int] = {}
+    recorded_decisions: set[str] = set()
+    try:
+        if checkpoint is not None:
+            enricher.restore_history(checkpoint.enricher_history)
+            random.setstate(checkpoint.random_state)
+            filled_control_group_versions = checkpoint.control_group_versions
+        else:
+            # A live experiment starts from the saved history, the initial update
+            # then only adds the versions that changed since it was saved. It runs
+            # before the first tick, such that no tick is enriched with the outdated
+            # versions of the snapshot.
+            if start_time is None:
+                enricher.restore(initial_timestamp)
+
+            # initial fetch of device to version mapping
+            enricher.update(initial_timestamp)
+
+            logger.debug("Initial enricher update")
+
+            filled_control_group_versions = _fill_control_group_versions(
+                enricher, control_group_versions, version_under_test
+            )
 
-    logger.debug("Initial enricher update")
+            _verify_versions(
+                enricher, version_under_test, filled_control_group_versions
+            )
 
-    filled_control_group_versions = _fill_control_group_versions(
-        enricher, control_group_versions, version_under_test
-    )
+        tests = create_tester(
+            enricher=enricher,
+            tests=config["tests"],
+            total_peeks=max_time_s // fetch_interval_s,
+            version_under_test=version_under_test,
+            control_group_versions=filled_control_group_versions,
+            global_config=global_config,
+        )
 
-    _verify_versions(enricher, version_under_test, filled_control_group_versions)
+        finished_tests: List[Tester] = []
+        if checkpoint is not None:
+            for test in tests:
+                if test.name in checkpoint.tester_states:
+                    test.restore_state(checkpoint.tester_states[test.name])
+                if test.name in checkpoint.finished_tests:
+                    finished_tests.append(test)
+
+        for test in tests:
+            logger.info(f"Started: {test.name}")
+
+        if experiment_store is not None:
+            if checkpoint is not None and checkpoint.experiment_id is not None:
+                experiment_id = checkpoint.experiment_id
+                experiment_store.resume_experiment(experiment_id)
+            else:
+                experiment_id = experiment_store.start_experiment(
+                    version_under_test,
+                    filled_control_group_versions,
+                    max_time_s,
+                    fetch_interval_s,
+                    initial_timestamp,
+                )
+            # The restored peeks and decisions were recorded before the checkpoint
+            recorded_peeks = {test.name: len(test.peeks) for test in tests}
+            recorded_decisions = {test.name for test in finished_tests}
+
+        ticks = 0
+
+        def after_tick(previous_timestamp: float, finished: List[Tester]):
+            nonlocal ticks, last_timestamp
+            ticks += 1
+            last_timestamp = previous_timestamp
+            if experiment_store is not None:
+                _record_tick(
+                    experiment_store,
+                    experiment_id,
+                    previous_timestamp,
+                    tests,
+                    recorded_peeks,
+                    recorded_decisions,
+                )
+            if (
+                global_config.ARROW_EXPORT_PATH
+                and ticks % global_config.ARROW_EXPORT_INTERVAL == 0
+            ):
+                _export_arrow(tests, global_config.ARROW_EXPORT_PATH)
+            if (
+                checkpoint_store is not None
+                and ticks % global_config.CHECKPOINT_INTERVAL == 0
+            ):
+                save_checkpoint(previous_timestamp, finished)
+
+        def save_checkpoint(previous_timestamp: float, finished: List[Tester]):
+            try:
+                checkpoint_store.save(
+                    ExperimentCheckpoint(
+                        version_under_test=version_under_test,
+                        max_time_s=max_time_s,
+                        fetch_interval_s=fetch_interval_s,
+                        start_time=start_time,
+                        control_group_versions=filled_control_group_versions,
+                        simulation_speedup_factor=simulation_speedup_factor,
+                        catch_up=catch_up,
+                        initial_timestamp=initial_timestamp,
+                        previous_timestamp=previous_timestamp,
+                        finished_tests=[test.name for test in finished],
+                        tester_states={
+                            test.name: test.checkpoint_state() for test in tests
+                        },
+                        enricher_history=enricher.history(),
+                        random_state=random.getstate(),
+                        version_codes=VERSION_CODES.values(),
+                        host_codes=HOST_CODES.values(),
+                        experiment_id=experiment_id,
+                    )
+                )
+            except (OSError, pickle.PicklingError) as e:
+                # Only a resume would have to repeat more ticks, the experiment goes on.
+                logger.error(f"Saving the checkpoint failed: {e}")
+
+        run_tests_until_complete(
+            enricher=enricher,
+            tests=tests,
+            version_under_test=version_under_test,
+            fetch_interval_s=fetch_interval_s,
+            thread=thread,
+            initial_timestamp=initial_timestamp,
+            control_group_versions=filled_control_group_versions,
+            simulation_speedup_factor=simulation_speedup_factor,
+            # A live experiment only fetches the windows it missed since the
+            # checkpoint, a replay of the past just continues.
+            catch_up=catch_up or (checkpoint is not None and start_time is None),
+            pipeline_depth=global_config.PIPELINE_DEPTH,
+            resume_timestamp=(
+                checkpoint.previous_timestamp if checkpoint is not None else None
+            ),
+            finished_tests=finished_tests,
+            on_tick=after_tick,
+        )
+    finally:
+        enricher.stop_refresher()
+        enricher.save()
+        if experiment_store is not None:
+            if experiment_id is not None:
+                # The tick that finished the last test didn't get to after_tick
+                _record_tick(
+                    experiment_store,
+                    experiment_id,
+                    last_timestamp,
+                    tests,
+                    recorded_peeks,
+                    recorded_decisions,
+                )
+                experiment_store.finish_experiment(experiment_id)
+            experiment_store.close()
+        if global_config.ARROW_EXPORT_PATH:
+            _export_arrow(tests, global_config.ARROW_EXPORT_PATH)
+        for test in tests:
+            test.close()
+        tracing.stop()
 
-    tests: List[Tester] = create_tester(
-        enricher=enricher,
-        tests=config["tests"],
-        total_peeks=max_time_s // fetch_interval_s,
-        version_under_test=version_under_test,
-        control_group_versions=filled_control_group_versions,
-        global_config=global_config,
+
+def resume(thread: RunningThread):
+    """
+    Continues the experiment of the latest checkpoint in CHECKPOINT_PATH.
+    """
+    global_config = load_environment_variable()
+    checkpoint = (
+        CheckpointStore(global_config.CHECKPOINT_PATH).load()
+        if global_config.CHECKPOINT_PATH
+        else None
     )
+    if checkpoint is None:
+        raise Exception("No checkpoint to resume from")
+
+    run(
+        checkpoint.version_under_test,
+        checkpoint.max_time_s,
+        checkpoint.fetch_interval_s,
+        checkpoint.start_time,
+        checkpoint.control_group_versions,
+        checkpoint.simulation_speedup_factor,
+        thread,
+        checkpoint.catch_up,
+        checkpoint=checkpoint,
+    )
+
+
+def _record_tick(
+    experiment_store: ExperimentStore,
+    experiment_id: int,
+    timestamp: float,
+    tests: List[Tester],
+    recorded_peeks: dict[str, int],
+    recorded_decisions: set[str],
+) -> None:
+    """
+    Writes the peeks and decisions of the tests since the last recorded tick to the
+    experiment store, in one transaction.
+    """
+    statistics = []
+    decisions = []
+    for test in tests:
+        statistics.extend(
+            (test.name, peek) for peek in test.peeks[recorded_peeks.get(test.name, 0) :]
+        )
+        decision = test.decision_record()
+        if decision is not None and test.name not in recorded_decisions:
+            decisions.append((test.name, decision))
+
+    try:
+        experiment_store.record_tick(experiment_id, timestamp, statistics, decisions)
+    except (sqlite3.IntegrityError, sqlite3.InterfaceError) as e:
+        # The rows can never be written, retrying them would block all later ticks
+        logger.error(f"Dropped the rows of the tick, they can't be recorded: {e}")
+    except sqlite3.Error as e:
+        # The rows are written with the next tick
+        logger.error(f"Recording the tick failed: {e}")
+        return
 
     for test in tests:
-        logger.info(f"Started: {test.name}")
-
-    run_tests_until_complete(
-        enricher=enricher,
-        tests=tests,
-        version_under_test=version_under_test,
-        fetch_interval_s=fetch_interval_s,
-        thread=thread,
-        initial_timestamp=initial_timestamp,
-        control_group_versions=filled_control_group_versions,
-        simulation_speedup_factor=simulation_speedup_factor,
-    )
+        recorded_peeks[test.name] = len(test.peeks)
+    recorded_decisions.update(name for name, _ in decisions)
+
+
+def _export_arrow(tests: List[Tester], directory: str) -> None:
+    for test in tests:
+        try:
+            test.export_arrow(directory)
+        except OSError as e:
+            # Only the export is missing, the experiment goes on.
+            logger.error(f"Arrow export of {test.name} failed: {e}")
 
 
 def _fill_control_group_versions(
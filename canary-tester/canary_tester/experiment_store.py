@@ -0,0 +1,210 @@
+import json
+import sqlite3
+import time
+from typing import List, Optional
+
+# The keys of the peek records of the testers, see Tester.peeks. The statistics
+# are NaN if the test couldn't compute them (i.e. an empty group), SQLite stores
+# NaN as NULL, so only the columns that are always set are NOT NULL.
+_REQUIRED_STATISTIC_COLUMNS = ("peek", "timestamp", "reason", "skipped")
+_STATISTIC_COLUMNS = (
+    "peek",
+    "timestamp",
+    "total_seconds_passed",
+    "control_sample_size",
+    "treatment_sample_size",
+    "mean_a",
+    "mean_b",
+    "effect_size_ci_low",
+    "effect_size_ci_high",
+    "effect_size_threshold",
+    "p_value_h0",
+    "p_value_h1",
+    "alpha",
+    "reason",
+    "skipped",
+)
+
+_STATISTIC_COLUMN_DEFINITIONS = ", ".join(
+    f"{column} NOT NULL" if column in _REQUIRED_STATISTIC_COLUMNS else column
+    for column in _STATISTIC_COLUMNS
+)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS experiments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    version_under_test TEXT NOT NULL,
+    control_group_versions TEXT NOT NULL,
+    max_time_s INTEGER NOT NULL,
+    fetch_interval_s INTEGER NOT NULL,
+    initial_timestamp REAL NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS ticks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    experiment_id INTEGER NOT NULL REFERENCES experiments (id),
+    timestamp REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS statistics (
+    experiment_id INTEGER NOT NULL REFERENCES experiments (id),
+    tick_id INTEGER NOT NULL REFERENCES ticks (id),
+    test_name TEXT NOT NULL,
+    {_STATISTIC_COLUMN_DEFINITIONS},
+    PRIMARY KEY (experiment_id, test_name, peek)
+);
+CREATE TABLE IF NOT EXISTS decisions (
+    experiment_id INTEGER NOT NULL REFERENCES experiments (id),
+    tick_id INTEGER NOT NULL REFERENCES ticks (id),
+    test_name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    peek INTEGER NOT NULL,
+    PRIMARY KEY (experiment_id, test_name)
+);
+CREATE INDEX IF NOT EXISTS ticks_experiment ON ticks (experiment_id);
+CREATE INDEX IF NOT EXISTS statistics_test_name ON statistics (test_name);
+CREATE INDEX IF NOT EXISTS decisions_test_name ON decisions (test_name, reason);
+"""
+
+
+class ExperimentStore:
+    """
+    Keeps the history of all experiments in a SQLite database: the experiments,
+    their ticks, the statistics of every analyzed peek of every test and the
+    decisions of the tests. Unlike the results csv files, experiments that share
+    test names don't mix.
+
+    The database runs in WAL mode, so it can be queried while an experiment writes
+    to it. All rows of a tick are written in one transaction. Peeks and decisions
+    that a resumed experiment runs again replace the earlier rows.
+
+    Parameters:
+    path: str
+        The file of the database, it is created if it doesn't exist yet.
+    """
+
+    _connection: sqlite3.Connection
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # A crash only loses the last transactions, the database stays consistent.
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def start_experiment(
+        self,
+        version_under_test: str,
+        control_group_versions: List[str],
+        max_time_s: int,
+        fetch_interval_s: int,
+        initial_timestamp: float,
+    ) -> int:
+        """Adds the experiment and returns its id."""
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO experiments (version_under_test, control_group_versions,"
+                " max_time_s, fetch_interval_s, initial_timestamp, started_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    version_under_test,
+                    json.dumps(control_group_versions),
+                    max_time_s,
+                    fetch_interval_s,
+                    initial_timestamp,
+                    time.time(),
+                ),
+            )
+        return cursor.lastrowid
+
+    def resume_experiment(self, experiment_id: int) -> None:
+        """Marks a resumed experiment as running again."""
+        with self._connection:
+            self._connection.execute(
+                "UPDATE experiments SET finished_at = NULL WHERE id = ?",
+                (experiment_id,),
+            )
+
+    def record_tick(
+        self,
+        experiment_id: int,
+        timestamp: float,
+        statistics: List[tuple[str, dict]],
+        decisions: List[tuple[str, dict]],
+    ) -> None:
+        """
+        Adds a tick with the peeks and the decisions of the tests in it.
+
+        Parameters:
+        timestamp: float
+            The end of the window of the tick.
+        statistics: List[tuple[str, dict]]
+            The test name and the peek record of every analyzed peek.
+        decisions: List[tuple[str, dict]]
+            The test name and the type, reason and peek of every new decision.
+        """
+        with self._connection:
+            tick_id = self._connection.execute(
+                "INSERT INTO ticks (experiment_id, timestamp, recorded_at)"
+                " VALUES (?, ?, ?)",
+                (experiment_id, timestamp, time.time()),
+            ).lastrowid
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO statistics (experiment_id, tick_id, test_name,"
+                f" {', '.join(_STATISTIC_COLUMNS)}) VALUES"
+                f" (?, ?, ?, {', '.join('?' for _ in _STATISTIC_COLUMNS)})",
+                [
+                    (experiment_id, tick_id, name)
+                    + tuple(peek[column] for column in _STATISTIC_COLUMNS)
+                    for name, peek in statistics
+                ],
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO decisions (experiment_id, tick_id, test_name,"
+                " type, reason, peek) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        experiment_id,
+                        tick_id,
+                        name,
+                        decision["type"],
+                        decision["reason"],
+                        decision["peek"],
+                    )
+                    for name, decision in decisions
+                ],
+            )
+
+    def finish_experiment(self, experiment_id: int) -> None:
+        with self._connection:
+            self._connection.execute(
+                "UPDATE experiments SET finished_at = ? WHERE id = ?",
+                (time.time(), experiment_id),
+            )
+
+    def experiments_with_decision(
+        self, test_name: str, reason: Optional[str] = None
+    ) -> List[sqlite3.Row]:
+        """
+        Returns the experiments in which the test made a decision, only the ones
+        with the given reason (i.e. "WORSE") if set. Every row has the columns of
+        the experiment and the `type`, `reason` and `peek` of the decision.
+        """
+        query = (
+            "SELECT experiments.*, decisions.type, decisions.reason, decisions.peek"
+            " FROM decisions JOIN experiments ON experiments.id ="
+            " decisions.experiment_id WHERE decisions.test_name = ?"
+        )
+        params: tuple = (test_name,)
+        if reason is not None:
+            query += " AND decisions.reason = ?"
+            params += (reason,)
+
+        cursor = self._connection.execute(query + " ORDER BY experiments.id", params)
+        cursor.row_factory = sqlite3.Row
+        return cursor.fetchall()
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,119 @@
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+import numpy as np
+
+from canary_tester.types import GlobalConfig
+
+T = TypeVar("T")
+
+# The number of recent latencies per endpoint the hedge threshold is computed from
+# and how many we need before we start hedging.
+_WINDOW = 200
+_MIN_SAMPLES = 20
+
+_shared: Optional["Hedger"] = None
+_shared_lock = threading.Lock()
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the recent successful queries per endpoint.
+    """
+
+    _latencies: dict[str, collections.deque]
+    _lock: threading.Lock
+
+    def __init__(self):
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, latency_s: float) -> None:
+        with self._lock:
+            latencies = self._latencies.setdefault(
+                key, collections.deque(maxlen=_WINDOW)
+            )
+            latencies.append(latency_s)
+
+    def quantile(self, key: str, q: float) -> Optional[float]:
+        """
+        Returns the q-quantile of the recent latencies, None if there are too few.
+        """
+        with self._lock:
+            latencies = list(self._latencies.get(key, []))
+        if len(latencies) < _MIN_SAMPLES:
+            return None
+        return float(np.quantile(latencies, q))
+
+
+class Hedger:
+    """
+    Sends a duplicate of a query if the first one didn't respond within the p95
+    latency of its endpoint and returns whichever response arrives first. This cuts
+    the tail latency caused by a single slow querier or store, at the cost of a few
+    percent more queries.
+
+    Parameters:
+    enabled: bool
+        Without hedging, the query is sent once in the calling thread.
+    quantile: float
+        The latency quantile after which the duplicate is sent.
+    """
+
+    _enabled: bool
+    _quantile: float
+    _tracker: LatencyTracker
+    _executor: concurrent.futures.ThreadPoolExecutor
+
+    def __init__(self, enabled: bool, quantile: float = 0.95):
+        self._enabled = enabled
+        self._quantile = quantile
+        self._tracker = LatencyTracker()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=16, thread_name_prefix="hedge"
+        )
+
+    def shared(global_config: GlobalConfig) -> "Hedger":
+        """
+        Returns the hedger of the process, it is created with the settings of the
+        first global config it is asked for.
+        """
+        global _shared
+        with _shared_lock:
+            if _shared is None:
+                _shared = Hedger(global_config.THANOS_HEDGE_REQUESTS)
+            return _shared
+
+    def run(self, key: str, send: Callable[[], T]) -> tuple[T, bool]:
+        """
+        Runs `send`, and a duplicate of it if it is slow. Returns the first
+        successful result and whether a duplicate was sent.
+        """
+        threshold = (
+            self._tracker.quantile(key, self._quantile) if self._enabled else None
+        )
+        if threshold is None:
+            return self._timed(key, send), False
+
+        primary = self._executor.submit(self._timed, key, send)
+        try:
+            return primary.result(timeout=threshold), False
+        except concurrent.futures.TimeoutError:
+            pass
+
+        hedge = self._executor.submit(self._timed, key, send)
+        for future in concurrent.futures.as_completed([primary, hedge]):
+            if future.exception() is None:
+                return future.result(), True
+
+        # Both failed, raise the error of the original query.
+        return primary.result(), True
+
+    def _timed(self, key: str, send: Callable[[], T]) -> T:
+        start = time.perf_counter()
+        result = send()
+        self._tracker.record(key, time.perf_counter() - start)
+        return result
@@ -43,6 +43,42 @@ def load_environment_variable() -> GlobalConfig:
         # 8 has been proven an reasonable number. It is a tradeoff
         # between early stopping and rubustness
         MINIMAL_SAMPLE_SIZE=os.getenv("MINIMAL_SAMPLE_SIZE", "8"),
+        PREDICTABLE_ARRIVAL_TESTER_BATCH_SIZE=os.getenv(
+            "PREDICTABLE_ARRIVAL_TESTER_BATCH_SIZE", "50"
+        ),
+        PREDICTABLE_ARRIVAL_TESTER_BATCH_WINDOW=os.getenv(
+            "PREDICTABLE_ARRIVAL_TESTER_BATCH_WINDOW", "300"
+        ),
+        PREDICTABLE_ARRIVAL_TESTER_BATCH_STEP=os.getenv(
+            "PREDICTABLE_ARRIVAL_TESTER_BATCH_STEP", "15"
+        ),
+        PREDICTABLE_ARRIVAL_TESTER_BATCH_WORKERS=os.getenv(
+            "PREDICTABLE_ARRIVAL_TESTER_BATCH_WORKERS", "4"
+        ),
+        RANGE_FETCH_SHARD_S=os.getenv("RANGE_FETCH_SHARD_S", "21600"),
+        RANGE_FETCH_MAX_WORKERS=os.getenv("RANGE_FETCH_MAX_WORKERS", "4"),
+        HOST_SHARDS=os.getenv("HOST_SHARDS", "1"),
+        HOST_SHARD_MAX_WORKERS=os.getenv("HOST_SHARD_MAX_WORKERS", "4"),
+        HOST_SHARD_DISCOVERY_INTERVAL=os.getenv("HOST_SHARD_DISCOVERY_INTERVAL", "10"),
+        THANOS_MAX_QPS=os.getenv("THANOS_MAX_QPS", "20"),
+        THANOS_MAX_IN_FLIGHT=os.getenv("THANOS_MAX_IN_FLIGHT", "8"),
+        THANOS_QUERY_TIMEOUT_S=os.getenv("THANOS_QUERY_TIMEOUT_S", "60"),
+        THANOS_HEDGE_REQUESTS=os.getenv("THANOS_HEDGE_REQUESTS", "False"),
+        THANOS_BREAKER_FAILURES=os.getenv("THANOS_BREAKER_FAILURES", "5"),
+        THANOS_BREAKER_RESET_S=os.getenv("THANOS_BREAKER_RESET_S", "30"),
+        PIPELINE_DEPTH=os.getenv("PIPELINE_DEPTH", "2"),
+        ENRICHER_HOST_TTL_S=os.getenv("ENRICHER_HOST_TTL_S", "21600"),
+        ENRICHER_SNAPSHOT_PATH=os.getenv("ENRICHER_SNAPSHOT_PATH", ""),
+        ENRICHER_SNAPSHOT_INTERVAL=os.getenv("ENRICHER_SNAPSHOT_INTERVAL", "10"),
+        ENRICHER_SNAPSHOT_MAX_AGE_S=os.getenv("ENRICHER_SNAPSHOT_MAX_AGE_S", "3600"),
+        ANALYSIS_MIN_NEW_SAMPLES=os.getenv("ANALYSIS_MIN_NEW_SAMPLES", "1"),
+        CHECKPOINT_PATH=os.getenv("CHECKPOINT_PATH", ""),
+        CHECKPOINT_INTERVAL=os.getenv("CHECKPOINT_INTERVAL", "1"),
+        ARROW_EXPORT_PATH=os.getenv("ARROW_EXPORT_PATH", ""),
+        ARROW_EXPORT_INTERVAL=os.getenv("ARROW_EXPORT_INTERVAL", "10"),
+        EXPERIMENT_STORE_PATH=os.getenv("EXPERIMENT_STORE_PATH", ""),
+        TRACE_PATH=os.getenv("TRACE_PATH", ""),
+        TRACE_SAMPLE_RATE=os.getenv("TRACE_SAMPLE_RATE", "0.01"),
     )
 
 
@@ -0,0 +1,110 @@
+import concurrent.futures
+import zlib
+from typing import Callable, List
+
+from canary_tester.promql_template import QueryTemplate
+from canary_tester.types import GlobalConfig
+
+
+class HostSharder:
+    """
+    Splits a fleet-wide query into HOST_SHARDS smaller queries, each restricted to
+    the hosts of one partition, and runs them in parallel. The hosts are partitioned
+    by a stable hash, such that a host always ends up in the same shard.
+
+    The results of the shards are concatenated, so this is only valid for queries
+    that keep the host label (i.e. `avg (x) by (host)` or plain selectors), since
+    every series then belongs to exactly one shard.
+
+    Parameters:
+    global_config: GlobalConfig
+        The global config, it defines the number of shards and how many of them
+        are fetched at the same time.
+    """
+
+    _global_config: GlobalConfig
+
+    def __init__(self, global_config: GlobalConfig):
+        self._global_config = global_config
+
+    @property
+    def enabled(self) -> bool:
+        return self._global_config.HOST_SHARDS > 1
+
+    def fetch(
+        self,
+        template: QueryTemplate,
+        params: dict,
+        hosts: List[str],
+        run: Callable[[dict], dict],
+        **render_kwargs,
+    ) -> dict:
+        """
+        Runs the query once per partition of `hosts` and merges the results.
+
+        Parameters:
+        template: QueryTemplate
+            The compiled query, the host matcher of each shard is injected into it.
+        params: dict
+            The query params, `query` is replaced by the rendered query of the shard.
+        hosts: List[str]
+            The hosts that are queried.
+        run: Callable[[dict], dict]
+            Runs a single query, i.e. `lambda p: thanos.query(p, plan)`.
+        render_kwargs:
+            Passed to `QueryTemplate.render` of every shard.
+        """
+        partitions = HostSharder.partition(hosts, self._global_config.HOST_SHARDS)
+
+        if len(partitions) <= 1:
+            return run(
+                {
+                    **params,
+                    "query": template.render(hosts=hosts or None, **render_kwargs),
+                }
+            )
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._global_config.HOST_SHARD_MAX_WORKERS
+        ) as executor:
+            responses = list(
+                executor.map(
+                    lambda partition: run(
+                        {
+                            **params,
+                            "query": template.render(hosts=partition, **render_kwargs),
+                        }
+                    ),
+                    partitions,
+                )
+            )
+
+        return HostSharder.merge(responses)
+
+    def shard_of(host: str, shards: int) -> int:
+        """
+        Returns the shard of the host. Python's `hash` is salted per process, crc32
+        is stable across restarts.
+        """
+        return zlib.crc32(host.encode()) % shards
+
+    def partition(hosts: List[str], shards: int) -> List[List[str]]:
+        """
+        Partitions the hosts into at most `shards` non-empty partitions.
+        """
+        partitions: List[List[str]] = [[] for _ in range(max(shards, 1))]
+        for host in sorted(hosts):
+            partitions[HostSharder.shard_of(host, len(partitions))].append(host)
+        return [partition for partition in partitions if partition]
+
+    def merge(responses: List[dict]) -> dict:
+        """
+        Concatenates the results of the shards into a single response.
+        """
+        return {
+            "status": "success",
+            "data": {
+                "resultType": responses[0]["data"]["resultType"],
+                "result": [el for res in responses for el in res["data"]["result"]],
+            },
+        }
@@ -0,0 +1,113 @@
+import threading
+from typing import Dict, List
+
+
+class Interner:
+    """
+    Maps strings to small integer codes, such that the hot paths compare and index
+    by int instead of hashing and comparing strings. Codes are handed out in order
+    of first use and never change during the lifetime of the process.
+    """
+
+    _codes: Dict[str, int]
+    _values: List[str]
+    _lock: threading.Lock
+
+    def __init__(self):
+        self._codes = {}
+        self._values = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def code(self, value: str) -> int:
+        """Returns the code of the value, a new one if it wasn't seen before."""
+        code = self._codes.get(value)
+        if code is not None:
+            return code
+
+        with self._lock:
+            code = self._codes.get(value)
+            if code is None:
+                code = len(self._values)
+                self._values.append(value)
+                self._codes[value] = code
+            return code
+
+    def value(self, code: int) -> str:
+        """Returns the string of the code."""
+        return self._values[code]
+
+    def values(self) -> List[str]:
+        """Returns the strings of all codes, the index is the code."""
+        with self._lock:
+            return list(self._values)
+
+    def restore(self, values: List[str]) -> None:
+        """
+        Hands out the codes of `values`, as returned by `values()` in an earlier
+        process, such that the codes of a checkpoint stay valid. Strings that only
+        this process has seen get new codes after them. Must be called before
+        anything that keeps codes is built.
+        """
+        with self._lock:
+            restored = list(values)
+            known = set(restored)
+            restored.extend(value for value in self._values if value not in known)
+            self._codes = {value: code for code, value in enumerate(restored)}
+            self._values = restored
+
+
+# The version codes of the process, shared by the enricher and all testers.
+VERSION_CODES = Interner()
+
+# The host codes of the process, used by the sample archives.
+HOST_CODES = Interner()
+
+
+class VersionGroups:
+    """
+    Lookup tables indexed by version code that tell whether a version belongs to the
+    treatment or the control group. Versions that got a code after the tables were
+    built are added on first lookup.
+
+    Parameters:
+    version_under_test: str
+        The version of the treatment group.
+    control_group_versions: List[str]
+        The versions of the control group.
+    """
+
+    treatment_code: int
+    _control_group_versions: frozenset[str]
+    _is_treatment: List[bool]
+    _is_control: List[bool]
+
+    def __init__(self, version_under_test: str, control_group_versions: List[str]):
+        self.treatment_code = VERSION_CODES.code(version_under_test)
+        self._control_group_versions = frozenset(control_group_versions)
+        self._is_treatment = []
+        self._is_control = []
+        self._extend()
+
+    def is_treatment(self, code: int) -> bool:
+        return code == self.treatment_code
+
+    def is_control(self, code: int) -> bool:
+        if code >= len(self._is_control):
+            self._extend()
+        return self._is_control[code]
+
+    def is_valid(self, code: int) -> bool:
+        """Returns whether the version is in the treatment or the control group."""
+        if code >= len(self._is_treatment):
+            self._extend()
+        return self._is_treatment[code] or self._is_control[code]
+
+    def _extend(self) -> None:
+        for code in range(len(self._is_treatment), len(VERSION_CODES)):
+            self._is_treatment.append(code == self.treatment_code)
+            self._is_control.append(
+                VERSION_CODES.value(code) in self._control_group_versions
+            )
@@ -0,0 +1,122 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# All metrics of the canary tester are defined here, such that they are only
+# registered once in the default registry.
+
+THANOS_QUERY_DURATION = Histogram(
+    "canary_tester_thanos_query_duration_seconds",
+    "Wall time of a thanos query as seen by the canary tester.",
+    ["source", "endpoint", "resolution"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+THANOS_QUERY_RESPONSE_BYTES = Histogram(
+    "canary_tester_thanos_query_response_bytes",
+    "Size of the response body of a thanos query.",
+    ["source", "endpoint", "resolution"],
+    buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8),
+)
+
+THANOS_QUERIER_EVAL_SECONDS = Histogram(
+    "canary_tester_thanos_querier_eval_seconds",
+    "Evaluation time of a query reported by the querier (stats=all).",
+    ["source", "endpoint", "resolution"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+THANOS_QUERIER_SAMPLES = Histogram(
+    "canary_tester_thanos_querier_samples",
+    "Number of samples the querier loaded for a query (stats=all).",
+    ["source", "endpoint", "resolution"],
+    buckets=(1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8),
+)
+
+THANOS_GOVERNOR_WAIT_SECONDS = Histogram(
+    "canary_tester_thanos_governor_wait_seconds",
+    "Time a thanos query waited in the query governor before it was sent.",
+    ["priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+THANOS_THROTTLED_TOTAL = Counter(
+    "canary_tester_thanos_throttled_total",
+    "Number of thanos queries answered with 429 or 503.",
+    ["source", "endpoint"],
+)
+
+THANOS_QUERY_OUTCOME_TOTAL = Counter(
+    "canary_tester_thanos_query_outcome_total",
+    "Outcome of every thanos query (success, timeout, deadline_exceeded,"
+    " connection_error, circuit_open, throttled, http_error, invalid_response, error).",
+    ["source", "endpoint", "outcome"],
+)
+
+THANOS_HEDGED_TOTAL = Counter(
+    "canary_tester_thanos_hedged_total",
+    "Number of successful thanos queries for which a hedged duplicate was sent.",
+    ["source", "endpoint"],
+)
+
+ENRICHER_HISTORY_HOSTS = Gauge(
+    "canary_tester_enricher_history_hosts",
+    "Number of hosts in the version history of the enricher.",
+)
+
+ENRICHER_HISTORY_ENTRIES = Gauge(
+    "canary_tester_enricher_history_entries",
+    "Number of version entries in the version history of the enricher.",
+)
+
+TESTER_ANALYSIS_SKIPPED_TOTAL = Counter(
+    "canary_tester_analysis_skipped_total",
+    "Number of peeks that reused the statistics of the previous analysis"
+    " (no_new_samples, below_min_new_samples).",
+    ["test", "reason"],
+)
+
+TICK_STAGE_DURATION = Histogram(
+    "canary_tester_tick_stage_duration_seconds",
+    "Wall time of a stage of a tick (enricher_update, fetch, decode, enrich, balance,"
+    " statistic, results_write) and of the whole tick (tick).",
+    ["source", "stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+TICK_LAG_SECONDS = Gauge(
+    "canary_tester_tick_lag_seconds",
+    "Wall time of the last tick minus the time it had (fetch_interval_s divided by the"
+    " simulation speedup factor), positive if the ticks can't keep up.",
+)
+
+TICK_ERRORS_TOTAL = Counter(
+    "canary_tester_tick_errors_total",
+    "Number of ticks in which a test failed to fetch or process its data"
+    " (HTTP_ERROR, UNKNOWN_ERROR).",
+    ["test", "reason"],
+)
+
+TESTER_GROUP_SIZE = Gauge(
+    "canary_tester_group_size",
+    "Number of samples in the treatment and the control group of a test.",
+    ["test", "group"],
+)
+
+TESTER_PEEKS = Gauge(
+    "canary_tester_peeks",
+    "Number of peeks a test has done so far.",
+    ["test"],
+)
+
+KSTEST_DURATION = Histogram(
+    "canary_tester_kstest_duration_seconds",
+    "Wall time of the confidence interval (ci) and the p value (p_value) of the"
+    " one-sided KS test.",
+    ["function"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+KSTEST_SAMPLE_POINTS = Histogram(
+    "canary_tester_kstest_sample_points",
+    "Number of points at which the one-sided KS test compares the CDFs.",
+    buckets=(1e1, 1e2, 1e3, 1e4, 1e5, 1e6),
+)
@@ -0,0 +1,592 @@
+import functools
+import re
+from typing import List, Optional
+
+# A tiny tokenizer for the subset of PromQL that we use in the test configs.
+_TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+    (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`[^`]*`)
+    |(?P<duration>\d+(?:ms|[smhdwy])(?:\d+(?:ms|[smhdwy]))*)
+    |(?P<number>(?:\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+))
+    |(?P<ident>[a-zA-Z_:][a-zA-Z0-9_:]*)
+    |(?P<op>=~|!~|!=|==|<=|>=|=|<|>|[-+*/%^])
+    |(?P<punct>[(){}\[\],@:])
+    )""",
+    re.VERBOSE,
+)
+
+_GROUPING_KEYWORDS = ("by", "without")
+
+# The binary operators by precedence, a higher one binds stronger. `^` is the only
+# right associative one.
+_BINARY_OPERATORS = {
+    "or": 1,
+    "and": 2,
+    "unless": 2,
+    "==": 3,
+    "!=": 3,
+    "<=": 3,
+    "<": 3,
+    ">=": 3,
+    ">": 3,
+    "+": 4,
+    "-": 4,
+    "*": 5,
+    "/": 5,
+    "%": 5,
+    "atan2": 5,
+    "^": 6,
+}
+_COMPARISON_OPERATORS = ("==", "!=", "<=", "<", ">=", ">")
+_VECTOR_MATCHING_KEYWORDS = ("on", "ignoring")
+_GROUP_MODIFIERS = ("group_left", "group_right")
+
+
+class LabelMatcher:
+    """
+    A single label matcher of a selector, i.e. `host!=""`. The value is kept
+    as written in the query (including the quotes).
+    """
+
+    label: str
+    op: str
+    value: str
+
+    def __init__(self, label: str, op: str, value: str):
+        self.label = label
+        self.op = op
+        self.value = value
+
+    def render(self) -> str:
+        return f"{self.label}{self.op}{self.value}"
+
+
+class Selector:
+    """
+    A vector selector like `disk_free{path='/'}[5m] offset 1h`.
+    """
+
+    metric: Optional[str]
+    matchers: List[LabelMatcher]
+    range: Optional[str]
+    offset: Optional[str]
+    at: Optional[str]
+
+    def __init__(
+        self,
+        metric: Optional[str],
+        matchers: List[LabelMatcher],
+        range: Optional[str] = None,
+        offset: Optional[str] = None,
+        at: Optional[str] = None,
+    ):
+        self.metric = metric
+        self.matchers = matchers
+        self.range = range
+        self.offset = offset
+        self.at = at
+
+    def render(self, context: "RenderContext") -> str:
+        matchers = [m.render() for m in self.matchers if not context.replaces(m)]
+        if context.host_matcher is not None:
+            matchers.append(context.host_matcher)
+
+        query = self.metric or ""
+        if matchers:
+            query += "{" + ", ".join(matchers) + "}"
+
+        # A plain selector is aggregated over the window, a selector that already
+        # has a range is aggregated by its enclosing function call.
+        aggregate = context.over_time is not None and self.range is None
+        if self.range is not None:
+            query += f"[{self.range}]"
+        elif aggregate:
+            query += f"[{context.window}]"
+
+        offset = context.offset or self.offset
+        if offset is not None:
+            query += f" offset {offset}"
+        at = context.at or self.at
+        if at is not None:
+            query += f" @ {at}"
+
+        if aggregate:
+            return f"{context.over_time}_over_time({query})"
+        return query
+
+
+class Literal:
+    """
+    A number or string argument of a function, i.e. the `0.9` of `quantile(0.9, ...)`.
+    """
+
+    value: str
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def render(self, context: "RenderContext") -> str:
+        return self.value
+
+
+class FunctionCall:
+    """
+    A function or aggregation like `avg (disk_free) by (host)`.
+    """
+
+    name: str
+    args: list
+    grouping: Optional[tuple[str, List[str]]]
+    grouping_first: bool
+
+    def __init__(
+        self,
+        name: str,
+        args: list,
+        grouping: Optional[tuple[str, List[str]]] = None,
+        grouping_first: bool = False,
+    ):
+        self.name = name
+        self.args = args
+        self.grouping = grouping
+        self.grouping_first = grouping_first
+
+    def render(self, context: "RenderContext") -> str:
+        args = ", ".join(arg.render(context) for arg in self.args)
+
+        if self.grouping is None:
+            if context.over_time is not None and any(
+                isinstance(arg, Selector) and arg.range is not None for arg in self.args
+            ):
+                # i.e. rate(x[5m]) becomes avg_over_time(rate(x[5m])[60s:])
+                return (
+                    f"{context.over_time}_over_time("
+                    f"{self.name}({args})[{context.window}:])"
+                )
+            return f"{self.name}({args})"
+
+        keyword, labels = self.grouping
+        grouping = f"{keyword} ({', '.join(labels)})"
+        if self.grouping_first:
+            return f"{self.name} {grouping} ({args})"
+        return f"{self.name} ({args}) {grouping}"
+
+
+class Parenthesized:
+    """
+    An expression in parentheses, i.e. the `(a + b)` of `(a + b) / 2`.
+    """
+
+    expression: "Expression"
+
+    def __init__(self, expression: "Expression"):
+        self.expression = expression
+
+    def render(self, context: "RenderContext") -> str:
+        return f"({self.expression.render(context)})"
+
+
+class UnaryOperation:
+    """
+    A negated or explicitly positive expression, i.e. `-disk_free`.
+    """
+
+    op: str
+    operand: "Expression"
+
+    def __init__(self, op: str, operand: "Expression"):
+        self.op = op
+        self.operand = operand
+
+    def render(self, context: "RenderContext") -> str:
+        return f"{self.op}{self.operand.render(context)}"
+
+
+class BinaryOperation:
+    """
+    A binary operation like `disk_free / 1e9` or `avg (x) by (host) > bool 0`,
+    with its vector matching, i.e. `on (host) group_left (version)`.
+    """
+
+    op: str
+    lhs: "Expression"
+    rhs: "Expression"
+    modifiers: List[str]
+
+    def __init__(
+        self, op: str, lhs: "Expression", rhs: "Expression", modifiers: List[str]
+    ):
+        self.op = op
+        self.lhs = lhs
+        self.rhs = rhs
+        self.modifiers = modifiers
+
+    def render(self, context: "RenderContext") -> str:
+        return " ".join(
+            [
+                self.lhs.render(context),
+                self.op,
+                *self.modifiers,
+                self.rhs.render(context),
+            ]
+        )
+
+
+Expression = (
+    Selector | Literal | FunctionCall | Parenthesized | UnaryOperation | BinaryOperation
+)
+
+
+class RenderContext:
+    """
+    Holds what should be injected into the selectors while rendering a template.
+    """
+
+    host_matcher: Optional[str]
+    offset: Optional[str]
+    at: Optional[str]
+    over_time: Optional[str]
+    window: Optional[str]
+
+    def __init__(
+        self,
+        host_matcher: Optional[str] = None,
+        offset: Optional[str] = None,
+        at: Optional[str] = None,
+        over_time: Optional[str] = None,
+        window: Optional[str] = None,
+    ):
+        self.host_matcher = host_matcher
+        self.offset = offset
+        self.at = at
+        self.over_time = over_time
+        self.window = window
+
+    def replaces(self, matcher: LabelMatcher) -> bool:
+        """
+        An injected host matcher replaces an equality matcher on the host label.
+        All other matchers are kept and combined with the injected one.
+        """
+        return (
+            self.host_matcher is not None
+            and matcher.label == "host"
+            and matcher.op == "="
+        )
+
+
+class QueryTemplate:
+    """
+    A parsed PromQL query. The query is parsed once and can then be rendered
+    many times with a host filter, a set of hosts or a time modifier injected
+    into its selectors.
+
+    Only the subset of PromQL we use in the test configs is supported: selectors,
+    function calls, aggregations with `by`/`without` and binary operators with
+    their vector matching. The injected host matcher and time modifiers apply to
+    every selector, on both sides of a binary operator.
+    """
+
+    query: str
+    _root: Expression
+
+    def __init__(self, query: str, root: Expression):
+        self.query = query
+        self._root = root
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def compile(query: str) -> "QueryTemplate":
+        """
+        Parses the query. Raises a ValueError if the query is not supported.
+        """
+        parser = _Parser(query)
+        root = parser.parse_expression()
+        parser.expect_end()
+
+        if not _selects_metric(root):
+            raise ValueError(f"Query {query} doesn't select a metric")
+
+        return QueryTemplate(query, root)
+
+    def render(
+        self,
+        host: Optional[str] = None,
+        hosts: Optional[List[str]] = None,
+        offset: Optional[str] = None,
+        at: Optional[float] = None,
+        over_time: Optional[str] = None,
+        window_s: Optional[float] = None,
+    ) -> str:
+        """
+        Renders the query.
+
+        Parameters:
+        host: str
+            Selects only this host.
+        hosts: List[str]
+            Selects only these hosts (with a regex matcher).
+        offset: str
+            A duration, i.e. `5m`, that is set as offset modifier of the selectors.
+        at: float
+            A timestamp that is set as `@` modifier of the selectors.
+        over_time: str
+            Aggregates the selectors over the window, i.e. `avg` wraps them
+            into `avg_over_time(...[window])`.
+        window_s: float
+            The length of the window in seconds, required with `over_time`.
+        """
+        if over_time is not None and window_s is None:
+            raise ValueError("over_time needs a window")
+        host_matcher = None
+        if host is not None:
+            host_matcher = f"host={_quote(host)}"
+        elif hosts is not None:
+            host_matcher = host_set_matcher(hosts)
+
+        return self._root.render(
+            RenderContext(
+                host_matcher=host_matcher,
+                offset=offset,
+                at=None if at is None else f"{at:.3f}",
+                over_time=over_time,
+                window=None if window_s is None else _duration(window_s),
+            )
+        )
+
+
+def host_set_matcher(hosts: List[str]) -> str:
+    """
+    Builds a regex host matcher that selects all the given hosts in one query.
+    """
+    return f"host=~{_quote('|'.join(re.escape(host) for host in hosts))}"
+
+
+def _selects_metric(expression: Expression) -> bool:
+    if isinstance(expression, Selector):
+        return True
+    if isinstance(expression, FunctionCall):
+        return any(_selects_metric(arg) for arg in expression.args)
+    if isinstance(expression, Parenthesized):
+        return _selects_metric(expression.expression)
+    if isinstance(expression, UnaryOperation):
+        return _selects_metric(expression.operand)
+    if isinstance(expression, BinaryOperation):
+        return _selects_metric(expression.lhs) or _selects_metric(expression.rhs)
+    return False
+
+
+def _duration(seconds: float) -> str:
+    """
+    Millisecond precision, such that the window matches the tick exactly.
+    """
+    milliseconds = max(int(round(seconds * 1000)), 1)
+    if milliseconds % 1000 == 0:
+        return f"{milliseconds // 1000}s"
+    return f"{milliseconds}ms"
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+class _Parser:
+    """
+    A recursive descent parser over the tokens of the query.
+    """
+
+    def __init__(self, query: str):
+        self._query = query
+        self._tokens = _Parser._tokenize(query)
+        self._position = 0
+
+    def _tokenize(query: str) -> list[tuple[str, str]]:
+        tokens = []
+        position = 0
+        query = query.rstrip()
+        while position < len(query):
+            match = _TOKEN_PATTERN.match(query, position)
+            if match is None or match.end() == position:
+                raise ValueError(f"Unexpected character at {position} in {query}")
+            tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            position = match.end()
+        return tokens
+
+    def _peek(self, offset: int = 0) -> tuple[Optional[str], Optional[str]]:
+        if self._position + offset < len(self._tokens):
+            return self._tokens[self._position + offset]
+        return None, None
+
+    def _next(self) -> tuple[Optional[str], Optional[str]]:
+        token = self._peek()
+        self._position += 1
+        return token
+
+    def _expect(self, value: str) -> None:
+        _, actual = self._next()
+        if actual != value:
+            raise ValueError(f"Expected '{value}' but got '{actual}' in {self._query}")
+
+    def expect_end(self) -> None:
+        if self._position < len(self._tokens):
+            raise ValueError(
+                f"Unsupported expression '{self._peek()[1]}' in {self._query}"
+            )
+
+    def parse_expression(self, min_precedence: int = 1) -> Expression:
+        """
+        Parses the operators that bind at least as strong as `min_precedence` by
+        precedence climbing.
+        """
+        lhs = self._parse_unary()
+
+        while True:
+            kind, op = self._peek()
+            precedence = _BINARY_OPERATORS.get(op) if kind in ("op", "ident") else None
+            if precedence is None or precedence < min_precedence:
+                return lhs
+            self._next()
+
+            modifiers = self._parse_binary_modifiers(op)
+            rhs = self.parse_expression(precedence if op == "^" else precedence + 1)
+            lhs = BinaryOperation(op, lhs, rhs, modifiers)
+
+    def _parse_binary_modifiers(self, op: str) -> List[str]:
+        """
+        Parses the `bool` of a comparison and the vector matching after an operator,
+        they are kept as written.
+        """
+        modifiers = []
+        if op in _COMPARISON_OPERATORS and self._peek()[1] == "bool":
+            modifiers.append(self._next()[1])
+        if self._peek()[1] in _VECTOR_MATCHING_KEYWORDS:
+            keyword, labels = self._parse_grouping()
+            modifiers.append(f"{keyword} ({', '.join(labels)})")
+            if self._peek()[1] in _GROUP_MODIFIERS:
+                _, modifier = self._next()
+                if self._peek()[1] == "(":
+                    labels = self._parse_labels()
+                    modifier += f" ({', '.join(labels)})"
+                modifiers.append(modifier)
+        return modifiers
+
+    def _parse_unary(self) -> Expression:
+        kind, value = self._peek()
+        if kind == "op" and value in ("-", "+"):
+            self._next()
+            # Binds weaker than `^`, i.e. -2 ^ 2 is -(2 ^ 2)
+            return UnaryOperation(value, self.parse_expression(_BINARY_OPERATORS["^"]))
+        return self._parse_primary()
+
+    def _parse_primary(self) -> Expression:
+        kind, value = self._peek()
+
+        if value == "(":
+            self._next()
+            expression = self.parse_expression()
+            self._expect(")")
+            return Parenthesized(expression)
+
+        if kind in ("number", "string"):
+            self._next()
+            return Literal(value)
+
+        if kind == "ident":
+            next_kind, next_value = self._peek(1)
+            if next_value == "(" or (
+                next_kind == "ident" and next_value in _GROUPING_KEYWORDS
+            ):
+                return self._parse_call()
+            return self._parse_selector()
+
+        if value == "{":
+            return self._parse_selector()
+
+        raise ValueError(f"Unexpected '{value}' in {self._query}")
+
+    def _parse_call(self) -> FunctionCall:
+        _, name = self._next()
+
+        grouping = None
+        grouping_first = False
+        if self._peek()[1] in _GROUPING_KEYWORDS:
+            grouping = self._parse_grouping()
+            grouping_first = True
+
+        self._expect("(")
+        args = []
+        if self._peek()[1] != ")":
+            args.append(self.parse_expression())
+            while self._peek()[1] == ",":
+                self._next()
+                args.append(self.parse_expression())
+        self._expect(")")
+
+        if grouping is None and self._peek()[1] in _GROUPING_KEYWORDS:
+            grouping = self._parse_grouping()
+
+        return FunctionCall(name, args, grouping, grouping_first)
+
+    def _parse_grouping(self) -> tuple[str, List[str]]:
+        _, keyword = self._next()
+        return keyword, self._parse_labels()
+
+    def _parse_labels(self) -> List[str]:
+        self._expect("(")
+        labels = []
+        while self._peek()[1] != ")":
+            kind, label = self._next()
+            if kind != "ident":
+                raise ValueError(f"Expected a label but got '{label}' in {self._query}")
+            labels.append(label)
+            if self._peek()[1] == ",":
+                self._next()
+        self._expect(")")
+        return labels
+
+    def _parse_selector(self) -> Selector:
+        metric = None
+        if self._peek()[0] == "ident":
+            _, metric = self._next()
+
+        matchers = []
+        if self._peek()[1] == "{":
+            self._next()
+            while self._peek()[1] != "}":
+                kind, label = self._next()
+                op_kind, op = self._next()
+                value_kind, value = self._next()
+                if kind != "ident" or op_kind != "op" or value_kind != "string":
+                    raise ValueError(f"Invalid label matcher in {self._query}")
+                matchers.append(LabelMatcher(label, op, value))
+                if self._peek()[1] == ",":
+                    self._next()
+            self._expect("}")
+
+        if metric is None and not matchers:
+            raise ValueError(f"Empty selector in {self._query}")
+
+        range = None
+        if self._peek()[1] == "[":
+            self._next()
+            range = ""
+            while self._peek()[1] != "]":
+                kind, value = self._next()
+                if kind is None:
+                    raise ValueError(f"Unclosed range in {self._query}")
+                range += value
+            self._expect("]")
+
+        offset = None
+        at = None
+        while self._peek()[1] in ("offset", "@"):
+            _, modifier = self._next()
+            _, value = self._next()
+            if value == "-":
+                # A negative offset
+                value += self._next()[1]
+            if modifier == "offset":
+                offset = value
+            else:
+                at = value
+
+        return Selector(metric, matchers, range, offset, at)
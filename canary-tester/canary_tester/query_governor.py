@@ -0,0 +1,190 @@
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+from typing import Iterator, Optional
+
+import requests
+
+from canary_tester.metrics import THANOS_GOVERNOR_WAIT_SECONDS
+from canary_tester.types import GlobalConfig, QueryPriority
+
+# Status codes with which the querier (or a proxy in front of it) tells us to slow down.
+THROTTLE_STATUS_CODES = (429, 503)
+
+# On every throttled response the rate is halved, down to this fraction of the
+# configured rate. Every successful response recovers the rate by _RATE_RECOVERY.
+_MIN_RATE_FACTOR = 1 / 32
+_RATE_RECOVERY = 0.05
+
+# Without a Retry-After header we pause for this time divided by the rate factor.
+_BASE_BACKOFF_S = 0.5
+_MAX_BACKOFF_S = 30
+
+_shared: Optional["QueryGovernor"] = None
+_shared_lock = threading.Lock()
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """
+    Raised instead of sending a query when the deadline of the tick has passed.
+    """
+
+
+class QueryGovernor:
+    """
+    A token bucket with a limit of in-flight requests that every thanos query of the
+    process goes through. Waiting queries are served by priority (enricher before
+    tests before backfill) and in arrival order within the same priority.
+
+    When the querier answers with 429 or 503 the rate is halved and all queries are
+    paused for the Retry-After time, successful responses slowly recover the rate.
+
+    Parameters:
+    qps: float
+        The max queries per second, 0 disables the rate limit.
+    max_in_flight: int
+        The max number of queries that run at the same time, 0 disables the limit.
+    """
+
+    _qps: float
+    _max_in_flight: int
+    _tokens: float
+    _last_refill: float
+    _in_flight: int
+    _rate_factor: float
+    _paused_until: float
+    _waiting: list[tuple[int, int]]
+    _sequence: Iterator[int]
+    _condition: threading.Condition
+
+    def __init__(self, qps: float, max_in_flight: int):
+        self._qps = qps
+        self._max_in_flight = max_in_flight
+        self._tokens = max(qps, 1)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._rate_factor = 1.0
+        self._paused_until = 0.0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def shared(global_config: GlobalConfig) -> "QueryGovernor":
+        """
+        Returns the governor of the process, it is created with the limits of the
+        first global config it is asked for.
+        """
+        global _shared
+        with _shared_lock:
+            if _shared is None:
+                _shared = QueryGovernor(
+                    global_config.THANOS_MAX_QPS, global_config.THANOS_MAX_IN_FLIGHT
+                )
+            return _shared
+
+    @contextlib.contextmanager
+    def slot(self, priority: QueryPriority, deadline: Optional[float] = None):
+        """
+        Blocks until the query may be sent and holds an in-flight slot until the
+        block is left. Raises DeadlineExceeded if the query can't be sent before the
+        `time.monotonic()` `deadline`.
+        """
+        start = time.perf_counter()
+        self._acquire(priority, deadline)
+        THANOS_GOVERNOR_WAIT_SECONDS.labels(priority.name).observe(
+            time.perf_counter() - start
+        )
+        try:
+            yield
+        finally:
+            self._release()
+
+    def report(self, status_code: int, retry_after: Optional[str] = None) -> float:
+        """
+        Adapts the rate to the response of the querier. Returns the backoff in seconds
+        if the response was throttled, otherwise 0.
+        """
+        with self._condition:
+            if status_code not in THROTTLE_STATUS_CODES:
+                self._rate_factor = min(self._rate_factor + _RATE_RECOVERY, 1.0)
+                return 0
+
+            self._rate_factor = max(self._rate_factor / 2, _MIN_RATE_FACTOR)
+            backoff = QueryGovernor._parse_retry_after(retry_after)
+            if backoff is None:
+                backoff = min(_BASE_BACKOFF_S / self._rate_factor, _MAX_BACKOFF_S)
+
+            self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+            self._condition.notify_all()
+            return backoff
+
+    def _acquire(self, priority: QueryPriority, deadline: Optional[float]) -> None:
+        with self._condition:
+            ticket = (priority.value, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                is_next = self._waiting[0] == ticket
+                if is_next and wait == 0:
+                    break
+                # Only the next query in line waits for tokens, all others wait
+                # until it got sent.
+                timeout = wait if is_next else None
+                if deadline is not None:
+                    if deadline <= now:
+                        self._waiting.remove(ticket)
+                        heapq.heapify(self._waiting)
+                        # The query behind it may be next in line now
+                        self._condition.notify_all()
+                        raise DeadlineExceeded("deadline exceeded in the governor")
+                    timeout = (
+                        deadline - now
+                        if timeout is None
+                        else min(timeout, deadline - now)
+                    )
+                self._condition.wait(timeout=timeout)
+
+            heapq.heappop(self._waiting)
+            if self._qps > 0:
+                self._tokens -= 1
+            self._in_flight += 1
+            self._condition.notify_all()
+
+    def _release(self) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _wait_time(self, now: float) -> Optional[float]:
+        """
+        Returns how long to wait until the next query may be sent, None if it has to
+        wait for an in-flight query to finish.
+        """
+        if self._max_in_flight > 0 and self._in_flight >= self._max_in_flight:
+            return None
+
+        if self._paused_until > now:
+            return self._paused_until - now
+
+        if self._qps <= 0:
+            return 0
+
+        rate = self._qps * self._rate_factor
+        self._tokens = min(
+            self._tokens + (now - self._last_refill) * rate, max(self._qps, 1)
+        )
+        self._last_refill = now
+
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / rate
+
+    def _parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+        try:
+            return min(max(float(retry_after), 0), _MAX_BACKOFF_S)
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,115 @@
+import math
+import time
+from typing import Optional
+
+from canary_tester.types import QueryAccuracy
+
+# Thanos compacts raw blocks into 5m resolution blocks after 40 hours and
+# into 1h resolution blocks after 10 days.
+_DOWNSAMPLED_RESOLUTIONS = [
+    (3600, 10 * 24 * 3600, "1h"),
+    (300, 40 * 3600, "5m"),
+]
+
+# The number of points we aim for in a range query.
+_TARGET_POINTS = {
+    QueryAccuracy.Exact: 11_000,  # The max number of points thanos returns
+    QueryAccuracy.Balanced: 1_000,
+    QueryAccuracy.Coarse: 250,
+}
+
+# We accept a source resolution up to this factor times the step.
+_RESOLUTION_FACTOR = {
+    QueryAccuracy.Exact: 0,
+    QueryAccuracy.Balanced: 1,
+    QueryAccuracy.Coarse: 5,
+}
+
+
+class QueryPlan:
+    """
+    The parameters the planner picked for a single query.
+    """
+
+    step: int
+    max_source_resolution: str
+    partial_response: bool
+
+    def __init__(self, step: int, max_source_resolution: str, partial_response: bool):
+        self.step = step
+        self.max_source_resolution = max_source_resolution
+        self.partial_response = partial_response
+
+    def apply(self, params: dict, range_query: bool = True) -> dict:
+        """
+        Returns a copy of the query params with the planned parameters set.
+        """
+        planned = dict(params)
+        if range_query:
+            planned["step"] = str(self.step)
+        planned["max_source_resolution"] = self.max_source_resolution
+        planned["partial_response"] = "true" if self.partial_response else "false"
+        return planned
+
+    def __eq__(self, value: object) -> bool:
+        return (
+            isinstance(value, QueryPlan)
+            and self.step == value.step
+            and self.max_source_resolution == value.max_source_resolution
+            and self.partial_response == value.partial_response
+        )
+
+    def __str__(self):
+        return (
+            f"step: {self.step}, max_source_resolution: {self.max_source_resolution},"
+            f" partial_response: {self.partial_response}"
+        )
+
+
+class QueryPlanner:
+    """
+    Picks the step, the max source resolution and whether partial responses are
+    allowed for a query, based on the length of the window, the age of the data and
+    the accuracy the test needs. Long historical windows are read from the 5m or 1h
+    downsampled blocks instead of the raw data.
+    """
+
+    def plan(
+        start: float,
+        end: float,
+        accuracy: QueryAccuracy = QueryAccuracy.Balanced,
+        min_step: int = 1,
+        now: Optional[float] = None,
+    ) -> QueryPlan:
+        """
+        Parameters:
+        start: float
+            Start of the queried window.
+        end: float
+            End of the queried window.
+        accuracy: QueryAccuracy
+            How accurate the data has to be.
+        min_step: int
+            The smallest step that makes sense for the metric.
+        now: float
+            The current time, defaults to the wall clock.
+        """
+        if now is None:
+            now = time.time()
+
+        window = max(end - start, 0)
+        age = now - end
+
+        step = max(min_step, math.ceil(window / _TARGET_POINTS[accuracy]), 1)
+
+        max_source_resolution = "0s"
+        for resolution, min_age, name in _DOWNSAMPLED_RESOLUTIONS:
+            if age >= min_age and resolution <= step * _RESOLUTION_FACTOR[accuracy]:
+                max_source_resolution = name
+                break
+
+        return QueryPlan(
+            step=step,
+            max_source_resolution=max_source_resolution,
+            partial_response=accuracy == QueryAccuracy.Coarse,
+        )
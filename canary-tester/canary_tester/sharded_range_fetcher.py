@@ -0,0 +1,121 @@
+import concurrent.futures
+import math
+from typing import Optional
+
+from canary_tester.query_planner import QueryPlan
+from canary_tester.thanos_client import ThanosClient
+from canary_tester.types import GlobalConfig, QueryPriority
+
+
+class ShardedRangeFetcher:
+    """
+    Splits a long range query into aligned sub-ranges that are fetched concurrently
+    and stitches the series back together. A long window therefore never ends up in
+    one big `query_range` that runs into the querier timeout.
+
+    The shards are aligned to the step of the query, such that the evaluation
+    timestamps are the same as the ones of the unsharded query. Adjacent shards
+    share their boundary timestamp, the duplicated samples are removed when the
+    series are stitched.
+
+    Parameters:
+    thanos: ThanosClient
+        The client used for the shard queries.
+    global_config: GlobalConfig
+        The global config, it defines the max length of a shard and how many
+        shards are fetched at the same time.
+    """
+
+    _thanos: ThanosClient
+    _global_config: GlobalConfig
+
+    def __init__(self, thanos: ThanosClient, global_config: GlobalConfig):
+        self._thanos = thanos
+        self._global_config = global_config
+
+    def fetch(
+        self,
+        params: dict,
+        plan: Optional[QueryPlan] = None,
+        priority: Optional[QueryPriority] = None,
+        deadline: Optional[float] = None,
+    ) -> dict:
+        """
+        Runs the range query defined by `params` (with `start` and `end`) and returns
+        the same json as the unsharded query would. All shards have to be answered
+        by the `time.monotonic()` `deadline`, if set.
+        """
+        step = plan.step if plan is not None else int(params.get("step", 1))
+        shards = ShardedRangeFetcher.split(
+            float(params["start"]),
+            float(params["end"]),
+            step,
+            self._global_config.RANGE_FETCH_SHARD_S,
+        )
+
+        if len(shards) == 1:
+            return self._thanos.query_range(params, plan, priority, deadline)
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._global_config.RANGE_FETCH_MAX_WORKERS
+        ) as executor:
+            responses = list(
+                executor.map(
+                    lambda shard: self._thanos.query_range(
+                        {**params, "start": shard[0], "end": shard[1]},
+                        plan,
+                        priority,
+                        deadline,
+                    ),
+                    shards,
+                )
+            )
+
+        return {
+            "status": "success",
+            "data": {
+                "resultType": "matrix",
+                "result": ShardedRangeFetcher.stitch(
+                    [res["data"]["result"] for res in responses]
+                ),
+            },
+        }
+
+    def split(
+        start: float, end: float, step: int, shard_s: int
+    ) -> list[tuple[float, float]]:
+        """
+        Splits [start, end] into shards whose length is a multiple of the step.
+        """
+        shard_length = max(math.ceil(shard_s / step), 1) * step
+
+        shards = []
+        shard_start = start
+        while True:
+            shard_end = min(shard_start + shard_length, end)
+            shards.append((shard_start, shard_end))
+            if shard_end >= end:
+                return shards
+            shard_start = shard_end
+
+    def stitch(results: list[list[dict]]) -> list[dict]:
+        """
+        Merges the series of all shards by their labels and removes the samples
+        that are duplicated at the shard boundaries.
+        """
+        series: dict[frozenset, dict] = {}
+
+        for result in results:
+            for el in result:
+                key = frozenset(el["metric"].items())
+                merged = series.setdefault(key, {"metric": el["metric"], "values": {}})
+                for ts, value in el["values"]:
+                    merged["values"][ts] = value
+
+        return [
+            {
+                "metric": el["metric"],
+                "values": [[ts, value] for ts, value in sorted(el["values"].items())],
+            }
+            for el in series.values()
+        ]
@@ -1,4 +1,5 @@
 from typing import List
+from canary_tester.interner import VERSION_CODES
 from canary_tester.types import VersionEnrichedStandardScalarMetric
 
 import random
@@ -45,8 +46,9 @@ class AlertGroupBalancer:
                 filter(lambda x: x != version_under_test, frequencies.keys())
             )
         else:
+            control_group = set(control_group_versions)
             other_versions = list(
-                filter(lambda x: x in control_group_versions, frequencies.keys())
+                filter(lambda x: x in control_group, frequencies.keys())
             )
 
         other_versions_count = sum([frequencies[el] for el in other_versions])
@@ -54,14 +56,17 @@ class AlertGroupBalancer:
         filtred_data_version_under_test = []
         filtered_data_other_versions = []
 
+        # Compare the interned codes instead of the version strings per metric
+        version_under_test_code = VERSION_CODES.code(version_under_test)
+
         for metric in enriched_data:
             if (
-                metric.version == version_under_test
+                metric.version_code == version_under_test_code
                 and random.randint(1, version_under_test_count) <= other_versions_count
             ):
                 filtred_data_version_under_test.append(metric)
             elif (
-                metric.version != version_under_test
+                metric.version_code != version_under_test_code
                 and random.randint(1, other_versions_count) <= version_under_test_count
             ):
                 filtered_data_other_versions.append(metric)
@@ -0,0 +1,113 @@
+import functools
+from typing import Optional
+
+import numpy as np
+import scipy as sp
+
+from canary_tester.types import AlphaSpending
+
+# The rho of each spending function if the test doesn't configure one.
+DEFAULT_RHO = {
+    AlphaSpending.OBrienFleming: 0.5,
+    AlphaSpending.Pocock: 1.0,
+    AlphaSpending.PowerFamily: 3.0,
+}
+
+
+class AlphaSpendingSchedule:
+    """
+    The significance level a test compares its p-values against at each peek. The
+    boundaries only depend on the spending function and its parameters, so the
+    vector over all peeks is computed once and shared by all testers with the same
+    configuration.
+
+    Parameters:
+    function: AlphaSpending
+        The spending function.
+    total_peeks: int
+        The total number of times we want to peek the data.
+    alpha: float
+        The significance level of the test.
+    rho: float
+        The parameter of the spending function, see DEFAULT_RHO.
+    max_samples: int
+        If set, the alpha is spent by the information fraction
+        samples / max_samples instead of by the peek index.
+    """
+
+    function: AlphaSpending
+    total_peeks: int
+    alpha: float
+    rho: float
+    max_samples: Optional[int]
+    _boundaries: tuple[float, ...]
+
+    def __init__(
+        self,
+        function: AlphaSpending,
+        total_peeks: int,
+        alpha: float,
+        rho: Optional[float] = None,
+        max_samples: Optional[int] = None,
+    ):
+        self.function = function
+        self.total_peeks = max(total_peeks, 1)
+        self.alpha = alpha
+        self.rho = rho if rho is not None else DEFAULT_RHO[function]
+        self.max_samples = max_samples if max_samples and max_samples > 0 else None
+        self._boundaries = AlphaSpendingSchedule.boundaries(
+            function, self.total_peeks, alpha, self.rho
+        )
+
+    def alpha_at(self, current_peek: int, samples: int = 0) -> float:
+        """
+        Returns the alpha of the peek (between 1 and total_peeks). With max_samples
+        the information fraction of the samples is used instead, the last peek
+        always spends the full alpha.
+        """
+        if self.max_samples is None or current_peek >= self.total_peeks:
+            return self._boundaries[min(max(current_peek, 1), self.total_peeks) - 1]
+
+        t = min(samples / self.max_samples, 1.0)
+        return float(
+            AlphaSpendingSchedule.spend(
+                self.function, np.array([t]), self.alpha, self.rho
+            )[0]
+        )
+
+    @functools.lru_cache(maxsize=256)
+    def boundaries(
+        function: AlphaSpending, total_peeks: int, alpha: float, rho: float
+    ) -> tuple[float, ...]:
+        """
+        Returns the alpha of every peek 1..total_peeks at equally spaced peeks.
+        """
+        t = np.arange(1, total_peeks + 1) / total_peeks
+        return tuple(AlphaSpendingSchedule.spend(function, t, alpha, rho).tolist())
+
+    def spend(
+        function: AlphaSpending, t: np.ndarray, alpha: float, rho: float
+    ) -> np.ndarray:
+        """
+        Returns the alpha spent up to the information fractions t in (0, 1].
+
+        - O'Brien-Fleming: https://www.jstor.org/stable/2530245, rho=0.5 seems like
+          the optimal https://www.jstor.org/stable/2531959
+        - Pocock (Lan-DeMets): alpha * ln(1 + (e - 1) * t)
+        - Power family (Kim-DeMets): alpha * t^rho
+        """
+        t = np.clip(t, np.finfo(float).tiny, 1.0)
+
+        match function:
+            case AlphaSpending.OBrienFleming:
+                return 4 - 4 * sp.stats.norm.cdf(
+                    AlphaSpendingSchedule._z(alpha) / t ** (rho / 2)
+                )
+            case AlphaSpending.Pocock:
+                return alpha * np.log(1 + (np.e - 1) * t)
+            case AlphaSpending.PowerFamily:
+                return alpha * t**rho
+
+    @functools.lru_cache(maxsize=64)
+    def _z(alpha: float) -> float:
+        return float(sp.stats.norm.ppf(1 - alpha / 4))
@@ -1,7 +1,11 @@
+from typing import Union
 import scipy as sp
 import numpy as np
 import logging
 
+from canary_tester.metrics import KSTEST_DURATION, KSTEST_SAMPLE_POINTS
+from canary_tester.tester.kll_sketch import KLLSketch
+
 logger = logging.getLogger("root")
 
 
@@ -11,9 +15,19 @@ class FrequencyKSTestOneSided:
     We use the [Dvoretzky–Kiefer–Wolfowitz inequality]
     (https://en.wikipedia.org/wiki/Dvoretzky%E2%80%93Kiefer%E2%80%93Wolfowitz_inequality).
     We only consider the one-sided test, such that A <= B in distribution.
+
+    Instead of the samples, a bucket can be a KLLSketch. Its CDF is only known up
+    to the rank error epsilon of the sketch, which is added to the DKW error terms
+    such that the test stays conservative.
     """
 
-    def ci(A_bucket: list[float], B_bucket: list[float], alpha: float, avi=False):
+    @KSTEST_DURATION.labels("ci").time()
+    def ci(
+        A_bucket: Union[list[float], KLLSketch],
+        B_bucket: Union[list[float], KLLSketch],
+        alpha: float,
+        avi=False,
+    ):
         """
         Tests that A <= B in distribution.
         For the approach we've taken inspiration from Table 1 of the paper
@@ -22,15 +36,21 @@ class FrequencyKSTestOneSided:
         n_a = len(A_bucket)
         n_b = len(B_bucket)
 
-        res_a = sp.stats.ecdf(A_bucket)
-        res_b = sp.stats.ecdf(B_bucket)
-        a_y = res_a.cdf.probabilities
-        a_x = res_a.cdf.quantiles
-        b_y = res_b.cdf.probabilities
-        b_x = res_b.cdf.quantiles
+        a_x, a_y = FrequencyKSTestOneSided._ecdf(A_bucket)
+        b_x, b_y = FrequencyKSTestOneSided._ecdf(B_bucket)
 
         F_u_a, F_u_b, F_l_a, F_l_b = FrequencyKSTestOneSided._calculate_bounds(
-            a_x, a_y, b_x, b_y, n_a, n_b, alpha, avi
+            a_x,
+            a_y,
+            b_x,
+            b_y,
+            n_a,
+            n_b,
+            alpha,
+            avi,
+            FrequencyKSTestOneSided._rank_error(A_bucket),
+            FrequencyKSTestOneSided._rank_error(B_bucket),
+            FrequencyKSTestOneSided._sample_points(A_bucket, B_bucket, a_x, b_x),
         )
 
         D_u = [F_u_b[i] - F_l_a[i] for i in range(len(F_u_b))]
@@ -41,18 +61,23 @@ class FrequencyKSTestOneSided:
 
         return l_a_b, u_a_b
 
-    def p_value(A_bucket: list[float], B_bucket: list[float], avi=False):
+    @KSTEST_DURATION.labels("p_value").time()
+    def p_value(
+        A_bucket: Union[list[float], KLLSketch],
+        B_bucket: Union[list[float], KLLSketch],
+        avi=False,
+    ):
         n_a = len(A_bucket)
         n_b = len(B_bucket)
 
-        res_a = sp.stats.ecdf(A_bucket)
-        res_b = sp.stats.ecdf(B_bucket)
-        a_y = res_a.cdf.probabilities
-        a_x = res_a.cdf.quantiles
-        b_y = res_b.cdf.probabilities
-        b_x = res_b.cdf.quantiles
+        a_x, a_y = FrequencyKSTestOneSided._ecdf(A_bucket)
+        b_x, b_y = FrequencyKSTestOneSided._ecdf(B_bucket)
         min, max = np.minimum(a_x[0], b_x[0]), np.maximum(a_x[-1], b_x[-1])
-        sample_points = np.linspace(min, max, np.max([n_a, n_b]))
+        sample_points = np.linspace(
+            min,
+            max,
+            FrequencyKSTestOneSided._sample_points(A_bucket, B_bucket, a_x, b_x),
+        )
         D_ab = [
             np.maximum(
                 FrequencyKSTestOneSided._interpolate_linear(b_x, b_y, p)
@@ -62,7 +87,13 @@ class FrequencyKSTestOneSided:
             for p in sample_points
         ]
 
-        sup_D = np.linalg.norm(D_ab, np.inf)
+        # The true distance can be smaller by the rank errors of the sketches
+        sup_D = np.maximum(
+            np.linalg.norm(D_ab, np.inf)
+            - FrequencyKSTestOneSided._rank_error(A_bucket)
+            - FrequencyKSTestOneSided._rank_error(B_bucket),
+            0,
+        )
 
         if avi is True:
 
@@ -150,20 +181,63 @@ class FrequencyKSTestOneSided:
         else:
             return FrequencyKSTestOneSided.error_fn_gst(n, alpha)
 
-    def _calculate_bounds(a_x, a_y, b_x, b_y, n_a, n_b, alpha, avi=False):
+    def _ecdf(bucket: Union[list[float], KLLSketch]) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the quantiles and the probabilities of the empirical CDF."""
+        if isinstance(bucket, KLLSketch):
+            return bucket.ecdf()
+
+        res = sp.stats.ecdf(bucket)
+        return res.cdf.quantiles, res.cdf.probabilities
+
+    def _rank_error(bucket: Union[list[float], KLLSketch]) -> float:
+        """Returns how far the CDF of the bucket can be off, 0 for samples."""
+        if isinstance(bucket, KLLSketch):
+            return bucket.epsilon
+        return 0.0
+
+    def _sample_points(A_bucket, B_bucket, a_x, b_x) -> int:
+        """
+        The CDFs are compared at one point per sample, for sketches at one point per
+        kept value, such that sketches of huge groups stay cheap.
+        """
+        if isinstance(A_bucket, KLLSketch) or isinstance(B_bucket, KLLSketch):
+            points = np.max([len(a_x), len(b_x)])
+        else:
+            points = np.max([len(A_bucket), len(B_bucket)])
+        KSTEST_SAMPLE_POINTS.observe(points)
+        return points
+
+    def _calculate_bounds(
+        a_x,
+        a_y,
+        b_x,
+        b_y,
+        n_a,
+        n_b,
+        alpha,
+        avi=False,
+        eps_a=0.0,
+        eps_b=0.0,
+        n_points=None,
+    ):
         """
         Calculate the upper and lower bound of distribution of A and B based
         on their empiric distribution, as described in
         [Two-sample Kolmogorov–Smirnov test]
         (https://en.wikipedia.org/wiki/Kolmogorov%E2%80%93Smirnov_test).
+        The error terms are widened by the rank errors eps_a and eps_b of the
+        buckets, n_points overrides the number of compared points.
         """
 
         min, max = np.minimum(a_x[0], b_x[0]), np.maximum(a_x[-1], b_x[-1])
-        sample_points = np.linspace(min, max, np.max([n_a, n_b]))
+        sample_points = np.linspace(
+            min, max, n_points if n_points is not None else np.max([n_a, n_b])
+        )
         F_u_a = [
             np.minimum(
                 FrequencyKSTestOneSided._interpolate_linear(a_x, a_y, p)
-                + FrequencyKSTestOneSided._error_fn(n_a, alpha / 2, avi),
+                + FrequencyKSTestOneSided._error_fn(n_a, alpha / 2, avi)
+                + eps_a,
                 1,
             )
             for p in sample_points
@@ -171,7 +245,8 @@ class FrequencyKSTestOneSided:
         F_u_b = [
             np.minimum(
                 FrequencyKSTestOneSided._interpolate_linear(b_x, b_y, p)
-                + FrequencyKSTestOneSided._error_fn(n_b, alpha / 2, avi),
+                + FrequencyKSTestOneSided._error_fn(n_b, alpha / 2, avi)
+                + eps_b,
                 1,
             )
             for p in sample_points
@@ -179,7 +254,8 @@ class FrequencyKSTestOneSided:
         F_l_a = [
             np.maximum(
                 FrequencyKSTestOneSided._interpolate_linear(a_x, a_y, p)
-                - FrequencyKSTestOneSided._error_fn(n_a, alpha / 2, avi),
+                - FrequencyKSTestOneSided._error_fn(n_a, alpha / 2, avi)
+                - eps_a,
                 0,
             )
             for p in sample_points
@@ -187,7 +263,8 @@ class FrequencyKSTestOneSided:
         F_l_b = [
             np.maximum(
                 FrequencyKSTestOneSided._interpolate_linear(b_x, b_y, p)
-                - FrequencyKSTestOneSided._error_fn(n_b, alpha / 2, avi),
+                - FrequencyKSTestOneSided._error_fn(n_b, alpha / 2, avi)
+                - eps_b,
                 0,
             )
             for p in sample_points
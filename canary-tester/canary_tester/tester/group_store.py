@@ -0,0 +1,248 @@
+import collections
+import itertools
+from typing import List, Optional, Union
+
+import numpy as np
+
+from canary_tester.interner import HOST_CODES
+from canary_tester.tester.histogram_sketch import HistogramSketch
+from canary_tester.tester.kll_sketch import KLLSketch
+from canary_tester.tester.sample_archive import SampleArchive
+from canary_tester.types import RetentionWindow, VersionEnrichedStandardScalarMetric
+
+
+class GroupStore:
+    """
+    Holds the samples of the treatment or the control group of a tester.
+
+    Parameters:
+    skip_first: bool
+        The value of the first sample is not part of the bucket, i.e. the
+        inter-arrival time of the first alert is 0.
+    """
+
+    _skip_first: bool
+
+    def append(self, metric: VersionEnrichedStandardScalarMetric) -> None:
+        pass
+
+    def last(self) -> Optional[VersionEnrichedStandardScalarMetric]:
+        """Returns the latest added sample, None if the group is empty."""
+        pass
+
+    def bucket(self) -> Union[List[float], np.ndarray, HistogramSketch, KLLSketch]:
+        """Returns the values of the group in the form the statistic test reads."""
+        pass
+
+    def columns(self) -> Optional[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Returns the ts, the host codes (see HOST_CODES) and the values of all kept
+        samples, None if the store doesn't keep the samples.
+        """
+        return None
+
+    def close(self) -> None:
+        """Called once the test finished, releases the resources of the store."""
+        pass
+
+    def _metric_columns(metrics) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return (
+            np.fromiter((m.ts for m in metrics), dtype=np.int64),
+            np.fromiter(
+                (HOST_CODES.code(m.host_name) for m in metrics), dtype=np.int32
+            ),
+            np.fromiter((m.value for m in metrics), dtype=np.float64),
+        )
+
+
+class ListGroupStore(list, GroupStore):
+    """
+    Keeps every sample of the group.
+    """
+
+    def __init__(self, skip_first: bool = False):
+        super().__init__()
+        self._skip_first = skip_first
+
+    def last(self) -> Optional[VersionEnrichedStandardScalarMetric]:
+        return self[-1] if self else None
+
+    def bucket(self) -> List[float]:
+        return [metric.value for metric in self[1 if self._skip_first else 0 :]]
+
+    def columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return GroupStore._metric_columns(self)
+
+
+class SketchGroupStore(GroupStore):
+    """
+    Only keeps a sketch of the values (the counts of fixed bins or a quantile
+    sketch) and the latest sample, the memory of the group stays bounded no matter
+    how many samples arrive.
+
+    Parameters:
+    sketch: Union[HistogramSketch, KLLSketch]
+        The empty sketch the values are added to.
+    skip_first: bool
+        See GroupStore.
+    """
+
+    _sketch: Union[HistogramSketch, KLLSketch]
+    _last: Optional[VersionEnrichedStandardScalarMetric]
+    _size: int
+
+    def __init__(
+        self, sketch: Union[HistogramSketch, KLLSketch], skip_first: bool = False
+    ):
+        self._sketch = sketch
+        self._skip_first = skip_first
+        self._last = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, metric: VersionEnrichedStandardScalarMetric) -> None:
+        if self._size > 0 or not self._skip_first:
+            self._sketch.add(metric.value)
+        self._last = metric
+        self._size += 1
+
+    def last(self) -> Optional[VersionEnrichedStandardScalarMetric]:
+        return self._last
+
+    def bucket(self) -> Union[HistogramSketch, KLLSketch]:
+        return self._sketch
+
+
+class ArchiveGroupStore(GroupStore):
+    """
+    Appends the samples to a SampleArchive on disk and only keeps the latest sample
+    in memory. The statistic tests read a view of the memory-mapped values, so the
+    memory of the tester stays small no matter how many samples arrive.
+
+    Parameters:
+    directory: str
+        The directory of the archive.
+    skip_first: bool
+        See GroupStore.
+    """
+
+    _archive: SampleArchive
+    _last: Optional[VersionEnrichedStandardScalarMetric]
+
+    def __init__(self, directory: str, skip_first: bool = False):
+        self._archive = SampleArchive(directory)
+        self._skip_first = skip_first
+        self._last = None
+
+    def __len__(self) -> int:
+        return len(self._archive)
+
+    def append(self, metric: VersionEnrichedStandardScalarMetric) -> None:
+        self._archive.append(metric.ts, metric.host_name, metric.value)
+        self._last = metric
+
+    def last(self) -> Optional[VersionEnrichedStandardScalarMetric]:
+        return self._last
+
+    def bucket(self) -> np.ndarray:
+        return self._archive.values(1 if self._skip_first else 0)
+
+    def columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self._archive.columns()
+
+    def close(self) -> None:
+        self._archive.close()
+
+
+class WindowedGroupStore(GroupStore):
+    """
+    Only keeps the samples of the latest window in a ring buffer, the memory of the
+    group and the cost of a peek don't grow with the duration of the test. Evicting
+    a sample is O(1).
+
+    Parameters:
+    retention: RetentionWindow
+        Whether the window slides with every sample or starts over when it is full.
+    seconds: Optional[float]
+        The length of the window in seconds.
+    samples: Optional[int]
+        The max number of samples in the window, used if seconds is not set.
+    skip_first: bool
+        See GroupStore, only the very first sample of the group is skipped.
+    """
+
+    _retention: RetentionWindow
+    _seconds: Optional[float]
+    _samples: Optional[int]
+    _buffer: collections.deque
+    _window_start: Optional[int]
+    _first: Optional[VersionEnrichedStandardScalarMetric]
+    _last: Optional[VersionEnrichedStandardScalarMetric]
+
+    def __init__(
+        self,
+        retention: RetentionWindow,
+        seconds: Optional[float] = None,
+        samples: Optional[int] = None,
+        skip_first: bool = False,
+    ):
+        if not seconds and not samples:
+            raise ValueError("retention needs retention_seconds or retention_samples")
+        self._retention = retention
+        self._seconds = seconds
+        self._samples = None if seconds else samples
+        self._buffer = collections.deque(
+            maxlen=(self._samples if retention == RetentionWindow.Sliding else None)
+        )
+        self._skip_first = skip_first
+        self._window_start = None
+        self._first = None
+        self._last = None
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def append(self, metric: VersionEnrichedStandardScalarMetric) -> None:
+        if self._first is None:
+            self._first = metric
+        self._last = metric
+
+        if self._retention == RetentionWindow.Tumbling:
+            self._tumble(metric.ts)
+        elif self._seconds:
+            # The metrics arrive about in order of time, a late one is evicted as
+            # soon as it is at the front of the buffer.
+            while self._buffer and self._buffer[0].ts <= metric.ts - self._seconds:
+                self._buffer.popleft()
+
+        self._buffer.append(metric)
+
+    def last(self) -> Optional[VersionEnrichedStandardScalarMetric]:
+        return self._last
+
+    def bucket(self) -> List[float]:
+        skip = (
+            1
+            if self._skip_first and self._buffer and self._buffer[0] is self._first
+            else 0
+        )
+        return [metric.value for metric in itertools.islice(self._buffer, skip, None)]
+
+    def columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return GroupStore._metric_columns(self._buffer)
+
+    def _tumble(self, ts: int) -> None:
+        """Starts a new window if the sample doesn't fit into the current one."""
+        if self._seconds:
+            if self._window_start is None:
+                self._window_start = ts
+            elif ts >= self._window_start + self._seconds:
+                # Windows without samples are skipped
+                self._window_start += (
+                    (ts - self._window_start) // self._seconds
+                ) * self._seconds
+                self._buffer.clear()
+        elif len(self._buffer) >= self._samples:
+            self._buffer.clear()
@@ -0,0 +1,75 @@
+import bisect
+from typing import List, Optional
+
+import numpy as np
+
+
+class HistogramSketch:
+    """
+    Counts the samples of a group in fixed bins, such that the memory of the group
+    doesn't grow with the number of samples. Bin 0 holds the samples below
+    edges[0], bin i the samples in [edges[i - 1], edges[i]) and the last bin the
+    samples from edges[-1] on. Sketches with the same edges can be merged.
+
+    Parameters:
+    edges: List[float]
+        The ascending bin edges.
+    """
+
+    edges: np.ndarray
+    counts: np.ndarray
+    _edges: List[float]
+    _sum: float
+
+    def __init__(self, edges: List[float]):
+        self._edges = sorted(float(edge) for edge in edges)
+        self.edges = np.array(self._edges)
+        self.counts = np.zeros(len(self._edges) + 1, dtype=np.int64)
+        self._sum = 0.0
+
+    def log_spaced(min_value: float, max_value: float, bins: int) -> "HistogramSketch":
+        """
+        Returns a sketch with `bins` log-spaced bins between min_value and
+        max_value, every bin has the same relative width.
+        """
+        return HistogramSketch(np.geomspace(min_value, max_value, bins + 1).tolist())
+
+    def __len__(self) -> int:
+        return int(self.counts.sum())
+
+    @property
+    def mean(self) -> float:
+        """The exact mean of the added samples."""
+        n = len(self)
+        return self._sum / n if n > 0 else float("nan")
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_right(self._edges, value)] += 1
+        self._sum += value
+
+    def merge(self, other: "HistogramSketch") -> "HistogramSketch":
+        """Returns a sketch with the samples of both sketches."""
+        if self._edges != other._edges:
+            raise ValueError("Only sketches with the same bin edges can be merged")
+
+        merged = HistogramSketch(self._edges)
+        merged.counts = self.counts + other.counts
+        merged._sum = self._sum + other._sum
+        return merged
+
+    def cdf_bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the empirical CDF at the lower and at the upper end of every bin.
+        Within bin i the CDF lies between lower[i] and upper[i].
+        """
+        upper = np.cumsum(self.counts) / max(len(self), 1)
+        lower = np.concatenate(([0.0], upper[:-1]))
+        return lower, upper
+
+    def occupied(self, other: Optional["HistogramSketch"] = None) -> slice:
+        """Returns the range of bins that hold samples of this or the other sketch."""
+        counts = self.counts if other is None else self.counts + other.counts
+        nonzero = np.flatnonzero(counts)
+        if len(nonzero) == 0:
+            return slice(0, 0)
+        return slice(int(nonzero[0]), int(nonzero[-1]) + 1)
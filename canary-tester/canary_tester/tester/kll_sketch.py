@@ -0,0 +1,146 @@
+import math
+import random
+from typing import List
+
+import numpy as np
+
+# Capacity ratio between two neighbouring levels
+_C = 2 / 3
+
+# The probability with which the rank error of a value may exceed `epsilon`
+_DELTA = 1e-6
+
+
+class KLLSketch:
+    """
+    A KLL quantile sketch (https://arxiv.org/abs/1603.05346). It keeps at most about
+    3 * k samples, each standing in for 2^level samples of the group. Sketches can
+    be merged.
+
+    Every compaction at level h moves the rank of any value by +2^h, -2^h or not
+    at all, with mean 0 thanks to the random offset. By Hoeffding's inequality the
+    rank error of a value exceeds `epsilon` with probability at most 1e-6, the
+    tests add it to their error terms to stay conservative.
+
+    Parameters:
+    k: int
+        The capacity of the top level, the rank error shrinks with 1 / k.
+    seed: int
+        Seed of the coin flips of the compactions.
+    """
+
+    k: int
+    n: int
+    _levels: List[List[float]]
+    _size: int
+    _capacities: List[int]
+    _max_size: int
+    _squared_weights: int
+    _sum: float
+    _random: random.Random
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.n = 0
+        self._levels = [[]]
+        self._size = 0
+        self._update_capacities()
+        self._squared_weights = 0
+        self._sum = 0.0
+        self._random = random.Random(seed)
+
+    def __len__(self) -> int:
+        return self.n
+
+    @property
+    def mean(self) -> float:
+        """The exact mean of the added samples."""
+        return self._sum / self.n if self.n > 0 else float("nan")
+
+    @property
+    def epsilon(self) -> float:
+        """The error bound of the normalized rank of a value."""
+        if self.n == 0:
+            return 0.0
+        return math.sqrt(2 * self._squared_weights * math.log(2 / _DELTA)) / self.n
+
+    @property
+    def size(self) -> int:
+        """The number of kept samples."""
+        return self._size
+
+    def add(self, value: float) -> None:
+        self._levels[0].append(value)
+        self.n += 1
+        self._sum += value
+        self._size += 1
+        if self._size > self._max_size:
+            self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """Returns a sketch with the samples of both sketches."""
+        merged = KLLSketch(max(self.k, other.k))
+        for level in range(max(len(self._levels), len(other._levels))):
+            if level >= len(merged._levels):
+                merged._levels.append([])
+            for sketch in (self, other):
+                if level < len(sketch._levels):
+                    merged._levels[level].extend(sketch._levels[level])
+        merged.n = self.n + other.n
+        merged._sum = self._sum + other._sum
+        merged._size = self._size + other._size
+        merged._squared_weights = self._squared_weights + other._squared_weights
+        merged._update_capacities()
+        merged._compress()
+        return merged
+
+    def ecdf(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the distinct kept values and the estimated CDF at them, like
+        `scipy.stats.ecdf(...).cdf.quantiles` and `.probabilities`.
+        """
+        values = np.array([v for level in self._levels for v in level])
+        weights = np.array(
+            [2**h for h, level in enumerate(self._levels) for _ in level]
+        )
+        order = np.argsort(values, kind="stable")
+        values, cumulative = values[order], np.cumsum(weights[order])
+
+        # Keep the last (highest) CDF of duplicated values
+        last = np.append(values[1:] != values[:-1], True)
+        return values[last], cumulative[last] / self.n
+
+    def _update_capacities(self) -> None:
+        """The capacity of a level shrinks with its distance to the top level."""
+        depth = len(self._levels)
+        self._capacities = [
+            max(int(math.ceil(self.k * _C ** (depth - h - 1))), 2) for h in range(depth)
+        ]
+        self._max_size = sum(self._capacities)
+
+    def _compress(self) -> None:
+        while self._size > self._max_size:
+            for h, level in enumerate(self._levels):
+                if len(level) >= self._capacities[h]:
+                    self._compact(h)
+                    break
+
+    def _compact(self, h: int) -> None:
+        """
+        Promotes every second sample of the sorted level to the level above, they
+        then stand in for twice as many samples.
+        """
+        if h + 1 == len(self._levels):
+            self._levels.append([])
+            self._update_capacities()
+
+        level = sorted(self._levels[h])
+        # An odd sample stays in the level
+        keep = [level.pop()] if len(level) % 2 == 1 else []
+        offset = self._random.randint(0, 1)
+
+        promoted = level[offset::2]
+        self._levels[h + 1].extend(promoted)
+        self._levels[h] = keep
+        self._size -= len(level) - len(promoted)
+        self._squared_weights += 4**h
@@ -1,25 +1,27 @@
-import re
-from typing import List, override
+from typing import List, Optional, override
 from dotenv import load_dotenv
 import logging
-import requests
-import datetime as dt
-import concurrent.futures
 
 from canary_tester.helper import is_float_castable
+from canary_tester.metrics import TICK_STAGE_DURATION
+from canary_tester import tracing
+from canary_tester.query_planner import QueryPlanner
 from canary_tester.types import (
     ComparisonDirection,
     GlobalConfig,
+    PredictableFetchMode,
+    QueryAccuracy,
     StandardScalarMetric,
     TesterReturn,
     TesterReturnReason,
     TesterReturnType,
     VersionEnrichedStandardScalarMetric,
 )
-from canary_tester.version_enricher import VersionEnricher
+from canary_tester.version_enricher import VersionEnricher, VersionSnapshot
 from canary_tester.config_loader.schema import SingleTestConfigType
 from canary_tester.tester.tester import Tester
 from canary_tester.tester.statistic_tests import BaseStatisticTest
+from canary_tester.tester.version_change_fetcher import VersionChangeFetcher
 
 logger = logging.getLogger("root")
 
@@ -35,8 +37,16 @@ class PredictableArrivalTester(Tester):
 
     This test is intended to be used for metrics that have approximately uniform
     arrival times and are scalar values(i.e disk space, cpu usage, etc.)
+
+    With `fetch_mode: Instant` (default) the current value of every host is
+    fetched at each tick instead and with `fetch_mode: Aggregated` the value of
+    every host aggregated over the tick.
     """
 
+    _default_query_accuracy = QueryAccuracy.Balanced
+    _fetch_mode: PredictableFetchMode
+    _version_change_fetcher: VersionChangeFetcher
+
     def __init__(
         self,
         version_under_test: str,
@@ -56,92 +66,77 @@ class PredictableArrivalTester(Tester):
             statistic_test=statistic_test,
             global_config=global_config,
         )
+        self._fetch_mode = PredictableFetchMode.from_str(
+            test_config.get("fetch_mode", "Instant")
+        )
+        self._version_change_fetcher = VersionChangeFetcher(
+            test_config.get("query", ""),
+            global_config,
+            self._thanos,
+            self._query_accuracy,
+        )
 
-    def _fetch_host(self, host: str, version_change_ts: float):
-        before_start = (
-            dt.datetime.fromtimestamp(version_change_ts)
-            - dt.timedelta(
-                seconds=self._global_config.PREDICTABLE_ARRIVAL_TESTER_MONITORING_TIME
-                + self._global_config.PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME
-            )
-        ).timestamp()
-        before_end = (
-            dt.datetime.fromtimestamp(version_change_ts)
-            - dt.timedelta(
-                seconds=self._global_config.PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME
-            )
-        ).timestamp()
+    def _fetch_version_changes(
+        self,
+        previous_timestamp: float,
+        current_timestamp: float,
+        snapshot: VersionSnapshot,
+        deadline: Optional[float] = None,
+    ) -> List[StandardScalarMetric]:
+        """
+        Fetches the before and after window of all hosts that changed to the version
+        under test, such that the after window ended within the current tick.
+        """
+        offset = (
+            self._global_config.PREDICTABLE_ARRIVAL_TESTER_MONITORING_TIME
+            + self._global_config.PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME
+        )
 
-        after_start = (
-            dt.datetime.fromtimestamp(version_change_ts)
-            + dt.timedelta(
-                seconds=self._global_config.PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME
-            )
-        ).timestamp()
-        after_end = (
-            dt.datetime.fromtimestamp(version_change_ts)
-            + dt.timedelta(
-                seconds=self._global_config.PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME
-                + self._global_config.PREDICTABLE_ARRIVAL_TESTER_MONITORING_TIME
-            )
-        ).timestamp()
-
-        try:
-            before = self._avg_metric_aggregation(host, before_start, before_end)
-            after = self._avg_metric_aggregation(host, after_start, after_end)
-        except Exception as e:
-            logger.error({
-                "name": self.name,
-                "host": host,
-                "error": str(e),
-            })
-            return None, None
-
-        return before, after
-
-        # def _fetch(
-        #     self, host_changes: list[tuple[str, float]]
-        # ) -> tuple[List[StandardScalarMetric], List[StandardScalarMetric]]:
-        #     old_version_metrics: list[StandardScalarMetric] = []
-        #     new_version_metrics: list[StandardScalarMetric] = []
-
-        #     with concurrent.futures.ThreadPoolExecutor() as executor:
-        #         futures = [
-        #             executor.submit(self._fetch_host, host, ts) for host, ts in host_changes
-        #         ]
-        #         for future in concurrent.futures.as_completed(futures):
-        #             try:
-        #                 before, after = future.result()
-        #                 if before and after:
-        #                     old_version_metrics.append(before)
-        #                     new_version_metrics.append(after)
-        #             except Exception as e:
-        #                 logger.error(e)
-
-        #     return old_version_metrics, new_version_metrics
+        host_changes = snapshot.get_host_with_changed_version_in_interval(
+            self._version_under_test,
+            start=previous_timestamp - offset,
+            end=current_timestamp - offset,
+        )
+
+        before, after = self._version_change_fetcher.fetch(host_changes, deadline)
+
+        return before + after
 
     def _fetch(
-        self, previous_timestamp, current_timestamp
+        self, previous_timestamp, current_timestamp, deadline: Optional[float] = None
     ) -> List[StandardScalarMetric]:
+        """
+        Fetches one value per host evaluated at the end of the tick. In the aggregated
+        mode the query is wrapped into a windowed aggregation over exactly
+        [previous_timestamp, current_timestamp], such that thanos returns a single
+        pre-aggregated value per host.
+        """
+        if self._fetch_mode == PredictableFetchMode.Aggregated:
+            render_kwargs = {
+                "over_time": self._test_config.get("window_aggregation", "avg"),
+                "window_s": current_timestamp - previous_timestamp,
+            }
+            query = self._query_template.render(**render_kwargs)
+        else:
+            query = self._test_config["query"]
+            render_kwargs = {}
+
         params = {
-            "query": self._test_config["query"],
+            "query": query,
             "dedup": "true",
-            "partial_response": "false",
-            "start": previous_timestamp,
-            "end": current_timestamp,
+            "time": current_timestamp,
             "engine": "thanos",
             "analyze": "false",
         }
-
-        res = requests.get(
-            self._global_config.THANOS_QUERIER_ENDPOINT + "/api/v1/query",
-            params=params,
-            cookies={"_oauth2_proxy_osdp_open_ch": self._global_config.AUTH_COOKIE},
+        plan = QueryPlanner.plan(
+            previous_timestamp, current_timestamp, self._query_accuracy
         )
 
-        res.raise_for_status()
-
-        res = res.json()
+        res = self._fleet_query(
+            params,
+            lambda p: self._thanos.query(p, plan, deadline=deadline),
+            **render_kwargs,
+        )
 
         return PredictableArrivalTester._transform_to_scalar_metrics(res)
 
@@ -153,60 +148,20 @@ class PredictableArrivalTester(Tester):
         scalar value.
         """
         params = {
-            "query": self._process_query(self._test_config["query"], host),
+            "query": self._query_template.render(host=host),
             "start": start,
             "end": end,
             "dedup": "true",
-            "partial_response": "false",
             "engine": "thanos",
             "analyze": "false",
-            "step": "1",
         }
 
-        start = dt.datetime.now()
-
-        res = requests.get(
-            self._global_config.THANOS_QUERIER_ENDPOINT + "/api/v1/query_range",
-            params=params,
-            cookies={"_oauth2_proxy_osdp_open_ch": self._global_config.AUTH_COOKIE},
-            verify=self._global_config.VERIFY_SSL,
+        res = self._thanos.query_range(
+            params, QueryPlanner.plan(start, end, self._query_accuracy)
         )
 
-        res.raise_for_status()
-
-        res = res.json()
-
         return PredictableArrivalTester._transform_to_scalar_metrics(res)
 
-    def _process_query(self, query: str, host: str):
-        """
-        Select the metric on a per host basis by transforming the query.
-        """
-        pattern = re.compile(
-            r"(\w+)\s*\((\w+(?:_\w+)*)(\{[^)]*\})?\)\s*by\s*\((\w+(?:,\s*\w+)*)\)|(\w+(?:_\w+)*)"
-        )
-        match = pattern.match(query)
-        if match:
-            if match.group(1):
-                func = match.group(1)
-                metric = match.group(2)
-                existing_filter = match.group(3) or "{}"
-                by_clause = match.group(4)
-
-                if existing_filter == "{}":
-                    return f"{func} ({metric}{{host='{host}'}}) by ({by_clause})"
-                else:
-                    existing_filter = existing_filter[:-1] + f", host='{host}'}}"
-                    return f"{func} ({metric}{existing_filter}) by ({by_clause})"
-            else:
-                metric = match.group(5)
-                if "{host=" in metric:
-                    return query
-                else:
-                    return f"{metric}{{host='{host}'}}"
-        else:
-            return query
-
     # def _transform_to_scalar_metrics(json):
     #     """
     #     Takes the average of all the values in the metric and returns a
@@ -240,61 +195,64 @@ class PredictableArrivalTester(Tester):
     def _apply_new_data_chunk(
         self, new_data_chunk: List[VersionEnrichedStandardScalarMetric]
     ):
+        self._samples_seen += len(new_data_chunk)
+        treatment_code = self._version_groups.treatment_code
         for metric in new_data_chunk:
-            if metric.version == self._version_under_test:
+            if metric.version_code == treatment_code:
                 self._treatment_group.append(metric)
             else:
                 self._control_group.append(metric)
 
     @override
-    def run(
+    def fetch(
+        self,
+        previous_timestamp: float,
+        current_timestamp: float,
+        snapshot: VersionSnapshot,
+        deadline: Optional[float] = None,
+    ) -> List[StandardScalarMetric]:
+        match self._fetch_mode:
+            case PredictableFetchMode.VersionChange:
+                return self._fetch_version_changes(
+                    previous_timestamp, current_timestamp, snapshot, deadline
+                )
+            case PredictableFetchMode.Instant | PredictableFetchMode.Aggregated:
+                return self._fetch(previous_timestamp, current_timestamp, deadline)
+
+    @override
+    def process(
         self,
+        data: List[StandardScalarMetric],
         previous_timestamp: float,
         current_timestamp: float,
         total_seconds_passed: float,
-    ):
+        snapshot: VersionSnapshot,
+    ) -> TesterReturn:
 
         current_peek = self._current_peek
         self._increase_peek()
 
-        # start = dt.datetime.fromtimestamp(current_timestamp) - dt.timedelta(
-        #     seconds=self._global_config.PREDICTABLE_ARRIVAL_TESTER_MONITORING_TIME
-        #     + self._global_config.PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME
-        #     + (current_timestamp - previous_timestamp)
-        # )
-
-        # end = dt.datetime.fromtimestamp(current_timestamp) - dt.timedelta(
-        #     seconds=self._global_config.PREDICTABLE_ARRIVAL_TESTER_MONITORING_TIME
-        #     + self._global_config.PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME
-        # )
-
-        # host_changes = self._enricher.get_host_with_changed_version_in_interval(
-        #     self._version_under_test,
-        #     start=start.timestamp(),
-        #     end=end.timestamp(),
-        # )
-
-        try:
-            data = self._fetch(previous_timestamp, current_timestamp)
-        except requests.exceptions.HTTPError as e:
-            logging.error(e)
-            return TesterReturn(
-                name=self.name,
-                type=TesterReturnType.CONTINUE,
-                reason=TesterReturnReason.HTTP_ERROR,
-            )
-        enriched_data = self._enricher.enrich(data)
+        with (
+            TICK_STAGE_DURATION.labels(self.name, "enrich").time(),
+            tracing.span(
+                "enrich", test=self.name, peek=current_peek, samples=len(data)
+            ) as span,
+        ):
+            enriched_data = snapshot.enrich(data)
 
-        version_cleaned_data = list(
-            filter(self._verify_if_in_valid_version, enriched_data)
-        )
+            version_cleaned_data = list(
+                filter(self._verify_if_in_valid_version, enriched_data)
+            )
+            span["valid_samples"] = len(version_cleaned_data)
 
         self._apply_new_data_chunk(version_cleaned_data)
+        self._export_group_sizes()
 
         logger.debug({
             "name": self.name,
             "control_group": len(self._control_group),
             "treatment_group": len(self._treatment_group),
+            "enricher_snapshot": snapshot.timestamp,
         })
 
         if self._current_peek > self._total_peeks:
@@ -314,8 +272,8 @@ class PredictableArrivalTester(Tester):
                 reason=TesterReturnReason.NOT_ENOUGH_DATA,
             )
 
-        treatment_bucket = [metric.value for metric in self._treatment_group]
-        control_bucket = [metric.value for metric in self._control_group]
+        treatment_bucket = self._treatment_group.bucket()
+        control_bucket = self._control_group.bucket()
 
         match ComparisonDirection.from_str(self._test_config["direction"]):
             case ComparisonDirection.Smaller:
@@ -0,0 +1,153 @@
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+from canary_tester.interner import HOST_CODES
+
+_FORMAT_VERSION = 1
+_INITIAL_CAPACITY = 4096
+_COLUMNS: Dict[str, np.dtype] = {
+    "ts": np.dtype(np.int64),
+    "host": np.dtype(np.int32),
+    "value": np.dtype(np.float64),
+}
+
+
+class SampleArchive:
+    """
+    Appends the (ts, host code, value) records of a group to memory-mapped files,
+    one file per column, such that the samples live in the page cache instead of
+    the heap of the process. The files grow by doubling and are cut to the number
+    of records on `close`.
+
+    After the experiment the directory is a dataset of its own: `meta.json` has the
+    number of records and the host names of the host codes, `SampleArchive.load`
+    maps the columns again.
+
+    The files are only mapped with the first record and an archive of an earlier
+    run is overwritten from there on. A store that is replaced by the one of a
+    checkpoint right away (see `Tester.restore_state`) leaves the files of the
+    resumed archive alone.
+
+    Parameters:
+    directory: str
+        The directory of the files, it is created if it doesn't exist yet.
+    """
+
+    size: int
+    _directory: str
+    _capacity: int
+    _columns: Dict[str, np.ndarray]
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self.size = 0
+        self._capacity = 0
+        self._columns = {
+            name: np.empty(0, dtype=dtype) for name, dtype in _COLUMNS.items()
+        }
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, ts: int, host: str, value: float) -> None:
+        if self.size == self._capacity:
+            self._grow(max(2 * self._capacity, _INITIAL_CAPACITY))
+        self._columns["ts"][self.size] = ts
+        self._columns["host"][self.size] = HOST_CODES.code(host)
+        self._columns["value"][self.size] = value
+        self.size += 1
+
+    def values(self, start: int = 0) -> np.ndarray:
+        """
+        Returns a view of the values from `start` on, without copying them. The view
+        stays valid after the archive grew.
+        """
+        return self._columns["value"][start : self.size]
+
+    def columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns views of the ts, the host codes and the values."""
+        return tuple(self._columns[name][: self.size] for name in _COLUMNS)
+
+    def close(self) -> None:
+        """Cuts the files to the records and writes the meta data."""
+        self._flush()
+        self._columns = {}
+        for name, dtype in _COLUMNS.items():
+            # Also replaces the files of an earlier run if nothing was appended
+            with open(self._path(name), "ab") as f:
+                f.truncate(self.size * dtype.itemsize)
+
+        with open(os.path.join(self._directory, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "format_version": _FORMAT_VERSION,
+                    "size": self.size,
+                    "columns": {name: dtype.str for name, dtype in _COLUMNS.items()},
+                    "hosts": [HOST_CODES.value(c) for c in range(len(HOST_CODES))],
+                },
+                f,
+            )
+
+    def __getstate__(self) -> dict:
+        # Only the position is checkpointed, the records are in the files already
+        self._flush()
+        return {"directory": self._directory, "size": self.size}
+
+    def __setstate__(self, state: dict) -> None:
+        self._directory = state["directory"]
+        self.size = state["size"]
+        self._capacity = 0
+        self._columns = {}
+        # Records written after the checkpoint are overwritten
+        self._grow(max(_INITIAL_CAPACITY, 2 * self.size))
+
+    def load(directory: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Maps the columns of a closed archive read-only, the host codes are
+        translated with the "hosts" list. None if the archive can't be read.
+        """
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                meta = json.load(f)
+            if meta["format_version"] != _FORMAT_VERSION:
+                return None
+            columns = {
+                name: (
+                    np.memmap(
+                        os.path.join(directory, f"{name}.bin"),
+                        dtype=np.dtype(dtype),
+                        mode="r",
+                        shape=(meta["size"],),
+                    )
+                    if meta["size"] > 0
+                    else np.empty(0, dtype=np.dtype(dtype))
+                )
+                for name, dtype in meta["columns"].items()
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+
+        columns["hosts"] = np.array(meta["hosts"], dtype=object)
+        return columns
+
+    def _grow(self, capacity: int) -> None:
+        self._flush()
+        for name, dtype in _COLUMNS.items():
+            with open(self._path(name), "ab") as f:
+                f.truncate(capacity * dtype.itemsize)
+            self._columns[name] = np.memmap(
+                self._path(name), dtype=dtype, mode="r+", shape=(capacity,)
+            )
+        self._capacity = capacity
+
+    def _flush(self) -> None:
+        if self._capacity > 0:
+            for column in self._columns.values():
+                column.flush()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._directory, f"{name}.bin")
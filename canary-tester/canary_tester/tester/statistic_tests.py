@@ -1,5 +1,6 @@
 from typing import override
-from scipy import stats
+import numpy as np
+from scipy import special, stats
 import statsmodels.api as sm_api
 import statsmodels as sm
 
@@ -8,13 +9,21 @@ from canary_tester.types import (
 )
 
 from canary_tester.tester.frequency_kstest_one_sided import FrequencyKSTestOneSided
+from canary_tester.tester.histogram_sketch import HistogramSketch
+from canary_tester.tester.kll_sketch import KLLSketch
 
 
 class BaseStatisticTest:
     """
     Abstract Base class for all the tests.
+
+    `always_valid` tests return p-values that stay valid no matter how often we
+    peek, the tester then compares them against the significance level instead of
+    spending it over the peeks.
     """
 
+    always_valid: bool = False
+
     @staticmethod
     def p_value(
         a_bucket: list[VersionEnrichedStandardScalarMetric],
@@ -178,3 +187,243 @@ class KSTest(BaseStatisticTest):
         alpha: float,
     ):
         return FrequencyKSTestOneSided.ci(a_bucket, b_bucket, alpha)
+
+
+class HistogramKSTest(BaseStatisticTest):
+    """
+    The KSTest on histogram sketches. The CDFs are only known at the bin edges, so
+    the statistic is the supremum over the edges, which can't be bigger than the
+    one of the raw samples and keeps the p-value conservative. The DKW band of
+    every bin spans the CDF at both ends of the bin, which folds the binning error
+    into the confidence interval. Both run in O(bins).
+    """
+
+    @staticmethod
+    @override
+    def p_value(
+        a_bucket: HistogramSketch,
+        b_bucket: HistogramSketch,
+        alternative: str = "less",
+    ) -> float:
+        n_a, n_b = len(a_bucket), len(b_bucket)
+        _, cdf_a = a_bucket.cdf_bounds()
+        _, cdf_b = b_bucket.cdf_bounds()
+
+        # Same meaning of the alternative as in scipy.stats.ks_2samp
+        if alternative == "less":
+            d = np.max(cdf_b - cdf_a)
+        elif alternative == "greater":
+            d = np.max(cdf_a - cdf_b)
+        else:
+            d = np.max(np.abs(cdf_a - cdf_b))
+
+        # Asymptotic distribution of the statistic
+        p = np.exp(-2 * n_a * n_b / (n_a + n_b) * max(d, 0) ** 2)
+        if alternative not in ("less", "greater"):
+            p = 2 * p
+        return float(min(p, 1.0))
+
+    @staticmethod
+    @override
+    def effect_size_ci(
+        a_bucket: HistogramSketch,
+        b_bucket: HistogramSketch,
+        alpha: float,
+    ) -> (float, float):
+        """
+        The same interval as FrequencyKSTestOneSided.ci, on the bins that hold
+        samples of either group.
+        """
+        occupied = a_bucket.occupied(b_bucket)
+        lower_a, upper_a = (cdf[occupied] for cdf in a_bucket.cdf_bounds())
+        lower_b, upper_b = (cdf[occupied] for cdf in b_bucket.cdf_bounds())
+        error_a = FrequencyKSTestOneSided.error_fn_gst(len(a_bucket), alpha / 2)
+        error_b = FrequencyKSTestOneSided.error_fn_gst(len(b_bucket), alpha / 2)
+
+        F_u_a = np.minimum(upper_a + error_a, 1)
+        F_u_b = np.minimum(upper_b + error_b, 1)
+        F_l_a = np.maximum(lower_a - error_a, 0)
+        F_l_b = np.maximum(lower_b - error_b, 0)
+
+        D_u = F_u_b - F_l_a
+        D_l = F_l_b - F_u_a
+
+        l_a_b = np.max([np.min(D_u), np.max(D_l)])
+        u_a_b = np.max([np.min(D_l), np.max(D_u)])
+
+        return l_a_b, u_a_b
+
+
+class QuantileSketchKSTest(BaseStatisticTest):
+    """
+    The KSTest on KLL quantile sketches. Both the p-value and the confidence
+    interval come from FrequencyKSTestOneSided, which widens its error terms by
+    the rank error of the sketches.
+    """
+
+    @staticmethod
+    @override
+    def p_value(
+        a_bucket: KLLSketch,
+        b_bucket: KLLSketch,
+        alternative: str = "less",
+    ) -> float:
+        # Same meaning of the alternative as in scipy.stats.ks_2samp
+        if alternative == "less":
+            return FrequencyKSTestOneSided.p_value(a_bucket, b_bucket)
+        elif alternative == "greater":
+            return FrequencyKSTestOneSided.p_value(b_bucket, a_bucket)
+        return min(
+            2
+            * min(
+                FrequencyKSTestOneSided.p_value(a_bucket, b_bucket),
+                FrequencyKSTestOneSided.p_value(b_bucket, a_bucket),
+            ),
+            1,
+        )
+
+    @staticmethod
+    @override
+    def effect_size_ci(
+        a_bucket: KLLSketch,
+        b_bucket: KLLSketch,
+        alpha: float,
+    ):
+        return FrequencyKSTestOneSided.ci(a_bucket, b_bucket, alpha)
+
+
+class RunningMoments:
+    """
+    The count, mean and variance of a growing bucket, updated with Welford's
+    algorithm such that every sample is only looked at once.
+    """
+
+    n: int
+    mean: float
+    _m2: float
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def add(self, values: list[float]) -> None:
+        for value in values:
+            self.n += 1
+            delta = value - self.mean
+            self.mean += delta / self.n
+            self._m2 += delta * (value - self.mean)
+
+
+class MSPRTTest(BaseStatisticTest):
+    """
+    The mixture sequential probability ratio test on the difference of the means
+    theta = mean(a) - mean(b), see https://arxiv.org/abs/1512.04922.
+
+    The likelihood ratio of theta against 0 is mixed over a normal prior with
+    standard deviation `tau` (in units of the pooled standard deviation), for one
+    sided alternatives over the half of the prior on the side of the alternative.
+    1 / ratio is a p-value that is valid at every peek, we keep the running minimum.
+
+    Only the moments of both buckets are kept, the testers only append to their
+    groups, so every peek only processes the samples that arrived since the last
+    one. If a bucket got smaller, the moments are recomputed.
+
+    Parameters:
+    tau: float
+        The standard deviation of the mixture, roughly the effect size (in pooled
+        standard deviations) the test is most sensitive for.
+    """
+
+    always_valid = True
+    _tau: float
+    _a: RunningMoments
+    _b: RunningMoments
+    _p_values: dict[str, float]
+
+    def __init__(self, tau: float = 0.5):
+        self._tau = tau
+        self._a = RunningMoments()
+        self._b = RunningMoments()
+        self._p_values = {}
+
+    @override
+    def p_value(
+        self,
+        a_bucket: list[float],
+        b_bucket: list[float],
+        alternative: str = "less",
+    ) -> float:
+        self._update(a_bucket, b_bucket)
+
+        statistics = self._statistics()
+        if statistics is None:
+            return 1.0
+        theta, v, tau2 = statistics
+
+        # log of the likelihood ratio mixed over N(0, tau2)
+        log_ratio = 0.5 * np.log(v / (v + tau2)) + theta**2 * tau2 / (
+            2 * v * (v + tau2)
+        )
+        z = theta * np.sqrt(tau2) / np.sqrt(v * (v + tau2))
+        if alternative == "greater":
+            log_ratio += np.log(2) + special.log_ndtr(z)
+        elif alternative == "less":
+            log_ratio += np.log(2) + special.log_ndtr(-z)
+
+        p = float(min(np.exp(-log_ratio), 1.0))
+        self._p_values[alternative] = min(p, self._p_values.get(alternative, 1.0))
+        return self._p_values[alternative]
+
+    @override
+    def effect_size_ci(
+        self,
+        a_bucket: list[float],
+        b_bucket: list[float],
+        alpha: float,
+    ) -> (float, float):
+        """
+        Returns the always valid confidence interval of the relative difference
+        (mean(a) - mean(b)) / mean(b).
+        """
+        self._update(a_bucket, b_bucket)
+
+        statistics = self._statistics()
+        if statistics is None or self._b.mean == 0:
+            return -np.inf, np.inf
+        theta, v, tau2 = statistics
+
+        radius = np.sqrt(
+            v * (v + tau2) / tau2 * (2 * np.log(1 / alpha) + np.log((v + tau2) / v))
+        )
+        scale = abs(self._b.mean)
+        return (theta - radius) / scale, (theta + radius) / scale
+
+    def _update(self, a_bucket: list[float], b_bucket: list[float]) -> None:
+        if len(a_bucket) < self._a.n or len(b_bucket) < self._b.n:
+            self._a = RunningMoments()
+            self._b = RunningMoments()
+        self._a.add(a_bucket[self._a.n :])
+        self._b.add(b_bucket[self._b.n :])
+
+    def _statistics(self):
+        """
+        Returns the estimated difference, its variance and the variance of the
+        mixture, None if there are too few samples.
+        """
+        if self._a.n < 2 or self._b.n < 2:
+            return None
+
+        v = self._a.variance / self._a.n + self._b.variance / self._b.n
+        if v <= 0:
+            return None
+
+        pooled_variance = (
+            (self._a.n - 1) * self._a.variance + (self._b.n - 1) * self._b.variance
+        ) / (self._a.n + self._b.n - 2)
+        tau2 = self._tau**2 * pooled_variance
+        return self._a.mean - self._b.mean, v, tau2
@@ -1,13 +1,23 @@
 from typing import List
 from canary_tester.config_loader.schema import SingleTestConfigType
 from canary_tester.version_enricher import VersionEnricher
-from canary_tester.types import GlobalConfig, TestArrivalType
+from canary_tester.types import (
+    GlobalConfig,
+    GroupStoreType,
+    TestArrivalType,
+    TestStatistictType,
+)
 from canary_tester.tester.tester import Tester
 from canary_tester.tester.predictable_arrival_tester import PredictableArrivalTester
 from canary_tester.tester.unpredictable_arrival_tester import UnpredictableArrivalTester
 from canary_tester.tester.statistic_tests import (
     BaseStatisticTest,
+    HistogramKSTest,
     KSTest,
+    MSPRTTest,
+    QuantileSketchKSTest,
+    TTest,
+    ZProportionTest,
 )
 
 
@@ -23,13 +33,64 @@ class TestBuilder:
             case TestArrivalType.UnpredicatableArrival:
                 return UnpredictableArrivalTester
 
-    def _select_statistic_test(type_arrival: str):
-        match TestArrivalType.from_str(type_arrival):
+    def _select_statistic_test(test_config: SingleTestConfigType):
+        if test_config.get("statistic_test"):
+            match TestStatistictType.from_str(test_config["statistic_test"]):
+                case TestStatistictType.ZProportionTest:
+                    return ZProportionTest
+                case TestStatistictType.TTest:
+                    return TTest
+                case TestStatistictType.KSTest:
+                    return KSTest
+                case TestStatistictType.MSPRT:
+                    # It keeps the running statistics of the test, so every test
+                    # needs its own instance.
+                    if test_config.get("msprt_tau"):
+                        return MSPRTTest(test_config["msprt_tau"])
+                    return MSPRTTest()
+
+        match TestArrivalType.from_str(test_config["type_arrival"]):
             case TestArrivalType.PredictableArrival:
                 return KSTest
             case TestArrivalType.UnpredicatableArrival:
                 return KSTest
 
+    def _select_sketch_statistic_test(
+        statistic_test: BaseStatisticTest, group_store: GroupStoreType
+    ):
+        """
+        The sketch group stores don't have the raw values, so only tests that work
+        on the sketches are allowed.
+        """
+        if statistic_test is KSTest:
+            match group_store:
+                case GroupStoreType.Histogram:
+                    return HistogramKSTest
+                case GroupStoreType.KLL:
+                    return QuantileSketchKSTest
+        if statistic_test is ZProportionTest:
+            return ZProportionTest
+        raise ValueError(
+            f"group_store {group_store.value} only supports the KSTest and the"
+            " ZProportionTest"
+        )
+
+    def _verify_retention(
+        statistic_test: BaseStatisticTest, test_config: SingleTestConfigType
+    ) -> None:
+        """
+        Evicted samples can't be removed from a sketch or from the running
+        statistics of the MSPRT, whose p-values are only valid on all samples.
+        """
+        if (
+            test_config.get("group_store")
+            and GroupStoreType.from_str(test_config["group_store"])
+            != GroupStoreType.List
+        ):
+            raise ValueError("retention only supports the List group_store")
+        if isinstance(statistic_test, MSPRTTest):
+            raise ValueError("retention doesn't support the MSPRT")
+
     def build(
         version_under_test: str,
         total_peeks: int,
@@ -40,8 +101,16 @@ class TestBuilder:
     ):
         tester: Tester = TestBuilder._select_arrival_test(test_config["type_arrival"])
         statistic_test: BaseStatisticTest = TestBuilder._select_statistic_test(
-            test_config["type_arrival"]
+            test_config
         )
+        if test_config.get("group_store"):
+            group_store = GroupStoreType.from_str(test_config["group_store"])
+            if group_store in (GroupStoreType.Histogram, GroupStoreType.KLL):
+                statistic_test = TestBuilder._select_sketch_statistic_test(
+                    statistic_test, group_store
+                )
+        if test_config.get("retention"):
+            TestBuilder._verify_retention(statistic_test, test_config)
 
         return tester(
             version_under_test=version_under_test,
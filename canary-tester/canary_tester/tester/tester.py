@@ -1,25 +1,92 @@
 import logging
-from typing import List
-import scipy as sp
+from typing import Callable, List, Optional, Union
 import numpy as np
 import datetime as dt
 import os
+import pyarrow as pa
+import requests
 
+from canary_tester import tracing
+from canary_tester.arrow_export import (
+    DECISION_SCHEMA,
+    GROUP_SCHEMA,
+    PEEK_SCHEMA,
+    ArrowExport,
+)
 from canary_tester.config_loader.schema import SingleTestConfigType
+from canary_tester.host_sharder import HostSharder
+from canary_tester.interner import VersionGroups
+from canary_tester.metrics import (
+    TESTER_ANALYSIS_SKIPPED_TOTAL,
+    TESTER_GROUP_SIZE,
+    TESTER_PEEKS,
+    TICK_STAGE_DURATION,
+)
+from canary_tester.promql_template import QueryTemplate
+from canary_tester.sharded_range_fetcher import ShardedRangeFetcher
+from canary_tester.thanos_client import ThanosClient
 from canary_tester.types import (
+    AlphaSpending,
     GlobalConfig,
+    GroupStoreType,
+    QueryAccuracy,
+    RetentionWindow,
     TesterReturn,
     TesterReturnReason,
     TesterReturnType,
     VersionEnrichedStandardScalarMetric,
 )
-from canary_tester.version_enricher import VersionEnricher
+from canary_tester.version_enricher import VersionEnricher, VersionSnapshot
+from canary_tester.tester.alpha_spending import AlphaSpendingSchedule
+from canary_tester.tester.group_store import (
+    ArchiveGroupStore,
+    GroupStore,
+    ListGroupStore,
+    SketchGroupStore,
+    WindowedGroupStore,
+)
+from canary_tester.tester.histogram_sketch import HistogramSketch
+from canary_tester.tester.kll_sketch import KLLSketch
 from canary_tester.tester.statistic_tests import BaseStatisticTest
 
 
 logger = logging.getLogger("root")
 
 
+class TestStatistics:
+    """
+    The statistics of the last full analysis of a tester and how many samples the
+    tester had seen when they were computed.
+    """
+
+    __test__ = False
+    samples_seen: int
+    mean_a: float
+    mean_b: float
+    effect_size_ci_low: float
+    effect_size_ci_high: float
+    p_value_h0: float
+    p_value_h1: float
+
+    def __init__(
+        self,
+        samples_seen: int,
+        mean_a: float,
+        mean_b: float,
+        effect_size_ci_low: float,
+        effect_size_ci_high: float,
+        p_value_h0: float,
+        p_value_h1: float,
+    ):
+        self.samples_seen = samples_seen
+        self.mean_a = mean_a
+        self.mean_b = mean_b
+        self.effect_size_ci_low = effect_size_ci_low
+        self.effect_size_ci_high = effect_size_ci_high
+        self.p_value_h0 = p_value_h0
+        self.p_value_h1 = p_value_h1
+
+
 class Tester:
     """
     Base class for predictable arrival and unpredictable arrival tester.
@@ -44,11 +111,26 @@ class Tester:
     _current_peek: int
     _total_peeks: int
     _control_group_versions: List[str]
-    _treatment_group: list[VersionEnrichedStandardScalarMetric]
-    _control_group: list[VersionEnrichedStandardScalarMetric]
+    _version_groups: VersionGroups
+    _treatment_group: GroupStore
+    _control_group: GroupStore
+    _samples_seen: int
+    _statistics: Optional[TestStatistics]
+    _peeks: List[dict]
+    # The TesterReturn that ended the test, set by the experiment
+    decision: Optional[TesterReturn] = None
+    _alpha_spending: Optional[AlphaSpendingSchedule]
     _enricher: VersionEnricher
     _statistic_test: BaseStatisticTest
     _global_config: GlobalConfig
+    _thanos: ThanosClient
+    _range_fetcher: ShardedRangeFetcher
+    _host_sharder: HostSharder
+    _query_template: Optional[QueryTemplate]
+    _query_accuracy: QueryAccuracy
+    _default_query_accuracy: QueryAccuracy = QueryAccuracy.Balanced
+    # Whether the value of the first sample of a group is not part of its bucket
+    _skip_first_sample: bool = False
 
     def __init__(
         self,
@@ -63,43 +145,288 @@ class Tester:
         self._version_under_test = version_under_test
         self._total_peeks = total_peeks
         self._enricher = enricher
-        self._treatment_group = []
-        self._control_group = []
+        self._samples_seen = 0
+        self._statistics = None
+        self._peeks = []
+        self._alpha_spending = None
         self._current_peek = 1
         self._control_group_versions = control_group_versions
+        self._version_groups = VersionGroups(version_under_test, control_group_versions)
         self._test_config = test_config
         self.name = test_config["name"]
+        self._treatment_group = self._create_group_store("treatment")
+        self._control_group = self._create_group_store("control")
         self._statistic_test = statistic_test
         self._global_config = global_config
+        self._thanos = ThanosClient(global_config, self.name)
+        self._range_fetcher = ShardedRangeFetcher(self._thanos, global_config)
+        self._host_sharder = HostSharder(global_config)
+        self._query_template = (
+            QueryTemplate.compile(test_config["query"])
+            if test_config.get("query")
+            else None
+        )
+        self._query_accuracy = (
+            QueryAccuracy.from_str(test_config["query_accuracy"])
+            if test_config.get("query_accuracy")
+            else self._default_query_accuracy
+        )
 
-    def run(self, previous_timestamp: int, current_timestamp: int) -> TesterReturn:
-        pass
+    def run(
+        self,
+        previous_timestamp: int,
+        current_timestamp: int,
+        total_seconds_passed: float,
+    ) -> TesterReturn:
+        """
+        Fetches the data of the window and processes it, all lookups of the run use
+        the same snapshot of the enricher.
+        """
+        snapshot = self._enricher.snapshot
+
+        try:
+            data = self.fetch(previous_timestamp, current_timestamp, snapshot)
+        except requests.exceptions.RequestException as e:
+            return self.fetch_failed(e)
+
+        return self.process(
+            data, previous_timestamp, current_timestamp, total_seconds_passed, snapshot
+        )
 
-    def _select_alpha_gst_obrien_fleming(
-        self, current_peek: int, total_peeks: int, alpha: float, rho: float = 0.5
+    def fetch(
+        self,
+        previous_timestamp: int,
+        current_timestamp: int,
+        snapshot: VersionSnapshot,
+        deadline: Optional[float] = None,
     ):
         """
-        Select the alpha value for the O'Brien-Fleming spending function.
-        The paper to it can be found here:
-        https://www.jstor.org/stable/2530245
+        Fetches the data of the window (previous_timestamp, current_timestamp]. It
+        must not change the state of the tester, such that it can run ahead of or
+        concurrently to `process` of an earlier window. The queries have to be
+        answered by the `time.monotonic()` `deadline`, such that a slow querier
+        can't stall the tick. None only uses THANOS_QUERY_TIMEOUT_S.
+        """
+        pass
+
+    def process(
+        self,
+        data,
+        previous_timestamp: int,
+        current_timestamp: int,
+        total_seconds_passed: float,
+        snapshot: VersionSnapshot,
+    ) -> TesterReturn:
+        """
+        Adds the fetched data of the window to the groups and runs the test.
+        """
+        pass
+
+    def fetch_failed(self, error: Exception) -> TesterReturn:
+        """
+        Used instead of `process` if the fetch of a window failed. The peek is still
+        counted, such that the test doesn't run longer than its max time.
+        """
+        logger.error(error)
+        self._increase_peek()
+        return TesterReturn(
+            name=self.name,
+            type=TesterReturnType.CONTINUE,
+            reason=TesterReturnReason.HTTP_ERROR,
+        )
+
+    def prefetch(self, start_timestamp: int, end_timestamp: int, tick_s: int) -> None:
+        """
+        Fetches the data of [start_timestamp, end_timestamp] in bulk, such that the
+        ticks inside this window don't need to query thanos anymore. Used to catch up
+        an experiment that started in the past. Testers that don't support it, fetch
+        every tick on its own.
+        """
+        pass
+
+    def checkpoint_state(self) -> dict:
+        """
+        Returns the state the tester accumulated so far, such that a resumed
+        experiment can continue where it stopped. The clients and caches are not
+        part of it, they are created again.
+        """
+        return {
+            "current_peek": self._current_peek,
+            "treatment_group": self._treatment_group,
+            "control_group": self._control_group,
+            "samples_seen": self._samples_seen,
+            "statistics": self._statistics,
+            "peeks": self._peeks,
+            "decision": self.decision,
+            # Stateful tests like the MSPRT keep their running statistics
+            "statistic_test": self._statistic_test,
+        }
+
+    def restore_state(self, state: dict) -> None:
+        """Continues from a state returned by `checkpoint_state`."""
+        self._current_peek = state["current_peek"]
+        self._treatment_group = state["treatment_group"]
+        self._control_group = state["control_group"]
+        self._samples_seen = state["samples_seen"]
+        self._statistics = state["statistics"]
+        self._peeks = state["peeks"]
+        self.decision = state["decision"]
+        self._statistic_test = state["statistic_test"]
+
+    def group_batches(self) -> List[pa.RecordBatch]:
+        """Returns the samples of both groups, if the group stores keep them."""
+        return ArrowExport.group_batches([self._treatment_group, self._control_group])
+
+    def peek_batch(self) -> pa.RecordBatch:
+        """Returns the statistics of every analyzed peek."""
+        return ArrowExport.peek_batch(self.peeks)
+
+    @property
+    def peeks(self) -> List[dict]:
+        """The statistics of every analyzed peek, see PEEK_SCHEMA."""
+        return self._peeks
+
+    def decision_record(self) -> Optional[dict]:
+        """Returns the decision of the test, None if it is still running."""
+        if self.decision is None:
+            return None
+        return {
+            "name": self.name,
+            "type": self.decision.type.value,
+            "reason": self.decision.reason.value,
+            # The peek is counted up before the decision is made
+            "peek": self._current_peek - 1,
+        }
+
+    def decision_batch(self) -> pa.RecordBatch:
+        """Returns the decision of the test, no row if it is still running."""
+        decision = self.decision_record()
+        return ArrowExport.decision_batch([] if decision is None else [decision])
+
+    def export_arrow(self, directory: str) -> None:
+        """Writes the groups, the peeks and the decision as Arrow IPC files."""
+        path = os.path.join(directory, self.name)
+        os.makedirs(path, exist_ok=True)
+        ArrowExport.write(
+            os.path.join(path, "groups.arrow"), GROUP_SCHEMA, self.group_batches()
+        )
+        ArrowExport.write(
+            os.path.join(path, "peeks.arrow"), PEEK_SCHEMA, [self.peek_batch()]
+        )
+        ArrowExport.write(
+            os.path.join(path, "decision.arrow"),
+            DECISION_SCHEMA,
+            [self.decision_batch()],
+        )
+
+    def close(self) -> None:
+        """
+        Called once the experiment ended, i.e. writes the meta data of the archives.
+        """
+        self._treatment_group.close()
+        self._control_group.close()
+
+    def _create_group_store(self, group: str) -> GroupStore:
+        """
+        Creates the store of a group as configured with `group_store`, a list of
+        all samples by default. With `retention` only the samples of the latest
+        window are kept.
+
+        Parameters:
+        group: str
+            The name of the group, "treatment" or "control".
+        """
+        if self._test_config.get("retention"):
+            return WindowedGroupStore(
+                RetentionWindow.from_str(self._test_config["retention"]),
+                seconds=self._test_config.get("retention_seconds"),
+                samples=self._test_config.get("retention_samples"),
+                skip_first=self._skip_first_sample,
+            )
+
+        group_store = (
+            GroupStoreType.from_str(self._test_config["group_store"])
+            if self._test_config.get("group_store")
+            else GroupStoreType.List
+        )
+
+        match group_store:
+            case GroupStoreType.List:
+                return ListGroupStore(self._skip_first_sample)
+            case GroupStoreType.Histogram:
+                if self._test_config.get("histogram_edges"):
+                    sketch = HistogramSketch(self._test_config["histogram_edges"])
+                else:
+                    sketch = HistogramSketch.log_spaced(
+                        self._test_config.get("histogram_min") or 1e-3,
+                        self._test_config.get("histogram_max") or 1e7,
+                        self._test_config.get("histogram_bins") or 256,
+                    )
+                return SketchGroupStore(sketch, self._skip_first_sample)
+            case GroupStoreType.KLL:
+                return SketchGroupStore(
+                    KLLSketch(self._test_config.get("kll_k") or 200),
+                    self._skip_first_sample,
+                )
+            case GroupStoreType.Archive:
+                return ArchiveGroupStore(
+                    os.path.join("results", "archive", self.name, group),
+                    self._skip_first_sample,
+                )
+
+    def _fleet_query(
+        self, params: dict, run: Callable[[dict], dict], **render_kwargs
+    ) -> dict:
+        """
+        Runs a fleet-wide query. With `host_sharding` enabled for the test, the query
+        is split by the hosts of the enricher and the shards are merged again.
+
+        Parameters:
+        params: dict
+            The query params with the already rendered query.
+        run: Callable[[dict], dict]
+            Runs a single query, i.e. `lambda p: self._thanos.query(p, plan)`.
+        render_kwargs:
+            How the query template was rendered, applied to every shard as well.
+        """
+        if self._test_config.get("host_sharding") and self._host_sharder.enabled:
+            return self._host_sharder.fetch(
+                self._query_template,
+                params,
+                self._enricher.hosts,
+                run,
+                **render_kwargs,
+            )
+        return run(params)
+
+    def _select_alpha(self, current_peek: int) -> float:
+        """
+        Selects the alpha of the peek from the alpha spending schedule of the test,
+        O'Brien-Fleming by default. Always valid tests use the significance level
+        at every peek.
 
         Parameters:
         current_peek: int
             The current peek we are at (between 1 an total_peeks)
-        total_peeks: int
-            The total number of peeks we want to do
-        alpha: float
-            The alpha value
-        rho: float
-            The rho value. Having rho=0.5 seems like the optimal
-            https://www.jstor.org/stable/2531959
         """
+        if self._statistic_test.always_valid:
+            return self._test_config["significance_level"]
 
-        t = current_peek / total_peeks
+        if self._alpha_spending is None:
+            self._alpha_spending = AlphaSpendingSchedule(
+                (
+                    AlphaSpending.from_str(self._test_config["alpha_spending"])
+                    if self._test_config.get("alpha_spending")
+                    else AlphaSpending.OBrienFleming
+                ),
+                self._total_peeks,
+                self._test_config["significance_level"],
+                rho=self._test_config.get("alpha_spending_rho"),
+                max_samples=self._test_config.get("alpha_spending_max_samples"),
+            )
 
-        return 4 - 4 * sp.stats.norm.cdf(
-            sp.stats.norm.ppf(1 - alpha / 4) / t ** (rho / 2)
-        )
+        # The groups shrink with a retention, the spent alpha must not.
+        return self._alpha_spending.alpha_at(current_peek, self._samples_seen)
 
     def _analyze(
         self,
@@ -118,26 +445,54 @@ class Tester:
         3. We check if the p_value_h1 is below the alpha value (we reject the alternative
             hypothesis)
         4. If none of the above is true we continue the test.
+
+        If no new samples arrived since the last analysis (or fewer than
+        ANALYSIS_MIN_NEW_SAMPLES), the statistics of the last analysis are reused and
+        only compared against the alpha of the current peek. The spent alpha only
+        grows, so the reused confidence interval is wider and the effect size check
+        stays conservative.
         """
 
-        alpha = self._select_alpha_gst_obrien_fleming(
-            current_peek,
-            self._total_peeks,
-            self._test_config["significance_level"],
-        )
-        effect_size_ci_low, effect_size_ci_high = self._statistic_test.effect_size_ci(
-            a_bucket, b_bucket, alpha
-        )
-        p_value_h0 = self._statistic_test.p_value(
-            a_bucket,
-            b_bucket,
-            alternative="greater",  # means that alternative hypothesis is that a is greater than b
-        )
-        p_value_h1 = self._statistic_test.p_value(
-            a_bucket,
-            b_bucket,
-            alternative="less",
-        )
+        alpha = self._select_alpha(current_peek)
+
+        skip_reason = self._analysis_skip_reason(current_peek)
+        if skip_reason is None:
+            with (
+                TICK_STAGE_DURATION.labels(self.name, "statistic").time(),
+                tracing.span(
+                    "statistic",
+                    test=self.name,
+                    peek=current_peek,
+                    control_sample_size=len(self._control_group),
+                    treatment_sample_size=len(self._treatment_group),
+                    alpha=alpha,
+                ),
+            ):
+                self._statistics = TestStatistics(
+                    self._samples_seen,
+                    Tester._mean(a_bucket),
+                    Tester._mean(b_bucket),
+                    *self._statistic_test.effect_size_ci(a_bucket, b_bucket, alpha),
+                    # The alternative hypothesis is that a is greater than b
+                    p_value_h0=self._statistic_test.p_value(
+                        a_bucket,
+                        b_bucket,
+                        alternative="greater",
+                    ),
+                    p_value_h1=self._statistic_test.p_value(
+                        a_bucket,
+                        b_bucket,
+                        alternative="less",
+                    ),
+                )
+        else:
+            TESTER_ANALYSIS_SKIPPED_TOTAL.labels(self.name, skip_reason).inc()
+
+        statistics = self._statistics
+        effect_size_ci_low = statistics.effect_size_ci_low
+        effect_size_ci_high = statistics.effect_size_ci_high
+        p_value_h0 = statistics.p_value_h0
+        p_value_h1 = statistics.p_value_h1
 
         logger.debug({
             "name": self.name,
@@ -147,8 +502,8 @@ class Tester:
             "control_sample_size": len(self._control_group),
             "treatment_sample_size": len(self._treatment_group),
             "direction": self._test_config["direction"],
-            "mean_a": np.mean(a_bucket),
-            "mean_b": np.mean(b_bucket),
+            "mean_a": statistics.mean_a,
+            "mean_b": statistics.mean_b,
             "effect_size_ci_low": effect_size_ci_low,
             "effect_size_ci_high": effect_size_ci_high,
             "effect_size_threshold": self._test_config[
@@ -159,6 +514,7 @@ class Tester:
             "alpha": alpha,
             "current_peek": current_peek,
             "total_peek": self._total_peeks,
+            "skipped": skip_reason,
         })
 
         if self._is_lower_than_minimal_effect_size_of_interest(
@@ -174,17 +530,44 @@ class Tester:
         else:
             reason = TesterReturnReason.COULD_NOT_MAKE_DECISION
 
-        if not os.path.exists("results"):
-            os.makedirs("results")
-            with open(f"results/{self.name}.csv", "w") as f:
-                f.write(
-                    "total_min_passed,control_sample_size,treatment_sample_size,mean_a,mean_b,effect_size_ci_low,effect_size_ci_high,effect_size_threshold,p_value_h0,p_value_h1,alpha,reason\n"
-                )
-        # store into csv file into folder results
-        with open(f"results/{self.name}.csv", "a") as f:
-            f.write(
-                f"{np.ceil(total_seconds_passed / 60)},{len(a_bucket)},{len(b_bucket)},{np.mean(a_bucket)},{np.mean(b_bucket)},{effect_size_ci_low},{effect_size_ci_high},{self._test_config['minimal_effect_size_of_interest']},{p_value_h0},{p_value_h1},{alpha},{reason.value}\n"
-            )
+        self._peeks.append({
+            "peek": current_peek,
+            "timestamp": current_timestamp,
+            "total_seconds_passed": total_seconds_passed,
+            "control_sample_size": len(self._control_group),
+            "treatment_sample_size": len(self._treatment_group),
+            "mean_a": statistics.mean_a,
+            "mean_b": statistics.mean_b,
+            "effect_size_ci_low": effect_size_ci_low,
+            "effect_size_ci_high": effect_size_ci_high,
+            "effect_size_threshold": self._test_config[
+                "minimal_effect_size_of_interest"
+            ],
+            "p_value_h0": p_value_h0,
+            "p_value_h1": p_value_h1,
+            "alpha": alpha,
+            "reason": reason.value,
+            "skipped": skip_reason is not None,
+        })
+
+        # A skipped analysis only gets a row if it ends the test
+        if skip_reason is None or reason != TesterReturnReason.COULD_NOT_MAKE_DECISION:
+            with (
+                TICK_STAGE_DURATION.labels(self.name, "results_write").time(),
+                tracing.span("results_write", test=self.name, peek=current_peek),
+            ):
+                # The archives of the groups may have created the folder already
+                if not os.path.exists(f"results/{self.name}.csv"):
+                    os.makedirs("results", exist_ok=True)
+                    with open(f"results/{self.name}.csv", "w") as f:
+                        f.write(
+                            "total_min_passed,control_sample_size,treatment_sample_size,mean_a,mean_b,effect_size_ci_low,effect_size_ci_high,effect_size_threshold,p_value_h0,p_value_h1,alpha,reason\n"
+                        )
+                # store into csv file into folder results
+                with open(f"results/{self.name}.csv", "a") as f:
+                    f.write(
+                        f"{np.ceil(total_seconds_passed / 60)},{len(a_bucket)},{len(b_bucket)},{statistics.mean_a},{statistics.mean_b},{effect_size_ci_low},{effect_size_ci_high},{self._test_config['minimal_effect_size_of_interest']},{p_value_h0},{p_value_h1},{alpha},{reason.value}\n"
+                    )
 
         if self._is_lower_than_minimal_effect_size_of_interest(
             self._test_config["minimal_effect_size_of_interest"],
@@ -217,16 +600,44 @@ class Tester:
             reason=TesterReturnReason.COULD_NOT_MAKE_DECISION,
         )
 
+    def _mean(
+        bucket: Union[list[float], np.ndarray, HistogramSketch, KLLSketch]
+    ) -> float:
+        if isinstance(bucket, (HistogramSketch, KLLSketch)):
+            return bucket.mean
+        return np.mean(bucket)
+
+    def _analysis_skip_reason(self, current_peek: int) -> Optional[str]:
+        """
+        Returns why the statistics of the last analysis can be reused, None if they
+        have to be computed. The last peek always gets a fresh analysis if anything
+        changed.
+        """
+        if self._statistics is None:
+            return None
+
+        new_samples = self._samples_seen - self._statistics.samples_seen
+        if new_samples == 0:
+            return "no_new_samples"
+        if (
+            new_samples < self._global_config.ANALYSIS_MIN_NEW_SAMPLES
+            and current_peek < self._total_peeks
+        ):
+            return "below_min_new_samples"
+        return None
+
     def _verify_if_in_valid_version(
         self, metric: VersionEnrichedStandardScalarMetric
     ) -> bool:
-        if self._version_under_test == metric.version:
-            return True
-        else:
-            return metric.version in self._control_group_versions
+        return self._version_groups.is_valid(metric.version_code)
 
     def _increase_peek(self):
         self._current_peek += 1
+        TESTER_PEEKS.labels(self.name).set(self._current_peek)
+
+    def _export_group_sizes(self) -> None:
+        TESTER_GROUP_SIZE.labels(self.name, "treatment").set(len(self._treatment_group))
+        TESTER_GROUP_SIZE.labels(self.name, "control").set(len(self._control_group))
 
     def _is_lower_than_minimal_effect_size_of_interest(
         self,
@@ -1,6 +1,6 @@
-from typing import List, override
+from typing import List, Optional, override
+import bisect
 import logging
-import requests
 import datetime as dt
 import numpy as np
 import os
@@ -8,18 +8,23 @@ import os
 from canary_tester.types import (
     ComparisonDirection,
     GlobalConfig,
+    QueryAccuracy,
+    QueryPriority,
     StandardScalarMetric,
     TesterReturn,
     TesterReturnReason,
     TesterReturnType,
     VersionEnrichedStandardScalarMetric,
 )
-from canary_tester.version_enricher import VersionEnricher
+from canary_tester.version_enricher import VersionEnricher, VersionSnapshot
 from canary_tester.tester.alert_group_balancer import AlertGroupBalancer
 from canary_tester.config_loader.schema import SingleTestConfigType
 from canary_tester.tester.tester import Tester
 from canary_tester.tester.statistic_tests import BaseStatisticTest
 from canary_tester.helper import convert_timestamp_into_seconds
+from canary_tester.metrics import TICK_STAGE_DURATION
+from canary_tester import tracing
+from canary_tester.query_planner import QueryPlanner
 
 logger = logging.getLogger("root")
 
@@ -32,6 +37,10 @@ class UnpredictableArrivalTester(Tester):
     time is not approximately uniformly distributed.
     """
 
+    _default_query_accuracy = QueryAccuracy.Coarse
+    _skip_first_sample = True
+    _prefetched: Optional[tuple[int, int, list]]
+
     def __init__(
         self,
         version_under_test: str,
@@ -51,35 +60,106 @@ class UnpredictableArrivalTester(Tester):
             statistic_test=statistic_test,
             global_config=global_config,
         )
+        self._prefetched = None
+
+    @override
+    def prefetch(self, start_timestamp: int, end_timestamp: int, tick_s: int) -> None:
+        params = {
+            "query": self._test_config["query"],
+            "start": start_timestamp,
+            "end": end_timestamp,
+            "dedup": "true",
+            "engine": "thanos",
+            "analyze": "false",
+        }
+
+        # Plan as for a single tick, such that the prefetched data has the same step
+        # as the data we'd fetch live.
+        plan = QueryPlanner.plan(
+            end_timestamp - tick_s,
+            end_timestamp,
+            self._query_accuracy,
+            min_step=60,
+        )
+        res = self._fleet_query(
+            params,
+            lambda p: self._range_fetcher.fetch(p, plan, QueryPriority.Backfill),
+        )
+
+        self._prefetched = (start_timestamp, end_timestamp, res["data"]["result"])
+
+        logger.debug({
+            "name": self.name,
+            "prefetched_from": start_timestamp,
+            "prefetched_to": end_timestamp,
+            "series": len(self._prefetched[2]),
+        })
+
+    def _fetch_window(
+        self,
+        previous_timestamp: int,
+        current_timestamp: int,
+        deadline: Optional[float] = None,
+    ) -> list:
+        """
+        Returns the series of the window, either sliced from the prefetched data or
+        queried from thanos. It doesn't change the prefetched data, such that it can
+        run concurrently to the fetches of other windows, `process` drops it once
+        the ticks have passed it.
+        """
+        prefetched = self._prefetched
+        if prefetched is not None:
+            start, end, result = prefetched
+            if start <= previous_timestamp and current_timestamp <= end:
+                return UnpredictableArrivalTester._slice(
+                    result, previous_timestamp, current_timestamp
+                )
 
-    def _fetch(
-        self, previous_timestamp: int, current_timestamp: int
-    ) -> dict[str, StandardScalarMetric]:
         params = {
             "query": self._test_config["query"],
             "start": previous_timestamp,
             "end": current_timestamp,
             "dedup": "true",
-            "partial_response": "true",
-            "max_source_resolution": "auto",
             "engine": "thanos",
             "analyze": "false",
-            "step": "60",  # This seems the time window where a alert metric is send
         }
 
-        res = requests.get(
-            self._global_config.THANOS_QUERIER_ENDPOINT + "/api/v1/query_range",
-            params=params,
-            cookies={"_oauth2_proxy_osdp_open_ch": self._global_config.AUTH_COOKIE},
-            verify=self._global_config.VERIFY_SSL,
+        plan = QueryPlanner.plan(
+            previous_timestamp,
+            current_timestamp,
+            self._query_accuracy,
+            min_step=60,  # This seems the time window where a alert metric is send
+        )
+        res = self._fleet_query(
+            params, lambda p: self._range_fetcher.fetch(p, plan, deadline=deadline)
         )
 
-        res.raise_for_status()
+        return res["data"]["result"]
 
-        res = res.json()
+    def _slice(result: list, start: float, end: float) -> list:
+        """
+        Returns the series with only the samples in [start, end].
+        """
+        sliced = []
+        for el in result:
+            timestamps = [float(value[0]) for value in el["values"]]
+            values = el["values"][
+                bisect.bisect_left(timestamps, start) : bisect.bisect_right(
+                    timestamps, end
+                )
+            ]
+            if values:
+                sliced.append({"metric": el["metric"], "values": values})
+        return sliced
 
+    def _fetch(
+        self,
+        previous_timestamp: int,
+        current_timestamp: int,
+        deadline: Optional[float] = None,
+    ) -> dict[str, StandardScalarMetric]:
         metrics: dict[str, StandardScalarMetric] = {}
-        for el in res["data"]["result"]:
+        for el in self._fetch_window(previous_timestamp, current_timestamp, deadline):
             # If we have ALERTS_FOR_STATE and we have as value the moment when the alert appeared
             if (
                 int(el["values"][0][1]) >= previous_timestamp
@@ -115,70 +195,95 @@ class UnpredictableArrivalTester(Tester):
         self, new_data_chunk: List[VersionEnrichedStandardScalarMetric]
     ):
 
+        self._samples_seen += len(new_data_chunk)
+        treatment_code = self._version_groups.treatment_code
+
         for metric in new_data_chunk:
 
-            if metric.version == self._version_under_test:
-                if self._treatment_group != []:
-                    metric.value = self._calculate_second_diff(
-                        metric, self._treatment_group[-1]
-                    )
+            if metric.version_code == treatment_code:
+                last = self._treatment_group.last()
+                if last is not None:
+                    metric.value = self._calculate_second_diff(metric, last)
 
                 self._treatment_group.append(metric)  # the first entry will be 0
             else:
-                if self._control_group != []:
-                    metric.value = self._calculate_second_diff(
-                        metric, self._control_group[-1]
-                    )
+                last = self._control_group.last()
+                if last is not None:
+                    metric.value = self._calculate_second_diff(metric, last)
 
                 self._control_group.append(metric)  # the first entry will be 0
 
     @override
-    def run(
+    def fetch(
+        self,
+        previous_timestamp: int,
+        current_timestamp: int,
+        snapshot: VersionSnapshot,
+        deadline: Optional[float] = None,
+    ) -> dict[str, StandardScalarMetric]:
+        return self._fetch(previous_timestamp, current_timestamp, deadline)
+
+    @override
+    def process(
         self,
+        data: dict[str, StandardScalarMetric],
         previous_timestamp: int,
         current_timestamp: int,
         total_seconds_passed: float,
-    ):
+        snapshot: VersionSnapshot,
+    ) -> TesterReturn:
         """
-        Runs the test, by fetching new data, enriching it, balancing it and then
-        running the test.
+        Enriches the fetched data, balances it and then runs the test.
         """
         current_peek = self._current_peek
         self._increase_peek()
 
-        try:
-            data = self._fetch(previous_timestamp, current_timestamp)
-        except requests.exceptions.HTTPError as e:
-            logging.error(e)
-            return TesterReturn(
-                name=self.name,
-                type=TesterReturnType.CONTINUE,
-                reason=TesterReturnReason.HTTP_ERROR,
-            )
+        if self._prefetched is not None and current_timestamp > self._prefetched[1]:
+            # The ticks have passed the prefetched window, we fetch live from now on.
+            self._prefetched = None
 
-        enriched_data = self._enricher.enrich(list(data.values()))
+        with (
+            TICK_STAGE_DURATION.labels(self.name, "enrich").time(),
+            tracing.span(
+                "enrich", test=self.name, peek=current_peek, samples=len(data)
+            ) as span,
+        ):
+            enriched_data = snapshot.enrich(list(data.values()))
 
-        version_cleaned_data = list(
-            filter(self._verify_if_in_valid_version, enriched_data)
-        )
+            version_cleaned_data = list(
+                filter(self._verify_if_in_valid_version, enriched_data)
+            )
+            span["valid_samples"] = len(version_cleaned_data)
 
         # sort by timestamp
         version_cleaned_data.sort(key=lambda x: x.ts)
 
         # Unpredictable arrival needs to balance the data !!
-        balanced_data = AlertGroupBalancer.balance(
-            self._enricher.frequencies,
-            self._version_under_test,
-            self._control_group_versions,
-            version_cleaned_data,
-        )
+        with (
+            TICK_STAGE_DURATION.labels(self.name, "balance").time(),
+            tracing.span(
+                "balance",
+                test=self.name,
+                peek=current_peek,
+                samples=len(version_cleaned_data),
+            ) as span,
+        ):
+            balanced_data = AlertGroupBalancer.balance(
+                snapshot.frequencies,
+                self._version_under_test,
+                self._control_group_versions,
+                version_cleaned_data,
+            )
+            span["balanced_samples"] = len(balanced_data)
 
         self._apply_new_data_chunk(balanced_data)
+        self._export_group_sizes()
 
         logger.debug({
             "name": self.name,
             "control_group": len(self._control_group),
             "treatment_group": len(self._treatment_group),
+            "enricher_snapshot": snapshot.timestamp,
         })
 
         if (
@@ -192,12 +297,9 @@ class UnpredictableArrivalTester(Tester):
             )
 
         # We want that our test group has a bigger time difference between alert message
-        treatment_bucket = [
-            metric.value for metric in self._treatment_group[1:]
-        ]  # We skip the first element since value (ts_diff) is 0
-        control_bucket = [
-            metric.value for metric in self._control_group[1:]
-        ]  # We skip the first element since value (ts_diff) is 0
+        # The first element is skipped since its value (ts_diff) is 0
+        treatment_bucket = self._treatment_group.bucket()
+        control_bucket = self._control_group.bucket()
 
         match ComparisonDirection.from_str(self._test_config["direction"]):
             case ComparisonDirection.Smaller:
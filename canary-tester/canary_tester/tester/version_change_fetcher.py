@@ -0,0 +1,207 @@
+from typing import List, Optional
+import logging
+import requests
+import concurrent.futures
+
+from canary_tester.helper import is_float_castable
+from canary_tester.promql_template import QueryTemplate
+from canary_tester.query_planner import QueryPlanner
+from canary_tester.thanos_client import ThanosClient
+from canary_tester.types import GlobalConfig, QueryAccuracy, StandardScalarMetric
+
+logger = logging.getLogger("root")
+
+
+class VersionChangeFetcher:
+    """
+    Fetches the metrics in a window before and after the version change of many hosts
+    at once. Instead of two `query_range` calls per host, the hosts whose version
+    changed at a similar time are grouped into batches and each batch is fetched with
+    a single `host=~"a|b|c"` range query. The result of a batch is then split back into
+    a before and after window per host.
+
+    Parameters:
+    query: str
+        The configured query of the test.
+    global_config: GlobalConfig
+        The global config, it defines the window sizes, the batch size and the min step.
+    thanos: ThanosClient
+        The client to query thanos, by default one with `version_change` as source.
+    query_accuracy: QueryAccuracy
+        The accuracy the query planner uses to pick the step of the batch queries.
+    """
+
+    _query: str
+    _query_template: QueryTemplate
+    _global_config: GlobalConfig
+    _thanos: ThanosClient
+    _query_accuracy: QueryAccuracy
+
+    def __init__(
+        self,
+        query: str,
+        global_config: GlobalConfig,
+        thanos: ThanosClient = None,
+        query_accuracy: QueryAccuracy = QueryAccuracy.Balanced,
+    ):
+        self._query = query
+        self._query_template = QueryTemplate.compile(query) if query else None
+        self._global_config = global_config
+        self._thanos = thanos or ThanosClient(global_config, "version_change")
+        self._query_accuracy = query_accuracy
+
+    def fetch(
+        self,
+        host_changes: list[tuple[str, float]],
+        deadline: Optional[float] = None,
+    ) -> tuple[List[StandardScalarMetric], List[StandardScalarMetric]]:
+        """
+        Returns the aggregated metrics before and after the version change. The two lists
+        are paired, a host only appears if it has data in both windows. The queries
+        have to be answered by the `time.monotonic()` `deadline`, if set.
+        """
+        before_metrics: list[StandardScalarMetric] = []
+        after_metrics: list[StandardScalarMetric] = []
+
+        batches = self._group_into_batches(host_changes)
+
+        if len(batches) == 0:
+            return before_metrics, after_metrics
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._global_config.PREDICTABLE_ARRIVAL_TESTER_BATCH_WORKERS
+        ) as executor:
+            futures = [
+                executor.submit(self._fetch_batch, batch, deadline) for batch in batches
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    before, after = future.result()
+                except requests.exceptions.HTTPError as e:
+                    logger.error({"query": self._query, "error": str(e)})
+                    continue
+                before_metrics.extend(before)
+                after_metrics.extend(after)
+
+        return before_metrics, after_metrics
+
+    def _group_into_batches(
+        self, host_changes: list[tuple[str, float]]
+    ) -> list[list[tuple[str, float]]]:
+        """
+        Groups the hosts by their change timestamp. A batch never holds more than
+        the configured batch size and the changes in a batch are at most the batch
+        window apart, such that the range query of a batch stays small.
+        """
+        batches: list[list[tuple[str, float]]] = []
+
+        for host, ts in sorted(host_changes, key=lambda x: x[1]):
+            if (
+                batches
+                and len(batches[-1])
+                < self._global_config.PREDICTABLE_ARRIVAL_TESTER_BATCH_SIZE
+                and ts - batches[-1][0][1]
+                <= self._global_config.PREDICTABLE_ARRIVAL_TESTER_BATCH_WINDOW
+            ):
+                batches[-1].append((host, ts))
+            else:
+                batches.append([(host, ts)])
+
+        return batches
+
+    def _windows(self, version_change_ts: float) -> tuple[tuple[float, float], ...]:
+        """
+        Returns the before and after window of a version change.
+        """
+        stabilization = (
+            self._global_config.PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME
+        )
+        monitoring = self._global_config.PREDICTABLE_ARRIVAL_TESTER_MONITORING_TIME
+
+        return (
+            (
+                version_change_ts - stabilization - monitoring,
+                version_change_ts - stabilization,
+            ),
+            (
+                version_change_ts + stabilization,
+                version_change_ts + stabilization + monitoring,
+            ),
+        )
+
+    def _fetch_batch(
+        self, batch: list[tuple[str, float]], deadline: Optional[float]
+    ) -> tuple[List[StandardScalarMetric], List[StandardScalarMetric]]:
+        change_ts_by_host = dict(batch)
+
+        start = self._windows(batch[0][1])[0][0]
+        end = self._windows(batch[-1][1])[1][1]
+
+        params = {
+            "query": self._query_template.render(hosts=list(change_ts_by_host.keys())),
+            "start": start,
+            "end": end,
+            "dedup": "true",
+            "engine": "thanos",
+            "analyze": "false",
+        }
+
+        res = self._thanos.query_range(
+            params,
+            QueryPlanner.plan(
+                start,
+                end,
+                self._query_accuracy,
+                min_step=self._global_config.PREDICTABLE_ARRIVAL_TESTER_BATCH_STEP,
+            ),
+            deadline=deadline,
+        )
+
+        return self._split_into_windows(res, change_ts_by_host)
+
+    def _split_into_windows(
+        self, json, change_ts_by_host: dict[str, float]
+    ) -> tuple[List[StandardScalarMetric], List[StandardScalarMetric]]:
+        """
+        Splits the series of a batch into the before and after window of its host and
+        averages the values of each window.
+        """
+        before_metrics: list[StandardScalarMetric] = []
+        after_metrics: list[StandardScalarMetric] = []
+
+        for el in json["data"]["result"]:
+            host = el["metric"].get("host")
+            if host not in change_ts_by_host:
+                continue
+
+            before_window, after_window = self._windows(change_ts_by_host[host])
+            before = VersionChangeFetcher._avg_in_window(
+                host, el["values"], before_window
+            )
+            after = VersionChangeFetcher._avg_in_window(
+                host, el["values"], after_window
+            )
+
+            if before is not None and after is not None:
+                before_metrics.append(before)
+                after_metrics.append(after)
+
+        return before_metrics, after_metrics
+
+    def _avg_in_window(
+        host: str, values: list, window: tuple[float, float]
+    ) -> StandardScalarMetric | None:
+        samples = [
+            (float(ts), float(value))
+            for ts, value in values
+            if window[0] <= float(ts) <= window[1] and is_float_castable(value)
+        ]
+
+        if len(samples) == 0:
+            return None
+
+        return StandardScalarMetric(
+            ts=int(samples[-1][0]),
+            host_name=host,
+            value=sum(value for _, value in samples) / len(samples),
+        )
@@ -0,0 +1,319 @@
+from typing import Optional
+import logging
+import time
+
+import requests
+
+from canary_tester import tracing
+from canary_tester.circuit_breaker import CircuitBreaker, CircuitOpenError
+from canary_tester.hedging import Hedger
+from canary_tester.metrics import (
+    THANOS_HEDGED_TOTAL,
+    THANOS_QUERIER_EVAL_SECONDS,
+    THANOS_QUERIER_SAMPLES,
+    THANOS_QUERY_DURATION,
+    THANOS_QUERY_OUTCOME_TOTAL,
+    THANOS_QUERY_RESPONSE_BYTES,
+    THANOS_THROTTLED_TOTAL,
+    TICK_STAGE_DURATION,
+)
+from canary_tester.query_governor import (
+    THROTTLE_STATUS_CODES,
+    DeadlineExceeded,
+    QueryGovernor,
+)
+from canary_tester.query_planner import QueryPlan
+from canary_tester.types import GlobalConfig, QueryPriority
+
+logger = logging.getLogger("root")
+
+# Queries longer than this are sent as form encoded POST, since the querier or a
+# proxy in front of it rejects too long URLs (i.e. host sharded queries).
+_MAX_GET_QUERY_LENGTH = 4096
+
+# The query parameters that are added to the span of a query.
+_TRACED_PARAMS = (
+    "query",
+    "time",
+    "start",
+    "end",
+    "step",
+    "max_source_resolution",
+    "partial_response",
+)
+
+# How many times a throttled query is sent again after the backoff of the governor.
+_MAX_THROTTLE_RETRIES = 3
+
+
+class ThanosClient:
+    """
+    All requests to the thanos querier go through this client. It sets the
+    endpoint, the authentication and the planned query parameters and exports
+    the duration, the response size and the querier stats of every query. Every
+    query waits for the process-wide QueryGovernor before it is sent.
+
+    A query times out after THANOS_QUERY_TIMEOUT_S or at the deadline passed with
+    it, whichever is earlier. Slow queries are hedged and during a querier outage the
+    queries fail fast (see Hedger and CircuitBreaker). The outcome of every query
+    is exported as metric.
+
+    Parameters:
+    global_config: GlobalConfig
+        The global config.
+    source: str
+        Who sends the queries (a test name or the enricher), used as metric label.
+    session: requests.Session
+        An optional session, i.e. with retries. Without a session `requests.get`
+        is used.
+    priority: QueryPriority
+        The priority of the queries in the governor.
+    """
+
+    _global_config: GlobalConfig
+    _source: str
+    _session: Optional[requests.Session]
+    _priority: QueryPriority
+
+    def __init__(
+        self,
+        global_config: GlobalConfig,
+        source: str,
+        session: Optional[requests.Session] = None,
+        priority: QueryPriority = QueryPriority.Test,
+    ):
+        self._global_config = global_config
+        self._source = source
+        self._session = session
+        self._priority = priority
+
+    def query(
+        self,
+        params: dict,
+        plan: Optional[QueryPlan] = None,
+        priority: Optional[QueryPriority] = None,
+        deadline: Optional[float] = None,
+    ) -> dict:
+        """
+        Runs an instant query and returns the decoded json. The query has to be
+        answered by the `time.monotonic()` `deadline`, if set.
+        """
+        if plan is not None:
+            params = plan.apply(params, range_query=False)
+        return self._request(
+            "/api/v1/query", params, priority or self._priority, deadline
+        )
+
+    def query_range(
+        self,
+        params: dict,
+        plan: Optional[QueryPlan] = None,
+        priority: Optional[QueryPriority] = None,
+        deadline: Optional[float] = None,
+    ) -> dict:
+        """
+        Runs a range query and returns the decoded json. The query has to be
+        answered by the `time.monotonic()` `deadline`, if set.
+        """
+        if plan is not None:
+            params = plan.apply(params, range_query=True)
+        return self._request(
+            "/api/v1/query_range", params, priority or self._priority, deadline
+        )
+
+    def _request(
+        self,
+        endpoint: str,
+        params: dict,
+        priority: QueryPriority,
+        deadline: Optional[float],
+    ) -> dict:
+        params = {**params, "stats": "all"}
+
+        start = time.perf_counter()
+
+        with tracing.span(
+            "thanos_query",
+            source=self._source,
+            endpoint=endpoint,
+            **{key: value for key, value in params.items() if key in _TRACED_PARAMS},
+        ) as span:
+            try:
+                res, hedged = self._send_until_not_throttled(
+                    endpoint, params, priority, deadline
+                )
+                res.raise_for_status()
+                with (
+                    TICK_STAGE_DURATION.labels(self._source, "decode").time(),
+                    tracing.span("decode", source=self._source),
+                ):
+                    json = res.json()
+            except Exception as e:
+                span["outcome"] = ThanosClient._outcome(e)
+                THANOS_QUERY_OUTCOME_TOTAL.labels(
+                    self._source, endpoint, span["outcome"]
+                ).inc()
+                raise
+
+            span["outcome"] = "success"
+            span["response_bytes"] = len(res.content)
+            span["hedged"] = hedged
+
+        THANOS_QUERY_OUTCOME_TOTAL.labels(self._source, endpoint, "success").inc()
+        if hedged:
+            THANOS_HEDGED_TOTAL.labels(self._source, endpoint).inc()
+
+        self._export(
+            endpoint,
+            params.get("max_source_resolution", "0s"),
+            time.perf_counter() - start,
+            len(res.content),
+            json,
+        )
+
+        return json
+
+    def _send_until_not_throttled(
+        self,
+        endpoint: str,
+        params: dict,
+        priority: QueryPriority,
+        deadline: Optional[float],
+    ) -> tuple[requests.Response, bool]:
+        governor = QueryGovernor.shared(self._global_config)
+        breaker = CircuitBreaker.shared(self._global_config)
+        hedger = Hedger.shared(self._global_config)
+
+        def send() -> requests.Response:
+            with governor.slot(priority, deadline):
+                # The timeout is taken after waiting in the governor.
+                return self._send(endpoint, params, self._timeout(deadline))
+
+        for attempt in range(_MAX_THROTTLE_RETRIES + 1):
+            breaker.before_request()
+
+            success: Optional[bool] = None
+            try:
+                res, hedged = hedger.run(self._source + endpoint, send)
+                success = res.status_code < 500
+            except DeadlineExceeded:
+                # The deadline of the tick says nothing about the querier
+                raise
+            except requests.exceptions.RequestException:
+                success = False
+                raise
+            finally:
+                # Every exit has to end the query, otherwise a trial query leaves
+                # the circuit half-open forever.
+                if success is None:
+                    breaker.release()
+                else:
+                    breaker.record(success)
+
+            backoff = governor.report(res.status_code, res.headers.get("Retry-After"))
+            if not backoff:
+                break
+
+            THANOS_THROTTLED_TOTAL.labels(self._source, endpoint).inc()
+            logger.warning(
+                {
+                    "source": self._source,
+                    "endpoint": endpoint,
+                    "status_code": res.status_code,
+                    "backoff_s": backoff,
+                    "attempt": attempt,
+                }
+            )
+            if deadline is not None and time.monotonic() + backoff >= deadline:
+                # The retry couldn't be sent in time, the throttled response fails
+                break
+
+        return res, hedged
+
+    def _timeout(self, deadline: Optional[float]) -> float:
+        timeout = self._global_config.THANOS_QUERY_TIMEOUT_S
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"deadline of {self._source} exceeded")
+            timeout = min(timeout, remaining)
+        return timeout
+
+    def _outcome(e: Exception) -> str:
+        """
+        Maps the exception of a failed query to the outcome label.
+        """
+        if isinstance(e, CircuitOpenError):
+            return "circuit_open"
+        if isinstance(e, DeadlineExceeded):
+            return "deadline_exceeded"
+        if isinstance(e, requests.exceptions.Timeout):
+            return "timeout"
+        if isinstance(e, requests.exceptions.ConnectionError):
+            return "connection_error"
+        if isinstance(e, requests.exceptions.HTTPError):
+            if (
+                e.response is not None
+                and e.response.status_code in THROTTLE_STATUS_CODES
+            ):
+                return "throttled"
+            return "http_error"
+        if isinstance(e, ValueError):
+            return "invalid_response"
+        return "error"
+
+    def _send(self, endpoint: str, params: dict, timeout: float) -> requests.Response:
+        client = self._session if self._session is not None else requests
+
+        url = self._global_config.THANOS_QUERIER_ENDPOINT + endpoint
+        cookies = {"_oauth2_proxy_osdp_open_ch": self._global_config.AUTH_COOKIE}
+
+        if len(str(params.get("query", ""))) > _MAX_GET_QUERY_LENGTH:
+            return client.post(
+                url,
+                data=params,
+                cookies=cookies,
+                verify=self._global_config.VERIFY_SSL,
+                timeout=timeout,
+            )
+        return client.get(
+            url,
+            params=params,
+            cookies=cookies,
+            verify=self._global_config.VERIFY_SSL,
+            timeout=timeout,
+        )
+
+    def _export(
+        self,
+        endpoint: str,
+        resolution: str,
+        duration_s: float,
+        response_bytes: int,
+        json: dict,
+    ) -> None:
+        labels = (self._source, endpoint, resolution)
+
+        THANOS_QUERY_DURATION.labels(*labels).observe(duration_s)
+        THANOS_QUERY_RESPONSE_BYTES.labels(*labels).observe(response_bytes)
+
+        stats = json.get("data", {}).get("stats") or {}
+        eval_seconds = stats.get("timings", {}).get("evalTotalTime")
+        samples = stats.get("samples", {}).get("totalQueryableSamples")
+
+        if eval_seconds is not None:
+            THANOS_QUERIER_EVAL_SECONDS.labels(*labels).observe(eval_seconds)
+        if samples is not None:
+            THANOS_QUERIER_SAMPLES.labels(*labels).observe(samples)
+
+        logger.debug(
+            {
+                "source": self._source,
+                "endpoint": endpoint,
+                "resolution": resolution,
+                "duration_s": duration_s,
+                "response_bytes": response_bytes,
+                "querier_eval_s": eval_seconds,
+                "querier_samples": samples,
+            }
+        )
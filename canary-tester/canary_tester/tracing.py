@@ -0,0 +1,174 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Iterator, Optional
+
+logger = logging.getLogger("root")
+
+# Whether the tick that runs in the current context is traced. Threads that work
+# for a tick (i.e. the fetch executor) have to run in a copy of its context.
+_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "trace_sampled", default=False
+)
+
+_tracer: Optional["Tracer"] = None
+_tracer_lock = threading.Lock()
+
+
+class Tracer:
+    """
+    Writes the spans of the sampled ticks to a trace file in the Chrome trace
+    format, which can be opened in chrome://tracing or https://ui.perfetto.dev
+    without any other service. Every span is a complete event ("ph": "X") with its
+    attributes as args, on the row of the thread it ran in.
+
+    The file is a JSON array that is never closed, the format allows it, such that
+    the events of every tick are appended without rewriting the file and a resumed
+    experiment continues the same trace.
+
+    Only a share of the ticks is sampled, the spans of the other ticks only cost a
+    lookup of a context variable. The sampling uses its own random number
+    generator, such that it doesn't change the balancing of the alert groups.
+
+    Parameters:
+    path: str
+        The trace file.
+    sample_rate: float
+        The share of the ticks that are traced, between 0 and 1.
+    """
+
+    _path: str
+    _sample_rate: float
+    _random: random.Random
+    _events: list[dict]
+    _named_threads: set[int]
+    _lock: threading.Lock
+
+    def __init__(self, path: str, sample_rate: float):
+        self._path = path
+        self._sample_rate = sample_rate
+        self._random = random.Random()
+        self._events = []
+        self._named_threads = set()
+        self._lock = threading.Lock()
+
+    def sample(self) -> bool:
+        """Decides whether the next tick is traced."""
+        return self._random.random() < self._sample_rate
+
+    def record(self, name: str, start_ns: int, end_ns: int, attributes: dict) -> None:
+        thread_id = threading.get_native_id()
+        with self._lock:
+            if thread_id not in self._named_threads:
+                self._named_threads.add(thread_id)
+                self._events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": os.getpid(),
+                        "tid": thread_id,
+                        "args": {"name": threading.current_thread().name},
+                    }
+                )
+            self._events.append(
+                {
+                    "name": name,
+                    "cat": "canary_tester",
+                    "ph": "X",
+                    "ts": start_ns / 1000,
+                    "dur": (end_ns - start_ns) / 1000,
+                    "pid": os.getpid(),
+                    "tid": thread_id,
+                    "args": attributes,
+                }
+            )
+
+    def flush(self) -> None:
+        """
+        Appends the recorded events to the trace file. If it can't be written, the
+        events are kept for the next flush.
+        """
+        with self._lock:
+            if not self._events:
+                return
+
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self._path, "a") as f:
+                if f.tell() == 0:
+                    f.write("[\n")
+                f.write(
+                    "".join(
+                        json.dumps(event, default=str) + ",\n" for event in self._events
+                    )
+                )
+            self._events = []
+
+
+def start(path: str, sample_rate: float) -> None:
+    """Traces the ticks of the process from now on."""
+    global _tracer
+    with _tracer_lock:
+        _tracer = Tracer(path, sample_rate)
+
+
+def stop() -> None:
+    """Writes the remaining spans and stops tracing."""
+    global _tracer
+    with _tracer_lock:
+        tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.flush()
+
+
+def sample() -> bool:
+    """Decides whether the next tick is traced, never if tracing is off."""
+    tracer = _tracer
+    return tracer is not None and tracer.sample()
+
+
+def is_sampled() -> bool:
+    return _sampled.get()
+
+
+@contextlib.contextmanager
+def tick(sampled: bool) -> Iterator[None]:
+    """
+    Runs the block as part of a tick, its spans are only recorded if the tick is
+    sampled. The spans of a sampled tick are written to the trace file at the end.
+    """
+    token = _sampled.set(sampled)
+    try:
+        yield
+    finally:
+        _sampled.reset(token)
+        tracer = _tracer
+        if sampled and tracer is not None:
+            try:
+                tracer.flush()
+            except OSError as e:
+                logger.error(f"Writing the trace failed: {e}")
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes) -> Iterator[dict]:
+    """
+    Records the block as span of the current tick. The yielded attributes can be
+    extended within the block, i.e. with the sample counts after a stage.
+    """
+    tracer = _tracer
+    if tracer is None or not _sampled.get():
+        yield attributes
+        return
+
+    start_ns = time.time_ns()
+    try:
+        yield attributes
+    finally:
+        tracer.record(name, start_ns, time.time_ns(), attributes)
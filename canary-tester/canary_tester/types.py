@@ -1,6 +1,9 @@
 from enum import Enum
 import logging
 import threading
+from typing import Optional
+
+from canary_tester.interner import VERSION_CODES
 
 
 class TestArrivalType(Enum):
@@ -59,6 +62,8 @@ class TestStatistictType(Enum):
 
     ZProportionTest = "ZProportionTest"
     TTest = "TTest"
+    KSTest = "KSTest"
+    MSPRT = "MSPRT"
 
     __test__ = False
 
@@ -68,10 +73,156 @@ class TestStatistictType(Enum):
             return TestStatistictType.ZProportionTest
         elif value in ("TTest", "t_test"):
             return TestStatistictType.TTest
+        elif value in ("KSTest", "ks_test"):
+            return TestStatistictType.KSTest
+        elif value in ("MSPRT", "msprt"):
+            return TestStatistictType.MSPRT
+        else:
+            raise ValueError(f"Unknown value: {value}")
+
+
+class PredictableFetchMode(Enum):
+    """
+    How the PredictableArrival tester gets its data from thanos.
+    - Instant fetches the current value of every host at the end of the tick.
+    - Aggregated fetches the value of every host aggregated over the tick window
+      (i.e. avg_over_time), evaluated at the end of the tick.
+    - VersionChange detects hosts that changed to the version under test and
+      fetches a window before and after the change for each of them.
+    """
+
+    Instant = "Instant"
+    Aggregated = "Aggregated"
+    VersionChange = "VersionChange"
+
+    @staticmethod
+    def from_str(value: str) -> "PredictableFetchMode":
+        if value in ("Instant", "instant"):
+            return PredictableFetchMode.Instant
+        elif value in ("Aggregated", "aggregated"):
+            return PredictableFetchMode.Aggregated
+        elif value in ("VersionChange", "version_change"):
+            return PredictableFetchMode.VersionChange
+        else:
+            raise ValueError(f"Unknown value: {value}")
+
+
+class QueryAccuracy(Enum):
+    """
+    How accurate the data of a test has to be. The query planner uses it to pick
+    the step and the downsampling resolution of the queries.
+    - Exact only reads raw data with the smallest step.
+    - Balanced reads downsampled data when the step is as coarse as the resolution.
+    - Coarse reads downsampled data whenever it's available and allows partial
+      responses.
+    """
+
+    Exact = "Exact"
+    Balanced = "Balanced"
+    Coarse = "Coarse"
+
+    @staticmethod
+    def from_str(value: str) -> "QueryAccuracy":
+        if value in ("Exact", "exact"):
+            return QueryAccuracy.Exact
+        elif value in ("Balanced", "balanced"):
+            return QueryAccuracy.Balanced
+        elif value in ("Coarse", "coarse"):
+            return QueryAccuracy.Coarse
+        else:
+            raise ValueError(f"Unknown value: {value}")
+
+
+class GroupStoreType(Enum):
+    """
+    How a tester keeps the samples of its groups.
+    - List keeps every sample.
+    - Histogram only keeps the counts of fixed bins, the memory per group is
+      constant. Only supported by the KSTest and the ZProportionTest.
+    - KLL only keeps a quantile sketch with a known rank error, the memory per
+      group is bounded. Only supported by the KSTest and the ZProportionTest.
+    - Archive keeps every sample in memory-mapped files on disk.
+    """
+
+    List = "List"
+    Histogram = "Histogram"
+    KLL = "KLL"
+    Archive = "Archive"
+
+    @staticmethod
+    def from_str(value: str) -> "GroupStoreType":
+        if value in ("List", "list"):
+            return GroupStoreType.List
+        elif value in ("Histogram", "histogram"):
+            return GroupStoreType.Histogram
+        elif value in ("KLL", "kll"):
+            return GroupStoreType.KLL
+        elif value in ("Archive", "archive"):
+            return GroupStoreType.Archive
+        else:
+            raise ValueError(f"Unknown value: {value}")
+
+
+class RetentionWindow(Enum):
+    """
+    Which samples of a group a tester keeps, all by default.
+    - Sliding keeps the samples of the last `retention_seconds` or the last
+      `retention_samples` samples.
+    - Tumbling drops all samples whenever `retention_seconds` passed or
+      `retention_samples` samples arrived, and starts over.
+    """
+
+    Sliding = "Sliding"
+    Tumbling = "Tumbling"
+
+    @staticmethod
+    def from_str(value: str) -> "RetentionWindow":
+        if value in ("Sliding", "sliding"):
+            return RetentionWindow.Sliding
+        elif value in ("Tumbling", "tumbling"):
+            return RetentionWindow.Tumbling
+        else:
+            raise ValueError(f"Unknown value: {value}")
+
+
+class AlphaSpending(Enum):
+    """
+    How the significance level of a test is spent over its peeks.
+    - OBrienFleming spends little alpha at the early peeks and most at the end.
+    - Pocock spends the alpha almost evenly over the peeks.
+    - PowerFamily spends alpha * t^rho, rho = 1 is linear, bigger values are more
+      conservative at the early peeks.
+    """
+
+    OBrienFleming = "OBrienFleming"
+    Pocock = "Pocock"
+    PowerFamily = "PowerFamily"
+
+    @staticmethod
+    def from_str(value: str) -> "AlphaSpending":
+        if value in ("OBrienFleming", "obrienfleming"):
+            return AlphaSpending.OBrienFleming
+        elif value in ("Pocock", "pocock"):
+            return AlphaSpending.Pocock
+        elif value in ("PowerFamily", "powerfamily"):
+            return AlphaSpending.PowerFamily
         else:
             raise ValueError(f"Unknown value: {value}")
 
 
+class QueryPriority(Enum):
+    """
+    The order in which waiting thanos queries are served, lower goes first.
+    - Enricher: the host to version mapping every test depends on.
+    - Test: the fetches of the running tests.
+    - Backfill: bulk fetches of historical data, i.e. when catching up.
+    """
+
+    Enricher = 0
+    Test = 1
+    Backfill = 2
+
+
 class BaseMetric:
     """
     The base metric class.
@@ -115,10 +266,12 @@ class StandardScalarMetric(BaseMetric):
 
 class VersionEnrichedStandardScalarMetric(StandardScalarMetric):
     """
-    The standard metric with the version of the host.
+    The standard metric with the version of the host. `version_code` is the code of
+    the version in VERSION_CODES, the testers compare versions by it.
     """
 
     version: str
+    version_code: int
 
     def __init__(
         self,
@@ -126,9 +279,13 @@ class VersionEnrichedStandardScalarMetric(StandardScalarMetric):
         host_name: str,
         value: float,
         version: str,
+        version_code: Optional[int] = None,
     ):
         super().__init__(ts, host_name, value)
         self.version = version
+        self.version_code = (
+            version_code if version_code is not None else VERSION_CODES.code(version)
+        )
 
     def __eq__(self, value: object) -> bool:
         return super().__eq__(value) and self.version == value.version
@@ -218,6 +375,34 @@ class GlobalConfig:
     LOG_LEVEL: int
     VERIFY_SSL: bool
     MINIMAL_SAMPLE_SIZE: int
+    PREDICTABLE_ARRIVAL_TESTER_BATCH_SIZE: int
+    PREDICTABLE_ARRIVAL_TESTER_BATCH_WINDOW: int
+    PREDICTABLE_ARRIVAL_TESTER_BATCH_STEP: int
+    PREDICTABLE_ARRIVAL_TESTER_BATCH_WORKERS: int
+    RANGE_FETCH_SHARD_S: int
+    RANGE_FETCH_MAX_WORKERS: int
+    HOST_SHARDS: int
+    HOST_SHARD_MAX_WORKERS: int
+    HOST_SHARD_DISCOVERY_INTERVAL: int
+    THANOS_MAX_QPS: float
+    THANOS_MAX_IN_FLIGHT: int
+    THANOS_QUERY_TIMEOUT_S: float
+    THANOS_HEDGE_REQUESTS: bool
+    THANOS_BREAKER_FAILURES: int
+    THANOS_BREAKER_RESET_S: float
+    PIPELINE_DEPTH: int
+    ENRICHER_HOST_TTL_S: float
+    ENRICHER_SNAPSHOT_PATH: str
+    ENRICHER_SNAPSHOT_INTERVAL: int
+    ENRICHER_SNAPSHOT_MAX_AGE_S: float
+    ANALYSIS_MIN_NEW_SAMPLES: int
+    CHECKPOINT_PATH: str
+    CHECKPOINT_INTERVAL: int
+    ARROW_EXPORT_PATH: str
+    ARROW_EXPORT_INTERVAL: int
+    EXPERIMENT_STORE_PATH: str
+    TRACE_PATH: str
+    TRACE_SAMPLE_RATE: float
 
     def __init__(self, **kwargs):
         self.THANOS_QUERIER_ENDPOINT = kwargs.get(
@@ -234,3 +419,47 @@ class GlobalConfig:
         self.LOG_LEVEL = int(kwargs.get("LOG_LEVEL", logging.INFO))
         self.VERIFY_SSL = kwargs.get("VERIFY_SSL", "True") == "True"
         self.MINIMAL_SAMPLE_SIZE = int(kwargs.get("MINIMAL_SAMPLE_SIZE", 10))
+        self.PREDICTABLE_ARRIVAL_TESTER_BATCH_SIZE = int(
+            kwargs.get("PREDICTABLE_ARRIVAL_TESTER_BATCH_SIZE", 50)
+        )
+        self.PREDICTABLE_ARRIVAL_TESTER_BATCH_WINDOW = int(
+            kwargs.get("PREDICTABLE_ARRIVAL_TESTER_BATCH_WINDOW", 300)
+        )
+        self.PREDICTABLE_ARRIVAL_TESTER_BATCH_STEP = int(
+            kwargs.get("PREDICTABLE_ARRIVAL_TESTER_BATCH_STEP", 15)
+        )
+        self.PREDICTABLE_ARRIVAL_TESTER_BATCH_WORKERS = int(
+            kwargs.get("PREDICTABLE_ARRIVAL_TESTER_BATCH_WORKERS", 4)
+        )
+        self.RANGE_FETCH_SHARD_S = int(kwargs.get("RANGE_FETCH_SHARD_S", 21600))
+        self.RANGE_FETCH_MAX_WORKERS = int(kwargs.get("RANGE_FETCH_MAX_WORKERS", 4))
+        self.HOST_SHARDS = int(kwargs.get("HOST_SHARDS", 1))
+        self.HOST_SHARD_MAX_WORKERS = int(kwargs.get("HOST_SHARD_MAX_WORKERS", 4))
+        self.HOST_SHARD_DISCOVERY_INTERVAL = int(
+            kwargs.get("HOST_SHARD_DISCOVERY_INTERVAL", 10)
+        )
+        self.THANOS_MAX_QPS = float(kwargs.get("THANOS_MAX_QPS", 20))
+        self.THANOS_MAX_IN_FLIGHT = int(kwargs.get("THANOS_MAX_IN_FLIGHT", 8))
+        self.THANOS_QUERY_TIMEOUT_S = float(kwargs.get("THANOS_QUERY_TIMEOUT_S", 60))
+        self.THANOS_HEDGE_REQUESTS = (
+            str(kwargs.get("THANOS_HEDGE_REQUESTS", "False")) == "True"
+        )
+        self.THANOS_BREAKER_FAILURES = int(kwargs.get("THANOS_BREAKER_FAILURES", 5))
+        self.THANOS_BREAKER_RESET_S = float(kwargs.get("THANOS_BREAKER_RESET_S", 30))
+        self.PIPELINE_DEPTH = int(kwargs.get("PIPELINE_DEPTH", 2))
+        self.ENRICHER_HOST_TTL_S = float(kwargs.get("ENRICHER_HOST_TTL_S", 21600))
+        self.ENRICHER_SNAPSHOT_PATH = kwargs.get("ENRICHER_SNAPSHOT_PATH", "")
+        self.ENRICHER_SNAPSHOT_INTERVAL = int(
+            kwargs.get("ENRICHER_SNAPSHOT_INTERVAL", 10)
+        )
+        self.ENRICHER_SNAPSHOT_MAX_AGE_S = float(
+            kwargs.get("ENRICHER_SNAPSHOT_MAX_AGE_S", 3600)
+        )
+        self.ANALYSIS_MIN_NEW_SAMPLES = int(kwargs.get("ANALYSIS_MIN_NEW_SAMPLES", 1))
+        self.CHECKPOINT_PATH = kwargs.get("CHECKPOINT_PATH", "")
+        self.CHECKPOINT_INTERVAL = int(kwargs.get("CHECKPOINT_INTERVAL", 1))
+        self.ARROW_EXPORT_PATH = kwargs.get("ARROW_EXPORT_PATH", "")
+        self.ARROW_EXPORT_INTERVAL = int(kwargs.get("ARROW_EXPORT_INTERVAL", 10))
+        self.EXPERIMENT_STORE_PATH = kwargs.get("EXPERIMENT_STORE_PATH", "")
+        self.TRACE_PATH = kwargs.get("TRACE_PATH", "")
+        self.TRACE_SAMPLE_RATE = float(kwargs.get("TRACE_SAMPLE_RATE", 0.01))
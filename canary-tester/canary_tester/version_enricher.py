@@ -1,14 +1,31 @@
-from typing import Dict, List
+from types import MappingProxyType
+import bisect
+from typing import Dict, List, Mapping, Optional
 from dotenv import load_dotenv
 import logging
+import threading
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 
+from canary_tester import tracing
+from canary_tester.enricher_snapshot_store import EnricherSnapshotStore, StoredHistory
+from canary_tester.host_sharder import HostSharder
+from canary_tester.interner import VERSION_CODES
+from canary_tester.metrics import (
+    ENRICHER_HISTORY_ENTRIES,
+    ENRICHER_HISTORY_HOSTS,
+    TICK_STAGE_DURATION,
+)
+from canary_tester.promql_template import QueryTemplate
+from canary_tester.query_planner import QueryPlan, QueryPlanner
+from canary_tester.thanos_client import ThanosClient
 from canary_tester.types import (
     GlobalConfig,
+    QueryAccuracy,
+    QueryPriority,
     StandardScalarMetric,
     VersionEnrichedStandardScalarMetric,
 )
@@ -25,10 +42,12 @@ logger = logging.getLogger("root")
 class VersionEntry:
     ts: float
     version: str
+    code: int
 
     def __init__(self, ts: float, version: str):
         self.ts = ts
         self.version = version
+        self.code = VERSION_CODES.code(version)
 
     def __eq__(self, other: object) -> bool:
         if isinstance(other, VersionEntry):
@@ -36,31 +55,35 @@ class VersionEntry:
         return False
 
 
-class VersionEnricher:
-    """A class that enriches metrics or logs with the version of the host."""
-
-    _host_to_versions: Dict[str, list[VersionEntry]]
-    _frequencies: Dict[str, int]
-    _global_config: GlobalConfig
+# The version of hosts the enricher doesn't know
+_UNKNOWN_ENTRY = VersionEntry(0, "unknown")
 
-    def __init__(self, global_config: GlobalConfig = GlobalConfig()):
-        self._host_to_versions: Dict[str, list[VersionEntry]] = {}
-        self._frequencies = {}
-        self._global_config = global_config
-
-    @property
-    def frequencies(self) -> Dict[str, int]:
-        """Returns the frequencies of the versions of the hosts."""
-        return self._frequencies
 
-    def update(self, timestamp) -> None:
-        """Updates the enricher with the new host to version mapping."""
+class VersionSnapshot:
+    """
+    An immutable host to version mapping as it was known at `timestamp`. The
+    enricher publishes a new snapshot after every update, a tester takes one
+    snapshot per run such that all its lookups are consistent.
+    """
 
-        self._fetch_host_version(timestamp)
+    timestamp: float
+    host_to_versions: Mapping[str, tuple[VersionEntry, ...]]
+    frequencies: Mapping[str, int]
 
-        self._set_frequencies()
+    def __init__(
+        self, timestamp: float, host_to_versions: Dict[str, list[VersionEntry]]
+    ):
+        self.timestamp = timestamp
+        self.host_to_versions = MappingProxyType(
+            {host: tuple(entries) for host, entries in host_to_versions.items()}
+        )
 
-        logger.debug(self._frequencies)
+        frequencies: Dict[str, int] = {}
+        for entries in self.host_to_versions.values():
+            frequencies[entries[-1].version] = (
+                frequencies.get(entries[-1].version, 0) + 1
+            )
+        self.frequencies = MappingProxyType(frequencies)
 
     def enrich(
         self, metrics: List[StandardScalarMetric]
@@ -70,12 +93,14 @@ class VersionEnricher:
         enriched_metrics = []
 
         for metric in metrics:
+            entry = self.get_entry_at_ts(metric)
             enriched_metrics.append(
                 VersionEnrichedStandardScalarMetric(
                     ts=metric.ts,
                     host_name=metric.host_name,
                     value=metric.value,
-                    version=self._get_version_at_ts(metric),
+                    version=entry.version,
+                    version_code=entry.code,
                 )
             )
 
@@ -83,13 +108,18 @@ class VersionEnricher:
 
     def get_host_with_changed_version_in_interval(
         self, version_under_test: str, start: float, end: float
-    ):
+    ) -> list[tuple[str, float]]:
+        """
+        Returns the hosts that changed to the version under test in the interval
+        (start, end]. The interval is half-open such that consecutive intervals
+        don't return the same change twice.
+        """
         host_with_changed_version: list[tuple[str, float]] = []
 
-        for host, versions in self._host_to_versions.items():
+        for host, versions in self.host_to_versions.items():
             if (
                 len(versions) > 1
-                and versions[-1].ts >= start
+                and versions[-1].ts > start
                 and versions[-1].ts <= end
                 and versions[-1].version == version_under_test
             ):
@@ -97,63 +127,351 @@ class VersionEnricher:
 
         return host_with_changed_version
 
-    def verify_version(self, version: str) -> bool:
-        """Verifies if the version is in the mapping."""
-
-        return version in self._frequencies.keys()
-
-    def _get_version_at_ts(self, metric: StandardScalarMetric) -> str:
+    def get_version_at_ts(self, metric: StandardScalarMetric) -> str:
         """Returns the version of the host at the timestamp of the metric."""
-        if metric.host_name not in self._host_to_versions.keys():
-            return "unknown"
+        return self.get_entry_at_ts(metric).version
 
-        version_entries = self._host_to_versions[metric.host_name]
+    def get_entry_at_ts(self, metric: StandardScalarMetric) -> VersionEntry:
+        """Returns the version entry of the host at the timestamp of the metric."""
+        version_entries = self.host_to_versions.get(metric.host_name)
+        if version_entries is None:
+            return _UNKNOWN_ENTRY
 
         if len(version_entries) == 1:
-            return version_entries[0].version
+            return version_entries[0]
 
         for i in range(1, len(version_entries)):
             if version_entries[i].ts > metric.ts:
-                return version_entries[i - 1].version
+                return version_entries[i - 1]
+
+        return version_entries[-1]
+
+
+class VersionEnricher:
+    """
+    A class that enriches metrics or logs with the version of the host.
+
+    The enricher is double-buffered: updates are applied to a private host to
+    version history and then published as a new immutable VersionSnapshot by
+    swapping a single reference. With `start_refresher` the updates run in a
+    background thread, such that the ticks don't wait for the fleet version query.
+
+    After every update the history is compacted: entries older than `retention_s`
+    are dropped (except the one that holds the version at the start of the
+    retention) and hosts that weren't seen for ENRICHER_HOST_TTL_S are removed,
+    such that the memory stays flat in a long running process.
+
+    With a snapshot store, the history is saved every ENRICHER_SNAPSHOT_INTERVAL
+    updates and can be restored after a restart with `restore`.
+
+    Parameters:
+    global_config: GlobalConfig
+        The global config.
+    retention_s: float
+        How far back the version history is needed, i.e. the max time of the
+        experiment plus the stabilization and monitoring time. None keeps all.
+    snapshot_store: EnricherSnapshotStore
+        Where the history is saved, None doesn't save it.
+    """
+
+    _host_to_versions: Dict[str, list[VersionEntry]]
+    _last_seen: Dict[str, float]
+    _retention_s: Optional[float]
+    _snapshot: VersionSnapshot
+    _global_config: GlobalConfig
+    _host_sharder: HostSharder
+    _thanos: ThanosClient
+    _updates: int
+    _snapshot_store: Optional[EnricherSnapshotStore]
+    _refresher: Optional[threading.Thread]
+    _refresh_condition: threading.Condition
+    _requested_timestamp: Optional[float]
+    _stop_refresher: bool
+
+    _query = "max(osix_build_info) by (host, version)"
+    # Only returns the host labels, such that discovering new hosts stays cheap
+    # compared to the version query on large fleets.
+    _discovery_query = "group(osix_build_info) by (host)"
+
+    def __init__(
+        self,
+        global_config: GlobalConfig = GlobalConfig(),
+        retention_s: Optional[float] = None,
+        snapshot_store: Optional[EnricherSnapshotStore] = None,
+    ):
+        self._host_to_versions: Dict[str, list[VersionEntry]] = {}
+        self._last_seen = {}
+        self._retention_s = retention_s
+        self._snapshot = VersionSnapshot(0, {})
+        self._global_config = global_config
+        self._host_sharder = HostSharder(global_config)
+        self._thanos = ThanosClient(
+            global_config,
+            "enricher",
+            self._create_sesion_with_retries(),
+            QueryPriority.Enricher,
+        )
+        self._updates = 0
+        self._snapshot_store = snapshot_store
+        self._refresher = None
+        self._refresh_condition = threading.Condition()
+        self._requested_timestamp = None
+        self._stop_refresher = False
 
-        return version_entries[-1].version
+    @property
+    def snapshot(self) -> VersionSnapshot:
+        """Returns the latest published host to version mapping."""
+        return self._snapshot
 
-    def _set_frequencies(self):
+    @property
+    def frequencies(self) -> Mapping[str, int]:
+        """Returns the frequencies of the versions of the hosts."""
+        return self._snapshot.frequencies
+
+    @property
+    def hosts(self) -> List[str]:
+        """Returns all hosts the enricher has seen so far."""
+        return list(self._snapshot.host_to_versions.keys())
 
-        self._frequencies = {}
-        for entries in self._host_to_versions.values():
-            self._frequencies[entries[-1].version] = (
-                self._frequencies.get(entries[-1].version, 0) + 1
+    def update(self, timestamp) -> None:
+        """
+        Updates the enricher with the new host to version mapping and publishes it.
+        Must not be called concurrently, use `request_update` while the refresher
+        runs.
+        """
+
+        with (
+            TICK_STAGE_DURATION.labels("enricher", "enricher_update").time(),
+            tracing.span("enricher_update", timestamp=timestamp) as span,
+        ):
+            self._fetch_host_version(timestamp)
+            self._updates += 1
+
+            self.compact(timestamp)
+            self._publish(timestamp)
+            span["hosts"] = len(self._host_to_versions)
+
+        if (
+            self._snapshot_store is not None
+            and self._updates % self._global_config.ENRICHER_SNAPSHOT_INTERVAL == 0
+        ):
+            self.save()
+
+        logger.debug(dict(self._snapshot.frequencies))
+
+    def history(self) -> StoredHistory:
+        """Returns the history of the latest published snapshot."""
+        snapshot = self._snapshot
+        return StoredHistory(
+            snapshot.timestamp,
+            {
+                host: [(e.ts, e.version) for e in entries]
+                for host, entries in snapshot.host_to_versions.items()
+            },
+            dict(self._last_seen),
+        )
+
+    def save(self) -> None:
+        """Saves the latest published snapshot to the snapshot store."""
+        if self._snapshot_store is None:
+            return
+
+        if not self._snapshot.host_to_versions:
+            # Nothing fetched yet, don't replace a previous snapshot with an empty one
+            return
+
+        try:
+            self._snapshot_store.save(self.history())
+        except OSError as e:
+            # Only the next restart is slower, the experiment goes on.
+            logger.error(f"Saving the enricher snapshot failed: {e}")
+
+    def restore(self, timestamp: float) -> bool:
+        """
+        Loads the saved history and publishes it, if it is from before `timestamp`
+        and at most ENRICHER_SNAPSHOT_MAX_AGE_S old. The next update then only adds
+        the changes since the snapshot. Returns whether a snapshot was restored.
+        """
+        if self._snapshot_store is None:
+            return False
+
+        stored = self._snapshot_store.load()
+        if stored is None:
+            return False
+
+        age_s = timestamp - stored.timestamp
+        if age_s < 0 or age_s > self._global_config.ENRICHER_SNAPSHOT_MAX_AGE_S:
+            logger.info(f"Ignore enricher snapshot that is {age_s:.0f}s old")
+            return False
+
+        self.restore_history(stored)
+
+        logger.info(
+            f"Restored enricher snapshot of {len(self._host_to_versions)} hosts,"
+            f" {age_s:.0f}s old"
+        )
+        return True
+
+    def restore_history(self, stored: StoredHistory) -> None:
+        """Replaces the history with the stored one and publishes it."""
+        self._host_to_versions = {
+            host: [VersionEntry(ts, version) for ts, version in entries]
+            for host, entries in stored.host_to_versions.items()
+            if entries
+        }
+        self._last_seen = {
+            host: stored.last_seen.get(host, stored.timestamp)
+            for host in self._host_to_versions
+        }
+        self.compact(stored.timestamp)
+        self._publish(stored.timestamp)
+
+    @property
+    def size(self) -> int:
+        """Returns the number of version entries in the history."""
+        return sum(len(entries) for entries in self._host_to_versions.values())
+
+    def compact(self, timestamp: float) -> None:
+        """
+        Drops the history that is not needed anymore at `timestamp`. Not published
+        until the next update.
+        """
+        horizon = (
+            timestamp - self._retention_s if self._retention_s is not None else None
+        )
+        host_ttl_s = self._global_config.ENRICHER_HOST_TTL_S
+
+        for host in list(self._host_to_versions.keys()):
+            if timestamp - self._last_seen.get(host, timestamp) > host_ttl_s:
+                # The host disappeared from the fleet
+                del self._host_to_versions[host]
+                del self._last_seen[host]
+                continue
+
+            entries = self._host_to_versions[host]
+            if horizon is None or len(entries) < 2:
+                continue
+
+            # Keep the last entry before the horizon, it holds the version of the host
+            # at the horizon.
+            first_kept = bisect.bisect_right([e.ts for e in entries], horizon) - 1
+            if first_kept > 0:
+                self._host_to_versions[host] = entries[first_kept:]
+
+        ENRICHER_HISTORY_HOSTS.set(len(self._host_to_versions))
+        ENRICHER_HISTORY_ENTRIES.set(self.size)
+
+    def start_refresher(self) -> None:
+        """
+        Starts the background thread that runs the updates asked for with
+        `request_update`.
+        """
+        if self._refresher is not None:
+            return
+
+        self._stop_refresher = False
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, daemon=True, name="enricher-refresher"
+        )
+        self._refresher.start()
+
+    def stop_refresher(self) -> None:
+        """Stops the background thread after its current update."""
+        if self._refresher is None:
+            return
+
+        with self._refresh_condition:
+            self._stop_refresher = True
+            self._refresh_condition.notify()
+        self._refresher.join()
+        self._refresher = None
+
+    def request_update(self, timestamp: float) -> None:
+        """
+        Asks the refresher to update the mapping up to `timestamp` and returns
+        immediately. If the refresher is still busy, only the latest requested
+        timestamp is fetched afterwards. Without a refresher the update runs
+        synchronously.
+        """
+        if self._refresher is None:
+            self.update(timestamp)
+            return
+
+        with self._refresh_condition:
+            self._requested_timestamp = max(
+                timestamp, self._requested_timestamp or timestamp
             )
+            self._refresh_condition.notify()
+
+    def enrich(
+        self, metrics: List[StandardScalarMetric]
+    ) -> List[VersionEnrichedStandardScalarMetric]:
+        """Enriches the metrics with the version of the host."""
+        return self._snapshot.enrich(metrics)
+
+    def get_host_with_changed_version_in_interval(
+        self, version_under_test: str, start: float, end: float
+    ) -> list[tuple[str, float]]:
+        """See VersionSnapshot.get_host_with_changed_version_in_interval."""
+        return self._snapshot.get_host_with_changed_version_in_interval(
+            version_under_test, start, end
+        )
+
+    def verify_version(self, version: str) -> bool:
+        """Verifies if the version is in the mapping."""
+
+        return version in self._snapshot.frequencies
+
+    def _publish(self, timestamp: float) -> None:
+        """Swaps in a snapshot of the current history."""
+        self._snapshot = VersionSnapshot(timestamp, self._host_to_versions)
+
+    def _refresh_loop(self) -> None:
+        while True:
+            with self._refresh_condition:
+                while self._requested_timestamp is None and not self._stop_refresher:
+                    self._refresh_condition.wait()
+                if self._stop_refresher:
+                    return
+                timestamp = self._requested_timestamp
+                self._requested_timestamp = None
+
+            try:
+                self.update(timestamp)
+            except Exception as e:
+                # The testers keep using the previous snapshot.
+                logger.error(f"Enricher update failed: {e}")
 
     def _fetch_host_version(self, timestamp: float):
 
         params = {
-            "query": "max(osix_build_info) by (host, version)",
+            "query": self._query,
             "dedup": "true",
-            "partial_response": "false",
             "time": timestamp,
             "engine": "thanos",
             "analyze": "false",
         }
-        session = self._create_sesion_with_retries()
-
-        res = session.get(
-            self._global_config.THANOS_QUERIER_ENDPOINT + "/api/v1/query",
-            params=params,
-            cookies={"_oauth2_proxy_osdp_open_ch": self._global_config.AUTH_COOKIE},
-            verify=self._global_config.VERIFY_SSL,
-        )
+        plan = QueryPlanner.plan(timestamp, timestamp, QueryAccuracy.Exact)
 
         try:
-            res.raise_for_status()
-            json_extract = res.json()
+            if self._host_sharder.enabled:
+                hosts = set(self._host_to_versions.keys())
+                if self._should_discover():
+                    hosts.update(self._discover_hosts(params, plan))
+                json_extract = self._host_sharder.fetch(
+                    QueryTemplate.compile(self._query),
+                    params,
+                    sorted(hosts),
+                    lambda p: self._thanos.query(p, plan),
+                )
+            else:
+                json_extract = self._thanos.query(params, plan)
 
         except requests.exceptions.HTTPError as e:
             raise Exception(
-                f"Error while fetching host version: {e} {res.text} {res.url}: THIS"
-                " MIGHT BE A PROBLEM WITH AUTHENTICATION OR THE QUERY"
-                " ITSELF."
+                f"Error while fetching host version: {e} {e.response.text}"
+                f" {e.response.url}: THIS MIGHT BE A PROBLEM WITH AUTHENTICATION OR"
+                " THE QUERY ITSELF."
             )
 
         for el in json_extract["data"]["result"]:
@@ -169,8 +487,29 @@ class VersionEnricher:
                     el["metric"]["host"], el["value"][0], "unknown"
                 )
 
+    def _should_discover(self) -> bool:
+        """
+        The sharded query only asks for the hosts we already know. Every
+        HOST_SHARD_DISCOVERY_INTERVAL updates we ask for the hosts of the whole fleet,
+        such that new hosts are discovered.
+        """
+        return (
+            len(self._host_to_versions) == 0
+            or self._updates % self._global_config.HOST_SHARD_DISCOVERY_INTERVAL == 0
+        )
+
+    def _discover_hosts(self, params: dict, plan: QueryPlan) -> List[str]:
+        """Returns the hosts of the whole fleet, without their versions."""
+        res = self._thanos.query({**params, "query": self._discovery_query}, plan)
+        return [
+            el["metric"]["host"]
+            for el in res["data"]["result"]
+            if "host" in el["metric"]
+        ]
+
     def _add_version_to_host(self, host: str, ts: int, version: str) -> None:
         """Adds a version to a host in the mapping."""
+        self._last_seen[host] = max(ts, self._last_seen.get(host, ts))
         entries = self._host_to_versions.setdefault(host, [])
         if not entries or (entries[-1].version != version and entries[-1].ts < ts):
             entries.append(VersionEntry(ts, version))
@@ -180,7 +519,9 @@ class VersionEnricher:
         retry = Retry(
             total=3,
             backoff_factor=0.1,
-            status_forcelist=[500, 502, 503, 504, 422],
+            # 429 and 503 are handled by the QueryGovernor, which slows down all
+            # queries of the process instead of retrying this one immediately.
+            status_forcelist=[500, 502, 504, 422],
         )
         adapter = HTTPAdapter(max_retries=retry)
         session.mount("http://", adapter)
@@ -1,5 +1,6 @@
 from asgiref.wsgi import WsgiToAsgi
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import threading
 from logging.config import dictConfig
 import logging
@@ -47,6 +48,7 @@ def worker_loop(data):
             data["control_group_versions"],
             data["simulation_speedup_factor"],
             thread,
+            data["catch_up"],
         )
     except Exception as e:
         logger.info(f"experiment stopped: {e}")
@@ -57,6 +59,18 @@ def worker_loop(data):
             thread.started = True
 
 
+def resume_worker_loop():
+    try:
+        experiment.resume(thread)
+    except Exception as e:
+        logger.info(f"experiment stopped: {e}")
+    finally:
+        with thread.lock:
+            thread.finished = True
+            thread.should_stop = False
+            thread.started = True
+
+
 @app.route("/start", methods=["POST"])
 async def start_experiment():
     global thread
@@ -75,37 +89,47 @@ async def start_experiment():
         data["control_group_versions"] = []
     if "simulation_speedup_factor" not in data:
         data["simulation_speedup_factor"] = 1
+    if "catch_up" not in data:
+        data["catch_up"] = False
+
+    if data["catch_up"] and data["start_time"] is None:
+        return jsonify({"error": "catch_up requires a start_time"}), 400
 
-    if data["start_time"] is not None:
+    if data["start_time"] is not None and not data["catch_up"]:
         start = dt.datetime.fromtimestamp(int(data["start_time"]))
         end = start + dt.timedelta(seconds=int(data["max_time_s"]))
         now = dt.datetime.now()
         if end > now:
             return jsonify({"error": "end of experiment is in the future"}), 400
 
+    return _start_worker(worker_loop, (data,), "Experiment started")
+
+
+@app.route("/resume", methods=["POST"])
+async def resume_experiment():
+    return _start_worker(resume_worker_loop, (), "Experiment resumed")
+
+
+def _start_worker(target, args, message):
     with thread.lock:
         if thread.started and thread.finished and thread.thread is not None:
             thread.thread.join()
             thread.finished = False
             thread.started = True
             thread.should_stop = False
-            thread.thread = threading.Thread(
-                target=worker_loop, daemon=True, args=(data,)
-            )
+            thread.thread = threading.Thread(target=target, daemon=True, args=args)
             thread.thread.start()
-            return jsonify({"message": "Experiment started"}), 200
+            return jsonify({"message": message}), 200
         elif thread.thread is not None and thread.started and not thread.finished:
             return jsonify({"error": "Experiment already running"}), 400
         else:
             thread.started = True
             thread.should_stop = False
             thread.finished = False
-            thread.thread = threading.Thread(
-                target=worker_loop, daemon=True, args=(data,)
-            )
+            thread.thread = threading.Thread(target=target, daemon=True, args=args)
             thread.thread.start()
 
-            return jsonify({"message": "Experiment started"}), 200
+            return jsonify({"message": message}), 200
 
 
 @app.route("/stop", methods=["POST"])
@@ -123,6 +147,11 @@ def healthz():
     return "True"
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+
 asgi_app = WsgiToAsgi(app)
 
 
@@ -78,6 +78,7 @@ class TestRun:
             "host4": [VersionEntry(0, "0.0.0"), VersionEntry(2, "1.0.0")],
             "host5": [VersionEntry(0, "0.0.0"), VersionEntry(4, "1.0.0")],
         }
+        enricher._publish(0)
 
         test_config: SingleTestConfigType = {
             "name": "test",
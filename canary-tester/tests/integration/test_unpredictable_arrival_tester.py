@@ -148,6 +148,6 @@ def _init_enricher():
         "host4": [VersionEntry(1, "1.0.0")],
     }
 
-    enricher._set_frequencies()
+    enricher._publish(0)
 
     return enricher
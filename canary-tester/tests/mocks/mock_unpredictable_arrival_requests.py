@@ -5,6 +5,8 @@ class MockResponse:
     def __init__(self, json_data, status_code):
         self.json_data = json_data
         self.status_code = status_code
+        self.content = json.dumps(json_data).encode()
+        self.headers = {}
 
     def json(self):
         return self.json_data
@@ -0,0 +1,45 @@
+import pytest
+import scipy as sp
+
+from canary_tester.tester.alpha_spending import AlphaSpendingSchedule
+from canary_tester.types import AlphaSpending
+
+
+class TestAlphaSpendingSchedule:
+    def test_obrien_fleming_matches_formula(self):
+        schedule = AlphaSpendingSchedule(AlphaSpending.OBrienFleming, 4, 0.05)
+
+        for peek in range(1, 5):
+            t = peek / 4
+            expected = 4 - 4 * sp.stats.norm.cdf(
+                sp.stats.norm.ppf(1 - 0.05 / 4) / t ** (0.5 / 2)
+            )
+            assert schedule.alpha_at(peek) == pytest.approx(expected)
+
+    @pytest.mark.parametrize(
+        "function",
+        [AlphaSpending.OBrienFleming, AlphaSpending.Pocock, AlphaSpending.PowerFamily],
+    )
+    def test_spends_full_alpha_at_last_peek(self, function):
+        schedule = AlphaSpendingSchedule(function, 10, 0.05)
+
+        alphas = [schedule.alpha_at(peek) for peek in range(1, 11)]
+
+        assert alphas == sorted(alphas)
+        assert alphas[-1] == pytest.approx(0.05)
+
+    def test_boundaries_are_shared(self):
+        a = AlphaSpendingSchedule(AlphaSpending.Pocock, 7, 0.01)
+        b = AlphaSpendingSchedule(AlphaSpending.Pocock, 7, 0.01)
+
+        assert a._boundaries is b._boundaries
+
+    def test_information_fraction(self):
+        schedule = AlphaSpendingSchedule(
+            AlphaSpending.PowerFamily, 10, 0.05, rho=1, max_samples=100
+        )
+
+        assert schedule.alpha_at(2, samples=50) == pytest.approx(0.025)
+        assert schedule.alpha_at(2, samples=500) == pytest.approx(0.05)
+        # The last peek spends the full alpha, no matter how little data arrived
+        assert schedule.alpha_at(10, samples=0) == pytest.approx(0.05)
@@ -0,0 +1,88 @@
+from unittest import mock
+
+import pyarrow as pa
+
+from canary_tester.arrow_export import ArrowExport
+from canary_tester.tester.group_store import ArchiveGroupStore
+from canary_tester.tester.unpredictable_arrival_tester import UnpredictableArrivalTester
+from canary_tester.types import (
+    GlobalConfig,
+    TesterReturn,
+    TesterReturnReason,
+    TesterReturnType,
+    VersionEnrichedStandardScalarMetric,
+)
+
+
+def _tester(**test_config) -> UnpredictableArrivalTester:
+    statistic_test = mock.Mock(always_valid=False)
+    statistic_test.effect_size_ci.return_value = (0.0, 10.0)
+    statistic_test.p_value.return_value = 0.5
+    return UnpredictableArrivalTester(
+        "1.0.0",
+        10,
+        ["0.9.0"],
+        None,
+        {
+            "name": "test",
+            "significance_level": 0.05,
+            "minimal_effect_size_of_interest": 0,
+            "direction": "Bigger",
+            **test_config,
+        },
+        statistic_test,
+        GlobalConfig(),
+    )
+
+
+def _metrics(version: str, timestamps: list[int]):
+    return [
+        VersionEnrichedStandardScalarMetric(ts, f"host-{version}", 1.0, version)
+        for ts in timestamps
+    ]
+
+
+class TestArrowExport:
+    def test_export_and_read(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        tester = _tester()
+        tester._apply_new_data_chunk(
+            _metrics("1.0.0", [1, 3, 6]) + _metrics("0.9.0", [2, 4])
+        )
+        tester._analyze([1.0, 2.0], [1.0, 2.0], 60, 1, 60)
+        tester.decision = TesterReturn(
+            "test", TesterReturnType.TERMINATION, TesterReturnReason.WORSE
+        )
+
+        tester.export_arrow(str(tmp_path / "export"))
+        groups = ArrowExport.read(str(tmp_path / "export"), "test", "groups")
+        peeks = ArrowExport.read(str(tmp_path / "export"), "test", "peeks")
+        decision = ArrowExport.read(str(tmp_path / "export"), "test", "decision")
+
+        assert groups.column("group").to_pylist() == ["treatment"] * 3 + ["control"] * 2
+        assert groups.column("ts").to_pylist() == [1, 3, 6, 2, 4]
+        assert groups.column("host").to_pylist()[-1] == "host-0.9.0"
+        assert groups.column("value").to_pylist() == [1.0, 2.0, 3.0, 1.0, 2.0]
+        assert peeks.num_rows == 1
+        assert peeks.column("reason").to_pylist() == ["COULD_NOT_MAKE_DECISION"]
+        assert decision.to_pylist() == [
+            {"name": "test", "type": "TERMINATION", "reason": "WORSE", "peek": 0}
+        ]
+
+    def test_archived_values_are_not_copied(self, tmp_path):
+        store = ArchiveGroupStore(str(tmp_path / "archive"))
+        for metric in _metrics("1.0.0", [1, 2, 3]):
+            store.append(metric)
+
+        (batch,) = ArrowExport.group_batches([store])
+
+        values = store.columns()[2]
+        assert batch.column(3).buffers()[1].address == values.ctypes.data
+
+    def test_sketches_have_no_samples(self):
+        tester = _tester(group_store="KLL")
+        tester._apply_new_data_chunk(_metrics("1.0.0", [1, 3]))
+
+        assert tester.group_batches() == []
+        assert isinstance(tester.peek_batch(), pa.RecordBatch)
+        assert tester.decision_batch().num_rows == 0
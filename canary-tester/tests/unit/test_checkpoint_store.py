@@ -0,0 +1,123 @@
+import gzip
+import os
+import pickle
+import random
+
+from canary_tester import checkpoint_store
+from canary_tester.checkpoint_store import CheckpointStore, ExperimentCheckpoint
+from canary_tester.enricher_snapshot_store import StoredHistory
+from canary_tester.interner import HOST_CODES, VERSION_CODES
+from canary_tester.tester.sample_archive import SampleArchive
+from canary_tester.tester.unpredictable_arrival_tester import UnpredictableArrivalTester
+from canary_tester.types import VersionEnrichedStandardScalarMetric
+
+
+def _tester(**test_config) -> UnpredictableArrivalTester:
+    return UnpredictableArrivalTester(
+        "1.0.0", 10, [], None, {"name": "test", **test_config}, None, None
+    )
+
+
+def _checkpoint(tester_states) -> ExperimentCheckpoint:
+    return ExperimentCheckpoint(
+        version_under_test="1.0.0",
+        max_time_s=600,
+        fetch_interval_s=60,
+        start_time=None,
+        control_group_versions=["0.9.0"],
+        simulation_speedup_factor=1,
+        catch_up=False,
+        initial_timestamp=1000.0,
+        previous_timestamp=1120.0,
+        finished_tests=[],
+        tester_states=tester_states,
+        enricher_history=StoredHistory(1120.0, {"host1": [(900.0, "1.0.0")]}, {}),
+        random_state=random.getstate(),
+        version_codes=VERSION_CODES.values(),
+        host_codes=HOST_CODES.values(),
+    )
+
+
+class TestCheckpointStore:
+    def test_restores_tester_state(self, tmp_path):
+        tester = _tester()
+        tester._apply_new_data_chunk(
+            [
+                VersionEnrichedStandardScalarMetric(ts, "host1", 1.0, "1.0.0")
+                for ts in (3, 5, 9)
+            ]
+        )
+        tester._increase_peek()
+        store = CheckpointStore(str(tmp_path))
+
+        store.save(_checkpoint({tester.name: tester.checkpoint_state()}))
+        checkpoint = store.load()
+        resumed = _tester()
+        resumed.restore_state(checkpoint.tester_states["test"])
+
+        assert checkpoint.previous_timestamp == 1120.0
+        assert checkpoint.enricher_history.host_to_versions == {
+            "host1": [(900.0, "1.0.0")]
+        }
+        assert resumed._current_peek == 2
+        last = resumed._treatment_group.last()
+        assert checkpoint.version_codes[last.version_code] == "1.0.0"
+        assert resumed._samples_seen == tester._samples_seen
+        assert resumed._treatment_group.bucket() == tester._treatment_group.bucket()
+        assert os.listdir(tmp_path) == ["checkpoint.pkl.gz"]
+
+    def test_restores_archived_groups(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        tester = _tester(group_store="Archive")
+        # More records than the initial capacity of the archive
+        tester._apply_new_data_chunk(
+            [
+                VersionEnrichedStandardScalarMetric(ts, "host1", 1.0, "1.0.0")
+                for ts in range(5000)
+            ]
+        )
+        values = tester._treatment_group.bucket().tolist()
+        store = CheckpointStore(str(tmp_path / "checkpoint"))
+
+        store.save(_checkpoint({tester.name: tester.checkpoint_state()}))
+        checkpoint = store.load()
+        # The resumed experiment builds its testers before it restores them
+        resumed = _tester(group_store="Archive")
+        resumed.restore_state(checkpoint.tester_states["test"])
+
+        assert len(resumed._treatment_group) == 5000
+        assert resumed._treatment_group.bucket().tolist() == values
+        assert values[-1] == 1.0
+
+    def test_ignores_other_format_version(self, tmp_path, monkeypatch):
+        store = CheckpointStore(str(tmp_path))
+        monkeypatch.setattr(checkpoint_store, "_FORMAT_VERSION", 0)
+        store.save(_checkpoint({}))
+        monkeypatch.undo()
+
+        assert store.load() is None
+
+    def test_ignores_broken_checkpoint(self, tmp_path):
+        with open(tmp_path / "checkpoint.pkl.gz", "wb") as f:
+            f.write(gzip.compress(b"not a pickle")[:10])
+
+        assert CheckpointStore(str(tmp_path)).load() is None
+        assert CheckpointStore(str(tmp_path / "missing")).load() is None
+
+
+class TestSampleArchiveCheckpoint:
+    def test_continues_after_checkpoint(self, tmp_path):
+        archive = SampleArchive(str(tmp_path / "group"))
+        archive.append(1, "host1", 1.0)
+        state = pickle.dumps(archive)
+        # Written after the checkpoint, lost on resume
+        archive.append(2, "host1", 2.0)
+
+        resumed = pickle.loads(state)
+        resumed.append(3, "host1", 3.0)
+        resumed.close()
+
+        assert SampleArchive.load(str(tmp_path / "group"))["value"].tolist() == [
+            1.0,
+            3.0,
+        ]
@@ -0,0 +1,93 @@
+import time
+from unittest import mock
+
+import pytest
+
+from canary_tester.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+)
+from canary_tester.thanos_client import DeadlineExceeded, ThanosClient
+from canary_tester.types import GlobalConfig
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=1, reset_s=0)
+    breaker.record(False)
+    time.sleep(0.001)
+    return breaker
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_s=60)
+
+        breaker.record(False)
+        breaker.before_request()
+        breaker.record(False)
+
+        assert breaker.state == CircuitState.Open
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request()
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_s=60)
+
+        breaker.record(False)
+        breaker.record(True)
+        breaker.record(False)
+
+        assert breaker.state == CircuitState.Closed
+
+    def test_trial_query_after_reset_time(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_s=0)
+        breaker.record(False)
+        time.sleep(0.001)
+
+        breaker.before_request()
+
+        assert breaker.state == CircuitState.HalfOpen
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request()
+
+        breaker.record(True)
+
+        assert breaker.state == CircuitState.Closed
+
+    def test_release_reopens_half_open_circuit(self):
+        breaker = _half_open_breaker()
+        breaker.before_request()
+
+        breaker.release()
+
+        assert breaker.state == CircuitState.Open
+        time.sleep(0.001)
+        breaker.before_request()
+        assert breaker.state == CircuitState.HalfOpen
+
+    def test_release_keeps_closed_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_s=60)
+
+        breaker.release()
+
+        assert breaker.state == CircuitState.Closed
+
+    @pytest.mark.parametrize(
+        "error", [DeadlineExceeded("deadline exceeded"), ValueError("unexpected")]
+    )
+    def test_unrecorded_trial_query_releases_the_circuit(self, error):
+        breaker = _half_open_breaker()
+        client = ThanosClient(GlobalConfig(), "test")
+
+        with (
+            mock.patch.object(CircuitBreaker, "shared", return_value=breaker),
+            mock.patch.object(ThanosClient, "_send", side_effect=error),
+        ):
+            with pytest.raises(type(error)):
+                client.query({"query": "up"})
+
+            assert breaker.state == CircuitState.Open
+            time.sleep(0.001)
+            with pytest.raises(type(error)):
+                client.query({"query": "up"})
@@ -0,0 +1,42 @@
+import os
+
+from canary_tester.enricher_snapshot_store import EnricherSnapshotStore, StoredHistory
+
+
+class TestEnricherSnapshotStore:
+    def test_load_without_snapshot(self, tmp_path):
+        assert EnricherSnapshotStore(str(tmp_path)).load() is None
+
+    def test_save_and_load(self, tmp_path):
+        store = EnricherSnapshotStore(str(tmp_path))
+        store.save(
+            StoredHistory(
+                100,
+                {
+                    "host1": [(10, "1.0.0"), (50, "2.0.0")],
+                    "host2": [(20, "2.0.0")],
+                },
+                {"host1": 100, "host2": 90},
+            )
+        )
+
+        history = store.load()
+
+        assert history.timestamp == 100
+        assert history.host_to_versions == {
+            "host1": [(10.0, "1.0.0"), (50.0, "2.0.0")],
+            "host2": [(20.0, "2.0.0")],
+        }
+        assert history.last_seen == {"host1": 100.0, "host2": 90.0}
+
+    def test_save_replaces_previous_snapshot(self, tmp_path):
+        store = EnricherSnapshotStore(str(tmp_path))
+        store.save(StoredHistory(100, {"host1": [(10, "1.0.0")]}, {}))
+        store.save(StoredHistory(200, {"host1": [(150, "2.0.0")]}, {}))
+
+        history = store.load()
+
+        assert history.timestamp == 200
+        assert history.host_to_versions == {"host1": [(150.0, "2.0.0")]}
+        assert history.last_seen == {"host1": 200.0}
+        assert len([n for n in os.listdir(tmp_path) if n.startswith("snapshot-")]) == 1
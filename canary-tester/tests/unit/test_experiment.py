@@ -0,0 +1,182 @@
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from prometheus_client import REGISTRY
+
+from canary_tester import experiment
+from canary_tester.types import (
+    RunningThread,
+    TesterReturn,
+    TesterReturnReason,
+    TesterReturnType,
+)
+from canary_tester.version_enricher import VersionSnapshot
+
+
+class FakeEnricher:
+    def __init__(self):
+        self.snapshot = VersionSnapshot(0, {})
+
+    def update(self, timestamp):
+        self.snapshot = VersionSnapshot(timestamp, {})
+
+
+class FakeTester:
+    name = "fake"
+
+    def __init__(self):
+        self.processed = []
+
+    def prefetch(self, start_timestamp, end_timestamp, tick_s):
+        pass
+
+    def fetch(self, previous_timestamp, current_timestamp, snapshot, deadline=None):
+        return current_timestamp
+
+    def process(
+        self,
+        data,
+        previous_timestamp,
+        current_timestamp,
+        total_seconds_passed,
+        snapshot,
+    ):
+        self.processed.append((data, snapshot.timestamp))
+        return TesterReturn(
+            self.name, TesterReturnType.CONTINUE, TesterReturnReason.NOT_ENOUGH_DATA
+        )
+
+
+class TestCatchUp:
+    @pytest.mark.parametrize("pipeline_depth", [0, 2])
+    def test_processes_every_tick_in_order_with_its_snapshot(self, pipeline_depth):
+        initial_timestamp = int(dt.datetime.now().timestamp()) - 5 * 60
+        tester = FakeTester()
+        executor = ThreadPoolExecutor(max_workers=2) if pipeline_depth else None
+
+        previous_timestamp = experiment._catch_up(
+            FakeEnricher(),
+            [tester],
+            [],
+            60,
+            RunningThread(),
+            initial_timestamp,
+            executor,
+            pipeline_depth,
+        )
+
+        ticks = [initial_timestamp + i * 60 for i in range(1, 6)]
+        assert tester.processed == [(ts, ts) for ts in ticks]
+        assert previous_timestamp == ticks[-1]
+
+    def test_resumes_after_from_timestamp(self):
+        initial_timestamp = int(dt.datetime.now().timestamp()) - 5 * 60
+        tester = FakeTester()
+        saved = []
+
+        previous_timestamp = experiment._catch_up(
+            FakeEnricher(),
+            [tester],
+            [],
+            60,
+            RunningThread(),
+            initial_timestamp,
+            None,
+            0,
+            from_timestamp=initial_timestamp + 3 * 60,
+            on_tick=lambda ts, finished: saved.append(ts),
+        )
+
+        ticks = [initial_timestamp + i * 60 for i in range(4, 6)]
+        assert tester.processed == [(ts, ts) for ts in ticks]
+        assert saved == ticks
+        assert previous_timestamp == ticks[-1]
+
+
+class RefreshingEnricher(FakeEnricher):
+    """Publishes the requested updates only when asked to, like a slow refresher."""
+
+    def __init__(self):
+        super().__init__()
+        self.requested = []
+
+    def request_update(self, timestamp):
+        self.requested.append(timestamp)
+
+
+class TestRunLive:
+    def test_ticks_use_the_latest_snapshot_and_request_the_next_one(self):
+        previous_timestamp = int(dt.datetime.now().timestamp()) - 60 * 60
+        enricher = RefreshingEnricher()
+        enricher.update(previous_timestamp)
+        tester = FakeTester()
+        thread = RunningThread()
+
+        def on_tick(timestamp, finished):
+            if len(tester.processed) == 2:
+                thread.should_stop = True
+            else:
+                enricher.update(enricher.requested[-1])
+
+        experiment._run_live(
+            enricher,
+            [tester],
+            [],
+            60,
+            thread,
+            previous_timestamp,
+            dt.datetime.fromtimestamp(previous_timestamp),
+            6000,
+            None,
+            on_tick,
+        )
+
+        first, second = tester.processed
+        # The first tick didn't wait for an update
+        assert first[1] == previous_timestamp
+        assert enricher.requested[0] == pytest.approx(first[0] + 60)
+        assert second[1] == enricher.requested[0]
+
+
+class FailingTester(FakeTester):
+    name = "failing"
+
+    def process(self, *args):
+        raise ValueError("broken")
+
+
+class TestTickMetrics:
+    def test_exports_stages_lag_and_errors(self):
+        initial_timestamp = int(dt.datetime.now().timestamp()) - 3 * 60
+        samples = [
+            (
+                "canary_tester_tick_stage_duration_seconds_count",
+                {"source": "experiment", "stage": "tick"},
+            ),
+            (
+                "canary_tester_tick_stage_duration_seconds_count",
+                {"source": "fake", "stage": "fetch"},
+            ),
+            (
+                "canary_tester_tick_errors_total",
+                {"test": "failing", "reason": "UNKNOWN_ERROR"},
+            ),
+        ]
+        before = [REGISTRY.get_sample_value(*sample) or 0 for sample in samples]
+
+        experiment._catch_up(
+            FakeEnricher(),
+            [FakeTester(), FailingTester()],
+            [],
+            60,
+            RunningThread(),
+            initial_timestamp,
+            None,
+            0,
+        )
+
+        after = [REGISTRY.get_sample_value(*sample) for sample in samples]
+        assert [a - b for a, b in zip(after, before)] == [3, 3, 3]
+        # The ticks of a catch up run back to back
+        assert REGISTRY.get_sample_value("canary_tester_tick_lag_seconds") < 0
@@ -0,0 +1,187 @@
+import math
+import sqlite3
+from unittest import mock
+
+from canary_tester.experiment import _record_tick
+from canary_tester.experiment_store import ExperimentStore
+
+
+def _peek(peek: int, reason: str = "COULD_NOT_MAKE_DECISION") -> dict:
+    return {
+        "peek": peek,
+        "timestamp": 60.0 * peek,
+        "total_seconds_passed": 60.0 * peek,
+        "control_sample_size": 10,
+        "treatment_sample_size": 12,
+        "mean_a": 1.0,
+        "mean_b": 1.5,
+        "effect_size_ci_low": 0.1,
+        "effect_size_ci_high": 0.9,
+        "effect_size_threshold": 0.0,
+        "p_value_h0": 0.5,
+        "p_value_h1": 0.5,
+        "alpha": 0.05,
+        "reason": reason,
+        "skipped": False,
+    }
+
+
+def _decision(name: str, reason: str, peek: int) -> dict:
+    return {"name": name, "type": "TERMINATION", "reason": reason, "peek": peek}
+
+
+def _start(store: ExperimentStore, version: str = "1.0.0") -> int:
+    return store.start_experiment(version, ["0.9.0"], 600, 60, 0.0)
+
+
+class TestExperimentStore:
+    def test_wal_mode(self, tmp_path):
+        store = ExperimentStore(str(tmp_path / "experiments.db"))
+
+        mode = store._connection.execute("PRAGMA journal_mode").fetchone()[0]
+
+        assert mode == "wal"
+        store.close()
+
+    def test_record_tick(self, tmp_path):
+        path = str(tmp_path / "experiments.db")
+        store = ExperimentStore(path)
+        experiment_id = _start(store)
+
+        store.record_tick(
+            experiment_id,
+            60.0,
+            [("TotalAlerts", _peek(0)), ("Latency", _peek(0))],
+            [("Latency", _decision("Latency", "BETTER", 0))],
+        )
+        store.finish_experiment(experiment_id)
+        store.close()
+
+        # A reader sees the rows of the closed writer
+        connection = sqlite3.connect(path)
+        assert connection.execute("SELECT COUNT(*) FROM ticks").fetchone()[0] == 1
+        assert connection.execute(
+            "SELECT test_name, mean_b FROM statistics ORDER BY test_name"
+        ).fetchall() == [("Latency", 1.5), ("TotalAlerts", 1.5)]
+        assert (
+            connection.execute("SELECT finished_at FROM experiments").fetchone()[0]
+            is not None
+        )
+
+    def test_replayed_peeks_replace_rows(self, tmp_path):
+        store = ExperimentStore(str(tmp_path / "experiments.db"))
+        experiment_id = _start(store)
+
+        store.record_tick(experiment_id, 60.0, [("TotalAlerts", _peek(0))], [])
+        store.record_tick(experiment_id, 60.0, [("TotalAlerts", _peek(0, "WORSE"))], [])
+
+        assert store._connection.execute(
+            "SELECT reason FROM statistics"
+        ).fetchall() == [("WORSE",)]
+        store.close()
+
+    def test_experiments_with_decision(self, tmp_path):
+        store = ExperimentStore(str(tmp_path / "experiments.db"))
+        for version, reason in [
+            ("1.0.0", "WORSE"),
+            ("1.1.0", "BETTER"),
+            ("1.2.0", "WORSE"),
+        ]:
+            experiment_id = _start(store, version)
+            store.record_tick(
+                experiment_id,
+                60.0,
+                [],
+                [("TotalAlerts", _decision("TotalAlerts", reason, 3))],
+            )
+
+        worse = store.experiments_with_decision("TotalAlerts", "WORSE")
+
+        assert [row["version_under_test"] for row in worse] == ["1.0.0", "1.2.0"]
+        assert worse[0]["control_group_versions"] == '["0.9.0"]'
+        assert worse[0]["peek"] == 3
+        assert len(store.experiments_with_decision("TotalAlerts")) == 3
+        assert store.experiments_with_decision("Latency") == []
+        store.close()
+
+    def test_record_tick_only_writes_new_rows(self, tmp_path):
+        store = ExperimentStore(str(tmp_path / "experiments.db"))
+        experiment_id = _start(store)
+        tester = mock.Mock(peeks=[_peek(0)])
+        tester.name = "TotalAlerts"
+        tester.decision_record.return_value = None
+        recorded_peeks: dict[str, int] = {}
+        recorded_decisions: set[str] = set()
+
+        _record_tick(
+            store, experiment_id, 60.0, [tester], recorded_peeks, recorded_decisions
+        )
+        tester.peeks.append(_peek(1, "WORSE"))
+        tester.decision_record.return_value = _decision("TotalAlerts", "WORSE", 1)
+        for timestamp in (120.0, 180.0):
+            _record_tick(
+                store,
+                experiment_id,
+                timestamp,
+                [tester],
+                recorded_peeks,
+                recorded_decisions,
+            )
+
+        assert store._connection.execute(
+            "SELECT peek, tick_id FROM statistics ORDER BY peek"
+        ).fetchall() == [(0, 1), (1, 2)]
+        assert store._connection.execute(
+            "SELECT tick_id FROM decisions"
+        ).fetchall() == [(2,)]
+        assert recorded_peeks == {"TotalAlerts": 2}
+        store.close()
+
+    def test_records_nan_statistics(self, tmp_path):
+        store = ExperimentStore(str(tmp_path / "experiments.db"))
+        experiment_id = _start(store)
+        peek = {**_peek(0), "mean_a": math.nan, "p_value_h0": math.nan}
+
+        store.record_tick(experiment_id, 60.0, [("TotalAlerts", peek)], [])
+        store.record_tick(experiment_id, 120.0, [("TotalAlerts", _peek(1))], [])
+
+        assert store._connection.execute(
+            "SELECT peek, mean_a, p_value_h0 FROM statistics ORDER BY peek"
+        ).fetchall() == [(0, None, None), (1, 1.0, 0.5)]
+        store.close()
+
+    def test_unrecordable_tick_does_not_block_later_ticks(self, tmp_path):
+        store = ExperimentStore(str(tmp_path / "experiments.db"))
+        experiment_id = _start(store)
+        tester = mock.Mock(peeks=[{**_peek(0), "reason": None}])
+        tester.name = "TotalAlerts"
+        tester.decision_record.return_value = None
+        recorded_peeks: dict[str, int] = {}
+
+        _record_tick(store, experiment_id, 60.0, [tester], recorded_peeks, set())
+        tester.peeks.append(_peek(1))
+        _record_tick(store, experiment_id, 120.0, [tester], recorded_peeks, set())
+
+        rows = store._connection.execute("SELECT peek FROM statistics").fetchall()
+        assert rows == [(1,)]
+        assert recorded_peeks == {"TotalAlerts": 2}
+        store.close()
+
+    def test_failed_tick_is_recorded_with_the_next_tick(self, tmp_path):
+        store = ExperimentStore(str(tmp_path / "experiments.db"))
+        experiment_id = _start(store)
+        tester = mock.Mock(peeks=[_peek(0)])
+        tester.name = "TotalAlerts"
+        tester.decision_record.return_value = None
+        recorded_peeks: dict[str, int] = {}
+
+        with mock.patch.object(
+            store, "record_tick", side_effect=sqlite3.OperationalError("locked")
+        ):
+            _record_tick(store, experiment_id, 60.0, [tester], recorded_peeks, set())
+        _record_tick(store, experiment_id, 120.0, [tester], recorded_peeks, set())
+
+        assert store._connection.execute(
+            "SELECT peek, tick_id FROM statistics"
+        ).fetchall() == [(0, 1)]
+        store.close()
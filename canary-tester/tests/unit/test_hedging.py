@@ -0,0 +1,37 @@
+import threading
+
+from canary_tester.hedging import Hedger
+
+
+class TestHedger:
+    def test_sends_once_without_latency_history(self):
+        hedger = Hedger(enabled=True)
+        calls = []
+
+        result, hedged = hedger.run("key", lambda: calls.append(1) or "res")
+
+        assert result == "res"
+        assert hedged is False
+        assert len(calls) == 1
+
+    def test_hedges_slow_query(self):
+        hedger = Hedger(enabled=True)
+        for _ in range(20):
+            hedger._tracker.record("key", 0.001)
+
+        release = threading.Event()
+        calls = []
+
+        def send():
+            calls.append(1)
+            if len(calls) == 1:
+                # The first query hangs until the hedge answered.
+                release.wait(timeout=5)
+                return "slow"
+            return "fast"
+
+        result, hedged = hedger.run("key", send)
+        release.set()
+
+        assert result == "fast"
+        assert hedged is True
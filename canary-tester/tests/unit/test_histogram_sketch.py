@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from canary_tester.tester.frequency_kstest_one_sided import FrequencyKSTestOneSided
+from canary_tester.tester.group_store import SketchGroupStore
+from canary_tester.tester.histogram_sketch import HistogramSketch
+from canary_tester.tester.statistic_tests import HistogramKSTest, KSTest
+from canary_tester.tester.test_builder import TestBuilder
+from canary_tester.types import GroupStoreType, VersionEnrichedStandardScalarMetric
+
+
+def _sketch(values, bins=1000):
+    sketch = HistogramSketch.log_spaced(1e-3, 1e3, bins)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+class TestHistogramSketch:
+    def test_counts_values_in_bins(self):
+        sketch = HistogramSketch([1, 2, 3])
+
+        for value in [0.5, 1, 1.5, 2, 10]:
+            sketch.add(value)
+
+        assert sketch.counts.tolist() == [1, 2, 1, 1]
+        assert len(sketch) == 5
+        assert sketch.mean == pytest.approx(3)
+
+    def test_merge(self):
+        a = _sketch([1, 2, 3])
+        b = _sketch([4, 5])
+
+        merged = a.merge(b)
+
+        assert len(merged) == 5
+        assert merged.mean == pytest.approx(3)
+        with pytest.raises(ValueError):
+            a.merge(HistogramSketch([1, 2]))
+
+
+class TestHistogramKSTest:
+    def test_p_value_close_to_raw_samples(self):
+        rng = np.random.default_rng(0)
+        a = list(rng.exponential(1.0, 2000))
+        b = list(rng.exponential(1.2, 2000))
+
+        for alternative in ("less", "greater"):
+            binned = HistogramKSTest.p_value(_sketch(a), _sketch(b), alternative)
+            raw = KSTest.p_value(a, b, alternative)
+            assert binned == pytest.approx(raw, abs=0.01)
+            # The statistic on the edges is never bigger than on the raw samples
+            assert binned >= raw - 1e-3
+
+    def test_ci_widens_with_binning_error(self):
+        rng = np.random.default_rng(1)
+        a = list(rng.exponential(1.0, 500))
+        b = list(rng.exponential(1.1, 500))
+
+        _, raw_high = FrequencyKSTestOneSided.ci(a, b, 0.05)
+        _, coarse_high = HistogramKSTest.effect_size_ci(
+            _sketch(a, 50), _sketch(b, 50), 0.05
+        )
+        fine_low, fine_high = HistogramKSTest.effect_size_ci(
+            _sketch(a, 1000), _sketch(b, 1000), 0.05
+        )
+
+        # The effect size check compares the upper bound against the threshold
+        assert coarse_high > fine_high >= raw_high
+        assert fine_high == pytest.approx(raw_high, abs=0.01)
+        assert fine_low < fine_high
+
+
+class TestSketchGroupStore:
+    def test_skips_first_value(self):
+        store = SketchGroupStore(HistogramSketch([1, 2]), skip_first=True)
+        first = VersionEnrichedStandardScalarMetric(0, "host1", 0.0, "1.0.0")
+        second = VersionEnrichedStandardScalarMetric(1, "host1", 1.5, "1.0.0")
+
+        store.append(first)
+        store.append(second)
+
+        assert len(store) == 2
+        assert store.last() is second
+        assert len(store.bucket()) == 1
+
+    def test_builder_rejects_unsupported_statistic_test(self):
+        with pytest.raises(ValueError):
+            TestBuilder._select_sketch_statistic_test(
+                TestBuilder._select_statistic_test(
+                    {"type_arrival": "PredictableArrival", "statistic_test": "TTest"}
+                ),
+                GroupStoreType.Histogram,
+            )
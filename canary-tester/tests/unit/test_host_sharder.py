@@ -0,0 +1,49 @@
+import re
+
+from canary_tester.host_sharder import HostSharder
+from canary_tester.promql_template import QueryTemplate
+from canary_tester.types import GlobalConfig
+
+
+def _response(hosts: list[str]) -> dict:
+    return {
+        "status": "success",
+        "data": {
+            "resultType": "vector",
+            "result": [{"metric": {"host": host}, "value": [0, "1"]} for host in hosts],
+        },
+    }
+
+
+class TestPartition:
+    def test_partitions_are_stable_and_disjoint(self):
+        hosts = [f"host{i}" for i in range(100)]
+
+        partitions = HostSharder.partition(hosts, 4)
+
+        assert len(partitions) == 4
+        assert sorted(host for p in partitions for host in p) == sorted(hosts)
+        assert partitions == HostSharder.partition(list(reversed(hosts)), 4)
+
+    def test_drops_empty_partitions(self):
+        assert HostSharder.partition(["host1"], 8) == [["host1"]]
+
+
+class TestFetch:
+    def test_runs_one_query_per_shard_and_merges(self):
+        sharder = HostSharder(GlobalConfig(HOST_SHARDS=2, HOST_SHARD_MAX_WORKERS=2))
+        template = QueryTemplate.compile("max(osix_build_info) by (host, version)")
+        hosts = [f"host{i}" for i in range(10)]
+        queries = []
+
+        def run(params):
+            queries.append(params["query"])
+            matcher = re.search(r"host=~'([^']*)'", params["query"]).group(1)
+            return _response(matcher.split("|"))
+
+        res = sharder.fetch(template, {"query": "ignored"}, hosts, run)
+
+        assert len(queries) == 2
+        assert sorted(el["metric"]["host"] for el in res["data"]["result"]) == sorted(
+            hosts
+        )
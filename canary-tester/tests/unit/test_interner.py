@@ -0,0 +1,43 @@
+from canary_tester.interner import VERSION_CODES, Interner, VersionGroups
+
+
+class TestInterner:
+    def test_same_value_gets_same_code(self):
+        interner = Interner()
+
+        assert interner.code("1.0.0") == 0
+        assert interner.code("2.0.0") == 1
+        assert interner.code("1.0.0") == 0
+        assert interner.value(1) == "2.0.0"
+        assert len(interner) == 2
+
+    def test_restore_keeps_codes_of_earlier_process(self):
+        earlier = Interner()
+        for value in ("1.0.0", "2.0.0", "3.0.0"):
+            earlier.code(value)
+        interner = Interner()
+        interner.code("3.0.0")
+        interner.code("4.0.0")
+
+        interner.restore(earlier.values())
+
+        assert interner.values() == ["1.0.0", "2.0.0", "3.0.0", "4.0.0"]
+        assert interner.code("2.0.0") == 1
+        assert interner.code("4.0.0") == 3
+        assert interner.code("5.0.0") == 4
+
+
+class TestVersionGroups:
+    def test_groups(self):
+        groups = VersionGroups("interner-2.0.0", ["interner-1.0.0"])
+
+        assert groups.is_treatment(VERSION_CODES.code("interner-2.0.0"))
+        assert groups.is_valid(VERSION_CODES.code("interner-2.0.0"))
+        assert groups.is_control(VERSION_CODES.code("interner-1.0.0"))
+        assert not groups.is_treatment(VERSION_CODES.code("interner-1.0.0"))
+
+    def test_version_seen_after_the_tables_were_built(self):
+        groups = VersionGroups("interner-4.0.0", ["interner-3.0.0"])
+
+        assert not groups.is_valid(VERSION_CODES.code("interner-5.0.0"))
+        assert groups.is_control(VERSION_CODES.code("interner-3.0.0"))
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from canary_tester.tester.frequency_kstest_one_sided import FrequencyKSTestOneSided
+from canary_tester.tester.kll_sketch import KLLSketch
+from canary_tester.tester.statistic_tests import KSTest, QuantileSketchKSTest
+from canary_tester.tester.test_builder import TestBuilder
+from canary_tester.types import GroupStoreType
+
+
+def _sketch(values, k=200):
+    sketch = KLLSketch(k)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+class TestKLLSketch:
+    def test_keeps_all_samples_below_capacity(self):
+        sketch = _sketch([3.0, 1.0, 2.0, 2.0])
+
+        values, cdf = sketch.ecdf()
+
+        assert values.tolist() == [1.0, 2.0, 3.0]
+        assert cdf.tolist() == [0.25, 0.75, 1.0]
+        assert sketch.epsilon == 0
+        assert sketch.mean == pytest.approx(2)
+
+    def test_rank_error_within_epsilon(self):
+        rng = np.random.default_rng(0)
+        samples = rng.lognormal(0, 1, 100_000)
+        sketch = _sketch(samples)
+
+        values, cdf = sketch.ecdf()
+        true_cdf = np.searchsorted(np.sort(samples), values, side="right") / len(
+            samples
+        )
+
+        assert sketch.size < 3 * sketch.k
+        assert len(sketch) == len(samples)
+        assert sketch.epsilon < 0.1
+        assert np.max(np.abs(cdf - true_cdf)) <= sketch.epsilon
+
+    def test_merge(self):
+        rng = np.random.default_rng(1)
+        a = _sketch(rng.normal(0, 1, 5000))
+        b = _sketch(rng.normal(0, 1, 5000))
+
+        merged = a.merge(b)
+
+        assert len(merged) == 10000
+        assert merged.size < 3 * merged.k
+        assert merged.mean == pytest.approx((a.mean * 5000 + b.mean * 5000) / 10000)
+        assert merged.ecdf()[1][-1] == pytest.approx(1)
+
+
+class TestQuantileSketchKSTest:
+    def test_p_value_close_to_raw_samples(self):
+        rng = np.random.default_rng(2)
+        a = list(rng.exponential(1.0, 5000))
+        b = list(rng.exponential(1.3, 5000))
+
+        for alternative in ("less", "greater"):
+            sketched = QuantileSketchKSTest.p_value(_sketch(a), _sketch(b), alternative)
+            raw = KSTest.p_value(a, b, alternative)
+            assert sketched == pytest.approx(raw, abs=0.05)
+
+    def test_ci_is_wider_than_on_raw_samples(self):
+        rng = np.random.default_rng(3)
+        a = list(rng.exponential(1.0, 2000))
+        b = list(rng.exponential(1.1, 2000))
+
+        raw_low, raw_high = FrequencyKSTestOneSided.ci(a, b, 0.05)
+        low, high = QuantileSketchKSTest.effect_size_ci(_sketch(a), _sketch(b), 0.05)
+
+        assert low <= raw_low + 0.02
+        assert high >= raw_high - 0.02
+
+    def test_builder_selects_sketch_test(self):
+        statistic_test = TestBuilder._select_statistic_test(
+            {"type_arrival": "PredictableArrival", "statistic_test": "KSTest"}
+        )
+
+        assert (
+            TestBuilder._select_sketch_statistic_test(
+                statistic_test, GroupStoreType.KLL
+            )
+            is QuantileSketchKSTest
+        )
@@ -1,45 +1,80 @@
-from canary_tester.tester.predictable_arrival_tester import PredictableArrivalTester
+from unittest import mock
 
+from canary_tester.tester.predictable_arrival_tester import PredictableArrivalTester
+from canary_tester.types import GlobalConfig, StandardScalarMetric
+from tests.mocks.mock_thanos_predictable_arrival import MockResponse
 
-class TestProcessQuery:
 
-    def test_working_process_query_with_aggregation(self):
-        tester = PredictableArrivalTester(
-            "1.0.0", 1, [], None, {"name": "test"}, None, None
+class TestQueryTemplate:
+    def _tester(self, query: str) -> PredictableArrivalTester:
+        return PredictableArrivalTester(
+            "1.0.0", 1, [], None, {"name": "test", "query": query}, None, None
         )
 
+    def test_renders_host_with_aggregation(self):
+        tester = self._tester("avg (disk_free) by(host)")
+
         assert (
-            tester._process_query("avg (disk_free) by(host)", "test123")
+            tester._query_template.render(host="test123")
             == "avg (disk_free{host='test123'}) by (host)"
         )
 
-    def test_working_process_query_without_aggregation(self):
-        tester = PredictableArrivalTester(
-            "1.0.0", 1, [], None, {"name": "test"}, None, None
-        )
+    def test_renders_host_without_aggregation(self):
+        tester = self._tester("disk_free")
 
         assert (
-            tester._process_query("disk_free", "test123") == "disk_free{host='test123'}"
+            tester._query_template.render(host="test123") == "disk_free{host='test123'}"
         )
 
-    def test_not_working_process_query(self):
-        tester = PredictableArrivalTester(
-            "1.0.0", 1, [], None, {"name": "test"}, None, None
-        )
+    def test_renders_host_instead_of_host_filter(self):
+        tester = self._tester("disk_free{host='test133'}")
 
         assert (
-            tester._process_query("disk_free{host='test133'}", "test123")
-            == "disk_free{host='test123'}"
+            tester._query_template.render(host="test123") == "disk_free{host='test123'}"
         )
 
-    def test_working_with_already_a_filter(self):
-        tester = PredictableArrivalTester(
-            "1.0.0", 1, [], None, {"name": "test"}, None, None
-        )
+    def test_renders_host_with_already_a_filter(self):
+        tester = self._tester("avg(disk_used_percent{path='/'}) by (host)")
 
         assert (
-            tester._process_query(
-                "avg(disk_used_percent{path='/'}) by (host)", "test123"
-            )
+            tester._query_template.render(host="test123")
             == "avg (disk_used_percent{path='/', host='test123'}) by (host)"
         )
+
+
+class TestFetchAggregated:
+    @mock.patch("requests.get")
+    def test_fetches_one_aggregated_value_per_host(self, mock_get):
+        mock_get.return_value = MockResponse(
+            {
+                "status": "success",
+                "data": {
+                    "resultType": "vector",
+                    "result": [
+                        {"metric": {"host": "host1"}, "value": [160, "2.5"]},
+                        {"metric": {"host": "host2"}, "value": [160, "NaN"]},
+                    ],
+                },
+            },
+            200,
+        )
+        tester = PredictableArrivalTester(
+            "1.0.0",
+            1,
+            [],
+            None,
+            {
+                "name": "test",
+                "query": "avg (disk_free) by(host)",
+                "fetch_mode": "Aggregated",
+            },
+            None,
+            GlobalConfig(),
+        )
+
+        metrics = tester._fetch(100, 160)
+
+        params = mock_get.call_args.kwargs["params"]
+        assert params["query"] == "avg (avg_over_time(disk_free[60s])) by (host)"
+        assert params["time"] == 160
+        assert metrics[0] == StandardScalarMetric(160, "host1", 2.5)
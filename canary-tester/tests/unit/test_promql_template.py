@@ -0,0 +1,123 @@
+import pytest
+
+from canary_tester.promql_template import QueryTemplate
+
+
+class TestCompile:
+    def test_compiles_aggregation(self):
+        template = QueryTemplate.compile("avg (disk_free) by(host)")
+
+        assert template.render() == "avg (disk_free) by (host)"
+
+    def test_compiles_grouping_before_arguments(self):
+        template = QueryTemplate.compile("sum by (host, version) (rate(errors[5m]))")
+
+        assert template.render() == "sum by (host, version) (rate(errors[5m]))"
+
+    def test_compiles_selector_with_matchers(self):
+        template = QueryTemplate.compile('ALERTS_FOR_STATE{host!=""}')
+
+        assert template.render() == 'ALERTS_FOR_STATE{host!=""}'
+
+    def test_compiles_literal_arguments(self):
+        template = QueryTemplate.compile("quantile_over_time(0.9, cpu[5m])")
+
+        assert template.render() == "quantile_over_time(0.9, cpu[5m])"
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "disk_free / 1e9",
+            "avg (disk_free) by (host) > 0",
+            "avg (disk_free) by (host) > bool 0.5",
+            "(disk_total - disk_free) / disk_total",
+            "-disk_free offset -5m",
+            "2 ^ 3 ^ disk_free",
+            "errors unless on (host) maintenance",
+            "sum (rate(errors[5m])) by (host) / on (host) group_left (version)"
+            " max (build_info) by (host, version)",
+        ],
+    )
+    def test_compiles_binary_operators(self, query):
+        assert QueryTemplate.compile(query).render() == query
+
+    def test_binary_operators_bind_by_precedence(self):
+        root = QueryTemplate.compile("a or b and c + d * e ^ f ^ g")._root
+
+        assert root.op == "or"
+        assert root.rhs.op == "and"
+        assert root.rhs.rhs.op == "+"
+        assert root.rhs.rhs.rhs.op == "*"
+        assert root.rhs.rhs.rhs.rhs.op == "^"
+        assert root.rhs.rhs.rhs.rhs.rhs.op == "^"
+
+    def test_compile_is_cached(self):
+        assert QueryTemplate.compile("disk_free") is QueryTemplate.compile("disk_free")
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "",
+            "avg (disk_free",
+            "disk_free /",
+            "disk_free > bool",
+            "(disk_free",
+            "{}",
+            "42",
+            "1 + 2",
+        ],
+    )
+    def test_rejects_unsupported_queries(self, query):
+        with pytest.raises(ValueError):
+            QueryTemplate.compile(query)
+
+
+class TestRender:
+    def test_injects_host_set(self):
+        template = QueryTemplate.compile("avg (disk_free{path='/'}) by (host)")
+
+        assert (
+            template.render(hosts=["me-sg159-tz-dar-1", "host.2"])
+            == "avg (disk_free{path='/', host=~'me\\\\-sg159\\\\-tz\\\\-dar\\\\-1|host\\\\.2'})"
+            " by (host)"
+        )
+
+    def test_injects_host_into_both_sides_of_binary_operator(self):
+        template = QueryTemplate.compile("avg (disk_free) by (host) / disk_total > 0")
+
+        assert (
+            template.render(host="host1")
+            == "avg (disk_free{host='host1'}) by (host) / disk_total{host='host1'} > 0"
+        )
+
+    def test_keeps_host_matchers_that_are_not_equality(self):
+        template = QueryTemplate.compile('ALERTS_FOR_STATE{host!=""}')
+
+        assert (
+            template.render(host="host1")
+            == "ALERTS_FOR_STATE{host!=\"\", host='host1'}"
+        )
+
+    def test_injects_time_modifiers(self):
+        template = QueryTemplate.compile("avg (disk_free) by (host)")
+
+        assert (
+            template.render(offset="5m", at=1720691168)
+            == "avg (disk_free offset 5m @ 1720691168.000) by (host)"
+        )
+
+    def test_aggregates_selector_over_window(self):
+        template = QueryTemplate.compile("avg (disk_free) by (host)")
+
+        assert (
+            template.render(over_time="avg", window_s=60)
+            == "avg (avg_over_time(disk_free[60s])) by (host)"
+        )
+
+    def test_aggregates_range_function_with_subquery(self):
+        template = QueryTemplate.compile("sum (rate(errors[5m])) by (host)")
+
+        assert (
+            template.render(over_time="max", window_s=90.5)
+            == "sum (max_over_time(rate(errors[5m])[90500ms:])) by (host)"
+        )
@@ -0,0 +1,126 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from canary_tester.query_governor import DeadlineExceeded, QueryGovernor
+from canary_tester.thanos_client import ThanosClient
+from canary_tester.types import GlobalConfig, QueryPriority
+from tests.mocks.mock_thanos_predictable_arrival import MockResponse
+
+
+def _wait_until_waiting(governor: QueryGovernor, count: int):
+    while len(governor._waiting) < count:
+        time.sleep(0.001)
+
+
+class TestSlot:
+    def test_serves_waiting_queries_by_priority(self):
+        governor = QueryGovernor(qps=0, max_in_flight=1)
+        order = []
+
+        def query(priority: QueryPriority):
+            with governor.slot(priority):
+                order.append(priority)
+
+        with governor.slot(QueryPriority.Test):
+            threads = []
+            for i, priority in enumerate(
+                [
+                    QueryPriority.Backfill,
+                    QueryPriority.Test,
+                    QueryPriority.Enricher,
+                ]
+            ):
+                threads.append(threading.Thread(target=query, args=(priority,)))
+                threads[-1].start()
+                _wait_until_waiting(governor, i + 1)
+
+        for thread in threads:
+            thread.join()
+
+        assert order == [
+            QueryPriority.Enricher,
+            QueryPriority.Test,
+            QueryPriority.Backfill,
+        ]
+
+    def test_waits_for_tokens(self):
+        governor = QueryGovernor(qps=10, max_in_flight=0)
+        governor._tokens = 0
+
+        assert governor._wait_time(governor._last_refill) == 0.1
+
+    def test_gives_up_waiting_at_the_deadline(self):
+        governor = QueryGovernor(qps=0, max_in_flight=1)
+
+        with governor.slot(QueryPriority.Test):
+            start = time.monotonic()
+            with pytest.raises(DeadlineExceeded):
+                with governor.slot(QueryPriority.Test, time.monotonic() + 0.1):
+                    pass
+
+            assert time.monotonic() - start < 1
+            assert governor._waiting == []
+
+        # The governor still serves queries afterwards
+        with governor.slot(QueryPriority.Test, time.monotonic() + 1):
+            pass
+
+
+class TestDeadline:
+    @mock.patch("requests.get")
+    def test_saturated_governor_fails_query_at_the_deadline(self, mock_get):
+        governor = QueryGovernor(qps=0, max_in_flight=1)
+        client = ThanosClient(GlobalConfig(), "test")
+
+        with (
+            mock.patch.object(QueryGovernor, "shared", return_value=governor),
+            governor.slot(QueryPriority.Enricher),
+        ):
+            start = time.monotonic()
+            with pytest.raises(DeadlineExceeded):
+                client.query_range(
+                    {"query": "up", "start": 0, "end": 60},
+                    deadline=time.monotonic() + 0.2,
+                )
+
+        assert time.monotonic() - start < 1
+        assert mock_get.call_count == 0
+
+    @mock.patch("requests.get")
+    def test_stops_retrying_throttled_query_at_the_deadline(self, mock_get):
+        throttled = MockResponse({}, 429)
+        throttled.headers = {"Retry-After": "10"}
+        mock_get.return_value = throttled
+        governor = QueryGovernor(qps=0, max_in_flight=0)
+        client = ThanosClient(GlobalConfig(), "test")
+
+        with mock.patch.object(QueryGovernor, "shared", return_value=governor):
+            start = time.monotonic()
+            client.query_range(
+                {"query": "up", "start": 0, "end": 60},
+                deadline=time.monotonic() + 1,
+            )
+
+        assert time.monotonic() - start < 1
+        assert mock_get.call_count == 1
+
+
+class TestReport:
+    def test_throttled_response_halves_rate_and_pauses(self):
+        governor = QueryGovernor(qps=10, max_in_flight=0)
+
+        backoff = governor.report(429, "2")
+
+        assert backoff == 2
+        assert governor._rate_factor == 0.5
+        assert governor._wait_time(time.monotonic()) > 1.9
+
+    def test_successful_response_recovers_rate(self):
+        governor = QueryGovernor(qps=10, max_in_flight=0)
+        governor.report(503)
+
+        assert governor.report(200) == 0
+        assert governor._rate_factor == 0.55
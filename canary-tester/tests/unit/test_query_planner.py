@@ -0,0 +1,56 @@
+from canary_tester.query_planner import QueryPlan, QueryPlanner
+from canary_tester.types import QueryAccuracy
+
+NOW = 1720691168
+DAY = 24 * 3600
+
+
+class TestPlan:
+    def test_recent_short_window_reads_raw_data(self):
+        plan = QueryPlanner.plan(
+            NOW - 60, NOW, QueryAccuracy.Balanced, min_step=1, now=NOW
+        )
+
+        assert plan == QueryPlan(1, "0s", False)
+
+    def test_long_window_increases_step(self):
+        plan = QueryPlanner.plan(
+            NOW - 2 * DAY, NOW, QueryAccuracy.Balanced, min_step=1, now=NOW
+        )
+
+        assert plan.step == 173
+        assert plan.max_source_resolution == "0s"
+
+    def test_old_long_window_reads_5m_blocks(self):
+        end = NOW - 3 * DAY
+        plan = QueryPlanner.plan(
+            end - 7 * DAY, end, QueryAccuracy.Balanced, min_step=1, now=NOW
+        )
+
+        assert plan == QueryPlan(605, "5m", False)
+
+    def test_coarse_old_window_reads_1h_blocks(self):
+        end = NOW - 20 * DAY
+        plan = QueryPlanner.plan(
+            end - 3 * DAY, end, QueryAccuracy.Coarse, min_step=60, now=NOW
+        )
+
+        assert plan == QueryPlan(1037, "1h", True)
+
+    def test_exact_never_reads_downsampled_data(self):
+        end = NOW - 20 * DAY
+        plan = QueryPlanner.plan(
+            end - 30 * DAY, end, QueryAccuracy.Exact, min_step=1, now=NOW
+        )
+
+        assert plan.max_source_resolution == "0s"
+        assert plan.partial_response is False
+
+    def test_apply_sets_planned_params(self):
+        params = QueryPlan(60, "5m", True).apply({"query": "up"}, range_query=False)
+
+        assert params == {
+            "query": "up",
+            "max_source_resolution": "5m",
+            "partial_response": "true",
+        }
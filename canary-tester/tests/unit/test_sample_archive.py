@@ -0,0 +1,65 @@
+import numpy as np
+
+from canary_tester.tester.group_store import ArchiveGroupStore
+from canary_tester.tester.sample_archive import SampleArchive
+from canary_tester.tester.statistic_tests import KSTest
+from canary_tester.types import VersionEnrichedStandardScalarMetric
+
+
+class TestSampleArchive:
+    def test_grows_and_returns_views(self, tmp_path):
+        archive = SampleArchive(str(tmp_path / "group"))
+
+        for i in range(10_000):
+            archive.append(i, f"host{i % 3}", float(i))
+        values = archive.values(1)
+
+        assert len(archive) == 10_000
+        assert isinstance(values, np.memmap)
+        assert values[0] == 1.0 and values[-1] == 9999.0
+
+    def test_load_after_close(self, tmp_path):
+        directory = str(tmp_path / "group")
+        archive = SampleArchive(directory)
+        archive.append(10, "host-a", 1.5)
+        archive.append(20, "host-b", 2.5)
+        archive.close()
+
+        columns = SampleArchive.load(directory)
+
+        assert columns["ts"].tolist() == [10, 20]
+        assert columns["value"].tolist() == [1.5, 2.5]
+        assert columns["hosts"][columns["host"]].tolist() == ["host-a", "host-b"]
+        assert (tmp_path / "group" / "value.bin").stat().st_size == 2 * 8
+
+    def test_load_missing_archive(self, tmp_path):
+        assert SampleArchive.load(str(tmp_path / "missing")) is None
+
+    def test_replaces_earlier_archive(self, tmp_path):
+        directory = str(tmp_path / "group")
+        archive = SampleArchive(directory)
+        archive.append(10, "host-a", 1.5)
+        archive.close()
+
+        archive = SampleArchive(directory)
+        archive.close()
+
+        assert len(SampleArchive.load(directory)["value"]) == 0
+
+
+class TestArchiveGroupStore:
+    def test_statistic_test_reads_archive(self, tmp_path):
+        rng = np.random.default_rng(0)
+        values = rng.exponential(1.0, 500)
+        store = ArchiveGroupStore(str(tmp_path / "treatment"), skip_first=True)
+
+        for ts, value in enumerate(values):
+            store.append(
+                VersionEnrichedStandardScalarMetric(ts, "host1", value, "1.0.0")
+            )
+
+        assert len(store) == 500
+        assert store.last().ts == 499
+        assert KSTest.p_value(store.bucket(), list(values[:250])) == KSTest.p_value(
+            list(values[1:]), list(values[:250])
+        )
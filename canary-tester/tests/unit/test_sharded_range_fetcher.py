@@ -0,0 +1,90 @@
+import time
+from unittest import mock
+
+import pytest
+
+from canary_tester.query_planner import QueryPlan
+from canary_tester.sharded_range_fetcher import ShardedRangeFetcher
+from canary_tester.thanos_client import DeadlineExceeded, ThanosClient
+from canary_tester.types import GlobalConfig
+from tests.mocks.mock_thanos_predictable_arrival import MockResponse
+
+
+def _series(host: str, timestamps: list[int]) -> dict:
+    return {"metric": {"host": host}, "values": [[ts, "1"] for ts in timestamps]}
+
+
+class TestSplit:
+    def test_short_window_is_single_shard(self):
+        assert ShardedRangeFetcher.split(0, 100, 10, 3600) == [(0, 100)]
+
+    def test_shards_are_aligned_to_step(self):
+        shards = ShardedRangeFetcher.split(0, 250, 60, 100)
+
+        assert shards == [(0, 120), (120, 240), (240, 250)]
+
+
+class TestStitch:
+    def test_merges_series_and_removes_boundary_duplicates(self):
+        stitched = ShardedRangeFetcher.stitch(
+            [
+                [_series("host1", [0, 60, 120]), _series("host2", [60])],
+                [_series("host1", [120, 180])],
+            ]
+        )
+
+        assert stitched == [
+            _series("host1", [0, 60, 120, 180]),
+            _series("host2", [60]),
+        ]
+
+
+class TestFetch:
+    @mock.patch("requests.get")
+    def test_fetches_every_shard(self, mock_get):
+        mock_get.side_effect = lambda url, params, **kwargs: MockResponse(
+            {
+                "status": "success",
+                "data": {
+                    "resultType": "matrix",
+                    "result": [_series("host1", [params["start"], params["end"]])],
+                },
+            },
+            200,
+        )
+        fetcher = ShardedRangeFetcher(
+            ThanosClient(GlobalConfig(), "test"),
+            GlobalConfig(RANGE_FETCH_SHARD_S=100, RANGE_FETCH_MAX_WORKERS=2),
+        )
+
+        res = fetcher.fetch(
+            {"query": "up", "start": 0, "end": 300}, QueryPlan(50, "0s", False)
+        )
+
+        assert mock_get.call_count == 3
+        assert res["data"]["result"] == [_series("host1", [0, 100, 200, 300])]
+
+    @mock.patch("requests.get")
+    def test_deadline_only_applies_to_its_fetch(self, mock_get):
+        mock_get.side_effect = lambda url, params, **kwargs: MockResponse(
+            {"status": "success", "data": {"resultType": "matrix", "result": []}},
+            200,
+        )
+        fetcher = ShardedRangeFetcher(
+            ThanosClient(GlobalConfig(), "test"),
+            GlobalConfig(RANGE_FETCH_SHARD_S=100, RANGE_FETCH_MAX_WORKERS=2),
+        )
+        params = {"query": "up", "start": 0, "end": 300}
+        plan = QueryPlan(50, "0s", False)
+
+        with pytest.raises(DeadlineExceeded):
+            fetcher.fetch(params, plan, deadline=time.monotonic() - 1)
+        assert mock_get.call_count == 0
+
+        fetcher.fetch(params, plan, deadline=time.monotonic() + 5)
+        fetcher.fetch(params, plan)
+
+        timeouts = [call.kwargs["timeout"] for call in mock_get.call_args_list]
+        assert len(timeouts) == 6
+        assert all(timeout <= 5 for timeout in timeouts[:3])
+        assert timeouts[3:] == [GlobalConfig().THANOS_QUERY_TIMEOUT_S] * 3
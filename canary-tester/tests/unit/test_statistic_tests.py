@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from canary_tester.tester.statistic_tests import MSPRTTest, RunningMoments
+from canary_tester.tester.test_builder import TestBuilder
+
+
+class TestRunningMoments:
+    def test_matches_numpy(self):
+        values = list(np.random.default_rng(0).normal(3, 2, 100))
+        moments = RunningMoments()
+
+        moments.add(values[:40])
+        moments.add(values[40:])
+
+        assert moments.n == 100
+        assert moments.mean == pytest.approx(np.mean(values))
+        assert moments.variance == pytest.approx(np.var(values, ddof=1))
+
+
+class TestMSPRTTest:
+    def test_detects_bigger_mean(self):
+        rng = np.random.default_rng(1)
+        a = list(rng.normal(11, 1, 200))
+        b = list(rng.normal(10, 1, 200))
+        test = MSPRTTest()
+
+        assert test.p_value(a, b, alternative="greater") < 0.01
+        assert test.p_value(a, b, alternative="less") == pytest.approx(1)
+
+    def test_no_difference(self):
+        rng = np.random.default_rng(2)
+        a = list(rng.normal(10, 1, 500))
+        b = list(rng.normal(10, 1, 500))
+        test = MSPRTTest()
+
+        # Peek after every chunk, the p-value stays valid
+        p_values = [
+            test.p_value(a[:n], b[:n], alternative="greater")
+            for n in range(10, 501, 10)
+        ]
+
+        assert min(p_values) > 0.05
+        assert p_values == sorted(p_values, reverse=True)
+
+    def test_only_processes_new_samples(self):
+        test = MSPRTTest()
+        a = [1.0, 2.0, 3.0]
+        b = [1.0, 2.0, 4.0]
+
+        test.p_value(a, b)
+        test.p_value(a + [4.0], b + [5.0])
+
+        assert test._a.n == 4
+        assert test._b.mean == pytest.approx(3)
+
+    def test_effect_size_ci_contains_relative_difference(self):
+        rng = np.random.default_rng(3)
+        a = list(rng.normal(12, 1, 300))
+        b = list(rng.normal(10, 1, 300))
+
+        low, high = MSPRTTest().effect_size_ci(a, b, 0.05)
+
+        assert low < 0.2 < high
+
+    def test_selected_by_test_builder(self):
+        first = TestBuilder._select_statistic_test(
+            {"type_arrival": "PredictableArrival", "statistic_test": "MSPRT"}
+        )
+        second = TestBuilder._select_statistic_test(
+            {"type_arrival": "PredictableArrival", "statistic_test": "MSPRT"}
+        )
+
+        assert isinstance(first, MSPRTTest)
+        assert first is not second
@@ -0,0 +1,94 @@
+import datetime as dt
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from canary_tester import experiment, tracing
+from canary_tester.types import RunningThread
+from tests.unit.test_experiment import FakeEnricher, FakeTester
+
+
+def _read_trace(path) -> list[dict]:
+    # The array of the trace file is never closed
+    return json.loads(path.read_text().rstrip().rstrip(",") + "]")
+
+
+@pytest.fixture
+def trace_path(tmp_path):
+    path = tmp_path / "trace" / "trace.json"
+    yield path
+    tracing.stop()
+
+
+class TestTracing:
+    def test_records_spans_of_sampled_ticks_only(self, trace_path):
+        tracing.start(str(trace_path), 1)
+
+        with tracing.tick(False):
+            with tracing.span("skipped"):
+                pass
+        with tracing.tick(True):
+            with tracing.span("stage", test="TotalAlerts", peek=3) as span:
+                span["samples"] = 10
+        with tracing.span("outside_of_tick"):
+            pass
+
+        spans = [event for event in _read_trace(trace_path) if event["ph"] == "X"]
+        assert [span["name"] for span in spans] == ["stage"]
+        assert spans[0]["args"] == {"test": "TotalAlerts", "peek": 3, "samples": 10}
+        assert spans[0]["dur"] >= 0
+
+    def test_appends_to_existing_trace(self, trace_path):
+        for _ in range(2):
+            tracing.start(str(trace_path), 1)
+            with tracing.tick(True), tracing.span("stage"):
+                pass
+            tracing.stop()
+
+        names = [event["name"] for event in _read_trace(trace_path)]
+        assert names.count("stage") == 2
+
+    def test_sampling_does_not_change_the_global_random_state(self, trace_path):
+        tracing.start(str(trace_path), 0.5)
+        state = random.getstate()
+
+        sampled = [tracing.sample() for _ in range(1000)]
+
+        assert random.getstate() == state
+        assert 0 < sum(sampled) < 1000
+
+    def test_sample_is_false_without_tracer(self):
+        assert not tracing.sample()
+
+    def test_traces_fetches_in_the_executor(self, trace_path):
+        tracing.start(str(trace_path), 1)
+        initial_timestamp = int(dt.datetime.now().timestamp()) - 2 * 60
+
+        experiment._catch_up(
+            FakeEnricher(),
+            [FakeTester()],
+            [],
+            60,
+            RunningThread(),
+            initial_timestamp,
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="fetch"),
+            2,
+        )
+        tracing.stop()
+
+        events = _read_trace(trace_path)
+        spans = [event for event in events if event["ph"] == "X"]
+        threads = {
+            event["tid"]: event["args"]["name"]
+            for event in events
+            if event["name"] == "thread_name"
+        }
+        assert [span["name"] for span in spans].count("tick") == 2
+        fetches = [span for span in spans if span["name"] == "fetch"]
+        assert [span["args"]["test"] for span in fetches] == ["fake", "fake"]
+        assert all(threads[span["tid"]].startswith("fetch") for span in fetches)
+        assert {
+            span["args"]["reason"] for span in spans if span["name"] == "process"
+        } == {"NOT_ENOUGH_DATA"}
@@ -1,6 +1,14 @@
 from typing import List
+from unittest import mock
+
+import pytest
+
 from canary_tester.tester.unpredictable_arrival_tester import UnpredictableArrivalTester
-from canary_tester.types import VersionEnrichedStandardScalarMetric
+from canary_tester.types import (
+    GlobalConfig,
+    TesterReturnReason,
+    VersionEnrichedStandardScalarMetric,
+)
 
 
 class TestApplyNewDataChunk:
@@ -54,3 +62,123 @@ class TestCalculateSecondDiff:
 
         # Assert
         assert result == 0.99
+
+
+class TestFetchWindow:
+    def test_slices_prefetched_window(self):
+        tester = UnpredictableArrivalTester(
+            "1.0.0", 1, [], None, {"name": "test"}, None, None
+        )
+        tester._prefetched = (
+            0,
+            300,
+            [
+                {"metric": {"host": "host1"}, "values": [[0, "1"], [60, "1"]]},
+                {"metric": {"host": "host2"}, "values": [[120, "1"], [180, "1"]]},
+            ],
+        )
+
+        result = tester._fetch_window(60, 120)
+
+        assert result == [
+            {"metric": {"host": "host1"}, "values": [[60, "1"]]},
+            {"metric": {"host": "host2"}, "values": [[120, "1"]]},
+        ]
+        assert tester._prefetched is not None
+
+    def test_fetches_live_after_prefetched_window(self):
+        tester = UnpredictableArrivalTester(
+            "1.0.0", 1, [], None, {"name": "test", "query": "up"}, None, GlobalConfig()
+        )
+        tester._prefetched = (0, 300, [])
+        tester._range_fetcher = mock.Mock()
+        tester._range_fetcher.fetch.return_value = {"data": {"result": []}}
+
+        tester._fetch_window(300, 360, deadline=10)
+
+        tester._range_fetcher.fetch.assert_called_once()
+        assert tester._range_fetcher.fetch.call_args.kwargs["deadline"] == 10
+        # Only the process of the tick drops the prefetched window
+        assert tester._prefetched is not None
+
+
+class TestSelectAlpha:
+    def test_uses_all_samples_seen(self):
+        tester = UnpredictableArrivalTester(
+            "1.0.0",
+            10,
+            [],
+            None,
+            {
+                "name": "test",
+                "significance_level": 0.05,
+                "alpha_spending_max_samples": 100,
+            },
+            mock.Mock(always_valid=False),
+            GlobalConfig(),
+        )
+        tester._samples_seen = 100
+
+        # A retention dropped most of the samples from the groups already
+        assert len(tester._treatment_group) + len(tester._control_group) == 0
+        assert tester._select_alpha(1) == pytest.approx(0.05)
+
+
+class TestAnalysisSkipping:
+    def _tester(self, min_new_samples: int) -> UnpredictableArrivalTester:
+        statistic_test = mock.Mock(always_valid=False)
+        statistic_test.effect_size_ci.return_value = (0.0, 10.0)
+        statistic_test.p_value.return_value = 0.5
+        return UnpredictableArrivalTester(
+            "1.0.0",
+            10,
+            [],
+            None,
+            {
+                "name": "test",
+                "significance_level": 0.05,
+                "minimal_effect_size_of_interest": 0,
+                "direction": "Bigger",
+            },
+            statistic_test,
+            GlobalConfig(ANALYSIS_MIN_NEW_SAMPLES=min_new_samples),
+        )
+
+    def test_reuses_statistics_without_new_samples(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        tester = self._tester(1)
+        tester._samples_seen = 10
+
+        first = tester._analyze([1.0, 2.0], [1.0, 2.0], 0, 1, 60)
+        second = tester._analyze([1.0, 2.0], [1.0, 2.0], 0, 2, 120)
+
+        assert first.reason == TesterReturnReason.COULD_NOT_MAKE_DECISION
+        assert second.reason == TesterReturnReason.COULD_NOT_MAKE_DECISION
+        assert tester._statistic_test.p_value.call_count == 2
+        assert tester._analysis_skip_reason(2) == "no_new_samples"
+
+    def test_reused_statistics_are_compared_against_the_new_alpha(
+        self, tmp_path, monkeypatch
+    ):
+        monkeypatch.chdir(tmp_path)
+        tester = self._tester(1)
+        # Below the alpha of the last peek, but above the one of the first peek
+        tester._statistic_test.p_value.side_effect = [0.04, 0.5]
+
+        first = tester._analyze([1.0, 2.0], [1.0, 2.0], 0, 1, 60)
+        last = tester._analyze([1.0, 2.0], [1.0, 2.0], 0, 10, 600)
+
+        assert first.reason == TesterReturnReason.COULD_NOT_MAKE_DECISION
+        assert last.reason == TesterReturnReason.WORSE
+
+    def test_analyzes_after_min_new_samples(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        tester = self._tester(5)
+
+        tester._analyze([1.0, 2.0], [1.0, 2.0], 0, 1, 60)
+        tester._samples_seen += 4
+        assert tester._analysis_skip_reason(2) == "below_min_new_samples"
+        assert tester._analysis_skip_reason(10) is None
+
+        tester._samples_seen += 1
+        assert tester._analysis_skip_reason(2) is None
@@ -0,0 +1,85 @@
+from unittest import mock
+
+from canary_tester.tester.version_change_fetcher import VersionChangeFetcher
+from canary_tester.types import GlobalConfig, StandardScalarMetric
+from tests.mocks.mock_thanos_predictable_arrival import MockResponse
+
+
+def _init_fetcher(batch_size: int = 50, batch_window: int = 300):
+    return VersionChangeFetcher(
+        "avg (disk_free) by(host)",
+        GlobalConfig(
+            PREDICTABLE_ARRIVAL_TESTER_STABILIZATION_TIME=1,
+            PREDICTABLE_ARRIVAL_TESTER_MONITORING_TIME=2,
+            PREDICTABLE_ARRIVAL_TESTER_BATCH_SIZE=batch_size,
+            PREDICTABLE_ARRIVAL_TESTER_BATCH_WINDOW=batch_window,
+        ),
+    )
+
+
+class TestGroupIntoBatches:
+    def test_groups_nearby_changes(self):
+        fetcher = _init_fetcher(batch_window=10)
+
+        batches = fetcher._group_into_batches(
+            [("host3", 100), ("host1", 0), ("host2", 5)]
+        )
+
+        assert batches == [[("host1", 0), ("host2", 5)], [("host3", 100)]]
+
+    def test_respects_batch_size(self):
+        fetcher = _init_fetcher(batch_size=2)
+
+        batches = fetcher._group_into_batches(
+            [("host1", 0), ("host2", 1), ("host3", 2)]
+        )
+
+        assert batches == [[("host1", 0), ("host2", 1)], [("host3", 2)]]
+
+
+class TestFetch:
+    @mock.patch("requests.get")
+    def test_splits_batch_into_before_and_after(self, mock_get):
+        mock_get.return_value = MockResponse(
+            {
+                "status": "success",
+                "data": {
+                    "resultType": "matrix",
+                    "result": [
+                        {
+                            "metric": {"host": "host1"},
+                            "values": [
+                                [7, "2"],
+                                [8, "4"],
+                                [10, "9"],
+                                [12, "6"],
+                                [13, "8"],
+                            ],
+                        },
+                        {
+                            "metric": {"host": "host2"},
+                            "values": [[8, "1"], [13, "1"]],
+                        },
+                    ],
+                },
+            },
+            200,
+        )
+        fetcher = _init_fetcher()
+
+        before, after = fetcher.fetch([("host1", 10), ("host2", 20)])
+
+        assert mock_get.call_count == 1
+        params = mock_get.call_args.kwargs["params"]
+        assert params["query"] == "avg (disk_free{host=~'host1|host2'}) by (host)"
+        assert params["start"] == 7
+        assert params["end"] == 23
+        assert before == [StandardScalarMetric(8, "host1", 3.0)]
+        assert after == [StandardScalarMetric(13, "host1", 7.0)]
+
+    @mock.patch("requests.get")
+    def test_no_query_without_changes(self, mock_get):
+        fetcher = _init_fetcher()
+
+        assert fetcher.fetch([]) == ([], [])
+        assert mock_get.call_count == 0
@@ -1,5 +1,11 @@
+import time
+from unittest import mock
+
+from canary_tester.enricher_snapshot_store import EnricherSnapshotStore
+from canary_tester.thanos_client import ThanosClient
 from canary_tester.version_enricher import VersionEnricher, VersionEntry
 from canary_tester.types import (
+    GlobalConfig,
     StandardScalarMetric,
 )
 
@@ -9,34 +15,37 @@ class TestGetVersionAtTs:
         version_enricher = VersionEnricher()
         metric = StandardScalarMetric(1, "host1", 0)
 
-        assert version_enricher._get_version_at_ts(metric) == "unknown"
+        assert version_enricher.snapshot.get_version_at_ts(metric) == "unknown"
 
     def test_host_with_only_one_version_present(self):
         version_enricher = VersionEnricher()
         version_enricher._host_to_versions = {
             "host1": [VersionEntry(0, "1.0.0")],
         }
+        version_enricher._publish(0)
         metric = StandardScalarMetric(1, "host1", 0)
 
-        assert version_enricher._get_version_at_ts(metric) == "1.0.0"
+        assert version_enricher.snapshot.get_version_at_ts(metric) == "1.0.0"
 
     def test_host_with_changing_version(self):
         version_enricher = VersionEnricher()
         version_enricher._host_to_versions = {
             "host1": [VersionEntry(0, "1.0.0"), VersionEntry(1, "2.0.0")],
         }
+        version_enricher._publish(0)
         metric = StandardScalarMetric(2, "host1", 0)
 
-        assert version_enricher._get_version_at_ts(metric) == "2.0.0"
+        assert version_enricher.snapshot.get_version_at_ts(metric) == "2.0.0"
 
     def test_host_with_changing_version_metric_between(self):
         version_enricher = VersionEnricher()
         version_enricher._host_to_versions = {
             "host1": [VersionEntry(0, "1.0.0"), VersionEntry(2, "2.0.0")],
         }
+        version_enricher._publish(0)
         metric = StandardScalarMetric(1, "host1", 0)
 
-        assert version_enricher._get_version_at_ts(metric) == "1.0.0"
+        assert version_enricher.snapshot.get_version_at_ts(metric) == "1.0.0"
 
 
 class TestAddVersionToHost:
@@ -88,6 +97,7 @@ class TestGetHostWithChangedVersionInInterval:
         version_enricher._host_to_versions = {
             "host1": [VersionEntry(0, "0.0.0"), VersionEntry(1, "1.0.0")],
         }
+        version_enricher._publish(0)
 
         assert version_enricher.get_host_with_changed_version_in_interval(
             "1.0.0", 0, 2
@@ -98,6 +108,7 @@ class TestGetHostWithChangedVersionInInterval:
         version_enricher._host_to_versions = {
             "host1": [VersionEntry(1, "1.0.0")],
         }
+        version_enricher._publish(0)
 
         assert (
             version_enricher.get_host_with_changed_version_in_interval("1.0.0", 0, 2)
@@ -109,6 +120,7 @@ class TestGetHostWithChangedVersionInInterval:
         version_enricher._host_to_versions = {
             "host1": [VersionEntry(0, "0.0.0"), VersionEntry(2, "1.0.0")],
         }
+        version_enricher._publish(0)
 
         assert (
             version_enricher.get_host_with_changed_version_in_interval("1.0.0", 0, 1)
@@ -120,6 +132,7 @@ class TestGetHostWithChangedVersionInInterval:
         version_enricher._host_to_versions = {
             "host1": [VersionEntry(0, "0.0.0"), VersionEntry(1, "1.0.0")],
         }
+        version_enricher._publish(0)
 
         assert (
             version_enricher.get_host_with_changed_version_in_interval("0.0.0", 0, 2)
@@ -138,3 +151,172 @@ class TestVerionEntryEqual:
         version_entry1 = VersionEntry(1, "1.0.0")
 
         assert version_entry1 != 4
+
+
+class TestSnapshot:
+    def test_published_snapshot_is_not_changed_by_updates(self):
+        version_enricher = VersionEnricher()
+        version_enricher._add_version_to_host("host1", 1, "1.0.0")
+        version_enricher._publish(1)
+        snapshot = version_enricher.snapshot
+
+        version_enricher._add_version_to_host("host1", 2, "2.0.0")
+        version_enricher._add_version_to_host("host2", 2, "2.0.0")
+
+        assert snapshot.timestamp == 1
+        assert snapshot.frequencies == {"1.0.0": 1}
+        assert snapshot.host_to_versions == {"host1": (VersionEntry(1, "1.0.0"),)}
+
+    def test_refresher_publishes_requested_update(self):
+        version_enricher = VersionEnricher()
+
+        def fetch(timestamp):
+            version_enricher._add_version_to_host("host1", timestamp, "1.0.0")
+
+        with mock.patch.object(version_enricher, "_fetch_host_version", fetch):
+            version_enricher.start_refresher()
+            version_enricher.request_update(5)
+            for _ in range(1000):
+                if version_enricher.snapshot.timestamp == 5:
+                    break
+                time.sleep(0.001)
+            version_enricher.stop_refresher()
+
+        assert version_enricher.frequencies == {"1.0.0": 1}
+
+
+class TestCompact:
+    def test_drops_entries_before_the_horizon(self):
+        version_enricher = VersionEnricher(retention_s=10)
+        for ts, version in [(1, "1.0.0"), (2, "2.0.0"), (5, "3.0.0"), (15, "4.0.0")]:
+            version_enricher._add_version_to_host("host1", ts, version)
+
+        version_enricher.compact(16)
+
+        # The entry at 5 holds the version at the horizon 6
+        assert version_enricher._host_to_versions == {
+            "host1": [VersionEntry(5, "3.0.0"), VersionEntry(15, "4.0.0")],
+        }
+        assert version_enricher.size == 2
+
+    def test_expires_hosts_that_disappeared(self):
+        version_enricher = VersionEnricher(GlobalConfig(ENRICHER_HOST_TTL_S=100))
+        version_enricher._add_version_to_host("host1", 0, "1.0.0")
+        version_enricher._add_version_to_host("host2", 0, "1.0.0")
+        version_enricher._add_version_to_host("host2", 150, "1.0.0")
+
+        version_enricher.compact(150)
+
+        assert list(version_enricher._host_to_versions.keys()) == ["host2"]
+
+
+class TestRestore:
+    def test_restores_saved_history(self, tmp_path):
+        saving = VersionEnricher(snapshot_store=EnricherSnapshotStore(str(tmp_path)))
+        saving._add_version_to_host("host1", 1, "1.0.0")
+        saving._add_version_to_host("host1", 2, "2.0.0")
+        saving._publish(2)
+        saving.save()
+
+        version_enricher = VersionEnricher(
+            snapshot_store=EnricherSnapshotStore(str(tmp_path))
+        )
+
+        assert version_enricher.restore(10)
+        assert version_enricher.snapshot.timestamp == 2
+        assert version_enricher.frequencies == {"2.0.0": 1}
+        assert version_enricher._host_to_versions == {
+            "host1": [VersionEntry(1, "1.0.0"), VersionEntry(2, "2.0.0")],
+        }
+
+    def test_update_brings_restored_history_up_to_date(self, tmp_path):
+        saving = VersionEnricher(snapshot_store=EnricherSnapshotStore(str(tmp_path)))
+        saving._add_version_to_host("host1", 1, "1.0.0")
+        saving._publish(1)
+        saving.save()
+        version_enricher = VersionEnricher(
+            snapshot_store=EnricherSnapshotStore(str(tmp_path))
+        )
+
+        def fetch(timestamp):
+            version_enricher._add_version_to_host("host1", timestamp, "2.0.0")
+
+        assert version_enricher.restore(10)
+        with mock.patch.object(version_enricher, "_fetch_host_version", fetch):
+            version_enricher.update(10)
+
+        assert version_enricher.snapshot.timestamp == 10
+        assert version_enricher.frequencies == {"2.0.0": 1}
+        assert version_enricher._host_to_versions == {
+            "host1": [VersionEntry(1, "1.0.0"), VersionEntry(10, "2.0.0")],
+        }
+
+    def test_ignores_snapshot_that_is_too_old(self, tmp_path):
+        saving = VersionEnricher(snapshot_store=EnricherSnapshotStore(str(tmp_path)))
+        saving._add_version_to_host("host1", 1, "1.0.0")
+        saving._publish(1)
+        saving.save()
+
+        version_enricher = VersionEnricher(
+            GlobalConfig(ENRICHER_SNAPSHOT_MAX_AGE_S=100),
+            snapshot_store=EnricherSnapshotStore(str(tmp_path)),
+        )
+
+        assert not version_enricher.restore(200)
+        assert version_enricher.hosts == []
+
+
+class TestHostSharding:
+    def test_discovers_hosts_without_unsharded_version_query(self):
+        version_enricher = VersionEnricher(
+            GlobalConfig(HOST_SHARDS=2, HOST_SHARD_DISCOVERY_INTERVAL=2)
+        )
+        fleet = [f"host{i}" for i in range(6)]
+        queries = []
+
+        def query(params, plan=None, priority=None, deadline=None):
+            queries.append(params["query"])
+            if params["query"] == VersionEnricher._discovery_query:
+                result = [
+                    {"metric": {"host": host}, "value": [1, "1"]} for host in fleet
+                ]
+            else:
+                result = [
+                    {
+                        "metric": {"host": host, "version": "1.0.0"},
+                        "value": [params["time"], "1"],
+                    }
+                    for host in fleet
+                    if host in params["query"]
+                ]
+            return {
+                "status": "success",
+                "data": {"resultType": "vector", "result": result},
+            }
+
+        with mock.patch.object(ThanosClient, "query", side_effect=query):
+            version_enricher.update(1)
+            discovery_queries = list(queries)
+            queries.clear()
+            version_enricher.update(2)
+
+        assert discovery_queries[0] == VersionEnricher._discovery_query
+        assert len(discovery_queries) == 3
+        assert len(queries) == 2
+        assert all("host=~" in query for query in discovery_queries[1:] + queries)
+        assert sorted(version_enricher.hosts) == fleet
+
+
+class TestThanosClient:
+    def test_reuses_the_client_across_updates(self):
+        version_enricher = VersionEnricher()
+        result = {"status": "success", "data": {"resultType": "vector", "result": []}}
+
+        with (
+            mock.patch.object(ThanosClient, "__init__", return_value=None) as init,
+            mock.patch.object(ThanosClient, "query", return_value=result),
+        ):
+            version_enricher.update(1)
+            version_enricher.update(2)
+
+        init.assert_not_called()
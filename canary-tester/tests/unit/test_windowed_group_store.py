@@ -0,0 +1,81 @@
+import pytest
+
+from canary_tester.tester.group_store import WindowedGroupStore
+from canary_tester.tester.test_builder import TestBuilder
+from canary_tester.types import RetentionWindow, VersionEnrichedStandardScalarMetric
+
+
+def _metric(ts, value=None):
+    return VersionEnrichedStandardScalarMetric(
+        ts, "host1", float(ts if value is None else value), "1.0.0"
+    )
+
+
+def _fill(store, timestamps):
+    for ts in timestamps:
+        store.append(_metric(ts))
+    return store
+
+
+class TestSlidingWindow:
+    def test_keeps_last_samples(self):
+        store = _fill(WindowedGroupStore(RetentionWindow.Sliding, samples=3), range(10))
+
+        assert len(store) == 3
+        assert store.bucket() == [7.0, 8.0, 9.0]
+        assert store.last().ts == 9
+
+    def test_keeps_last_seconds(self):
+        store = _fill(
+            WindowedGroupStore(RetentionWindow.Sliding, seconds=60),
+            [0, 30, 60, 90, 100],
+        )
+
+        assert store.bucket() == [60.0, 90.0, 100.0]
+
+    def test_skips_only_the_first_sample_of_the_group(self):
+        store = WindowedGroupStore(RetentionWindow.Sliding, samples=3, skip_first=True)
+
+        _fill(store, [0, 1])
+        assert store.bucket() == [1.0]
+
+        _fill(store, [2, 3])
+        assert store.bucket() == [1.0, 2.0, 3.0]
+
+
+class TestTumblingWindow:
+    def test_starts_over_after_samples(self):
+        store = WindowedGroupStore(RetentionWindow.Tumbling, samples=3)
+
+        _fill(store, [0, 1, 2])
+        assert store.bucket() == [0.0, 1.0, 2.0]
+
+        _fill(store, [3])
+        assert store.bucket() == [3.0]
+
+    def test_starts_over_after_seconds(self):
+        store = _fill(
+            WindowedGroupStore(RetentionWindow.Tumbling, seconds=60),
+            [0, 30, 59, 60, 100, 250],
+        )
+
+        # The windows start at 0, 60 and 240
+        assert store.bucket() == [250.0]
+        assert store.last().ts == 250
+
+    def test_needs_a_window_size(self):
+        with pytest.raises(ValueError):
+            WindowedGroupStore(RetentionWindow.Tumbling)
+
+
+class TestRetentionConfig:
+    def test_rejects_sketches_and_msprt(self):
+        for test_config in (
+            {"retention": "Sliding", "group_store": "KLL"},
+            {"retention": "Sliding", "statistic_test": "MSPRT"},
+        ):
+            test_config["type_arrival"] = "PredictableArrival"
+            with pytest.raises(ValueError):
+                TestBuilder._verify_retention(
+                    TestBuilder._select_statistic_test(test_config), test_config
+                )